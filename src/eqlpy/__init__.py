@@ -0,0 +1,61 @@
+import importlib
+
+# The top-level package loads its attributes on first use (PEP 562), so that
+#
+#   import eqlpy
+#   eqlpy.EqlText("Alice", "customers", "name").to_db_format()
+#
+# only imports the value types, and never Django, SQLAlchemy or psycopg.
+# The integrations are available as eqlpy.eqldjango, eqlpy.eqlalchemy and
+# eqlpy.eqlpsycopg, and are imported when first accessed. They are left out
+# of __all__ so that "from eqlpy import *" doesn't import them all.
+
+_attributes = {
+    "EqlValue": "eql_types",
+    "EqlInt": "eql_types",
+    "EqlBool": "eql_types",
+    "EqlDate": "eql_types",
+    "EqlFloat": "eql_types",
+    "EqlText": "eql_types",
+    "EqlJsonb": "eql_types",
+    "EqlRow": "eql_types",
+    "add_codec_hook": "eql_types",
+    "remove_codec_hook": "eql_types",
+    "codec_hook": "eql_types",
+    "EqlResultCache": "cache",
+}
+
+_submodules = {
+    "backfill",
+    "bench",
+    "cache",
+    "eql_codec",
+    "eql_config",
+    "eql_standin",
+    "eql_types",
+    "eqlalchemy",
+    "eqldjango",
+    "eqlpsycopg",
+    "explain",
+    "keyset",
+    "pytest_plugin",
+    "query",
+}
+
+__all__ = sorted(_attributes)
+
+
+def __getattr__(name):
+    if name in _attributes:
+        module = importlib.import_module(f"{__name__}.{_attributes[name]}")
+        value = getattr(module, name)
+    elif name in _submodules:
+        value = importlib.import_module(f"{__name__}.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_attributes) | _submodules)
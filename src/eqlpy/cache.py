@@ -0,0 +1,115 @@
+import json
+import time
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from threading import Lock
+
+# In-process cache of decoded query results, for reference data (such as
+# countries or plans) that is read far more often than it's written, so
+# repeated lookups don't go through CipherStash Proxy and get decrypted
+# each time.
+#
+# Results are keyed by the query's SQL and its parameters (the encoded EQL
+# terms), and expire after ttl seconds. The least recently used results are
+# evicted beyond maxsize entries, and results with more than max_rows rows
+# aren't cached. Writes to a table invalidate the results read from it:
+#
+#   cache = EqlResultCache(maxsize=1024, ttl=60)
+#
+#   # Django
+#   invalidate_on_signals(cache)
+#   Country.objects.filter(code__eq="NZ").cached(cache)
+#
+#   # SQLAlchemy
+#   invalidate_on_flush(cache)
+#   cached_execute(session, select(Country).where(...), cache)
+#
+# Cached results are shared between callers and must not be modified.
+# Writes that bypass the invalidation hooks (such as raw SQL or
+# QuerySet.update()) need cache.invalidate(table), or are seen after ttl.
+# The hooks run when a write is sent, before it commits, so they invalidate
+# again after the transaction commits (or, for SQLAlchemy, rolls back), and
+# results read by the writing transaction itself aren't cached. Writes
+# committed by other processes are only seen after ttl.
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "size", "maxsize"])
+
+
+def make_key(source, sql, params):
+    return (source, sql, json.dumps(list(params), sort_keys=True, default=str))
+
+
+class EqlResultCache:
+    def __init__(self, maxsize=1024, ttl=60.0, max_rows=1000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires, tables, rows), least recently used first
+        self._entries = OrderedDict()
+        self._keys = defaultdict(set)
+        # bumped by invalidate(), so that results loaded while a table was
+        # written to aren't stored
+        self._generations = Counter()
+        self._epoch = 0
+        self._lock = Lock()
+
+    def get_or_load(self, key, tables, load):
+        # Cached rows for key, or the rows returned by load(), which are
+        # cached for tables
+        tables = frozenset(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, _, rows = entry
+                if expires > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(rows)
+                self._remove(key)
+            self.misses += 1
+            generation = self._generation(tables)
+        rows = list(load())
+        with self._lock:
+            if len(rows) <= self.max_rows and generation == self._generation(tables):
+                self._store(key, tables, rows)
+        return rows
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] += 1
+                for key in self._keys.pop(table, ()):
+                    if key in self._entries:
+                        self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._keys.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, len(self._entries), self.maxsize)
+
+    def _generation(self, tables):
+        return (self._epoch, [self._generations[table] for table in sorted(tables)])
+
+    def _store(self, key, tables, rows):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl, tables, tuple(rows))
+        for table in tables:
+            self._keys[table].add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._keys.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys[table]
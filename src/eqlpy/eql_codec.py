@@ -0,0 +1,174 @@
+from datetime import datetime
+from functools import lru_cache
+import json
+
+# Encoding and decoding of EQL plaintext payloads, shared by eql_types,
+# eqlalchemy and eqldjango.
+# Types are named after EQL's cast_as types (as used in cs_add_index_v1).
+#
+# A payload looks like:
+#
+#   {"k": "pt", "p": "<plaintext>", "i": {"t": "<table>", "c": "<column>"}, "v": 1, "q": null}
+#
+# where "p" is the value converted to a string by the type's plaintext encoder.
+
+
+def _encode_boolean(value):
+    # Accepts booleans, and the strings "true" and "false" in any case
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        plaintext = value.lower()
+        if plaintext in ("true", "false"):
+            return plaintext
+        raise ValueError(f"invalid boolean: {value!r}")
+    raise TypeError(f"expected a boolean, got {type(value).__name__}")
+
+
+def _decode_boolean(s):
+    return s.lower() == "true"
+
+
+def _encode_date(value):
+    return value.isoformat()
+
+
+def _decode_date(s):
+    return datetime.fromisoformat(s).date()
+
+
+def _identity(s):
+    return s
+
+
+plaintext_encoders = {
+    "int": str,
+    "boolean": _encode_boolean,
+    "date": _encode_date,
+    "double": str,
+    "text": str,
+    "jsonb": json.dumps,
+}
+
+plaintext_decoders = {
+    "int": int,
+    "boolean": _decode_boolean,
+    "date": _decode_date,
+    "double": float,
+    "text": _identity,
+    "jsonb": json.loads,
+}
+
+
+def payload(plaintext, table, column, query_type=None):
+    return {
+        "k": "pt",
+        "p": plaintext,
+        "i": {"t": table, "c": column},
+        "v": 1,
+        "q": query_type,
+    }
+
+
+def encoder(eql_type, table, column, query_type=None):
+    encode_plaintext = plaintext_encoders[eql_type]
+
+    def encode(value):
+        if value is None:
+            return None
+        return payload(encode_plaintext(value), table, column, query_type)
+
+    return encode
+
+
+def _value_decoder(decode_plaintext):
+    loads = json.loads
+
+    def decode(value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = loads(value)
+        return decode_plaintext(value["p"])
+
+    return decode
+
+
+def _batch_decoder(decode_plaintext):
+    loads = json.loads
+
+    def decode_many(values):
+        return [
+            (
+                None
+                if v is None
+                else decode_plaintext((loads(v) if isinstance(v, str) else v)["p"])
+            )
+            for v in values
+        ]
+
+    return decode_many
+
+
+# Decoders from a payload (parsed dict or JSON string) to a Python value
+value_decoders = {t: _value_decoder(d) for t, d in plaintext_decoders.items()}
+
+# Same as value_decoders, but for a list of payloads (eg. a fetched column)
+batch_decoders = {t: _batch_decoder(d) for t, d in plaintext_decoders.items()}
+
+
+def match_terms(table, column, terms):
+    # match query terms for searching column for each of terms, as JSON
+    encode = encoder("text", table, column, "match")
+    dumps = json.dumps
+    return [dumps(encode(term)) for term in terms]
+
+
+# Unique terms
+# cs_unique_v1 terms are a hash of the plaintext after the unique index's
+# token filters, so values with the same unique_key() have the same term, and
+# conflict with each other in an upsert. None has no term and never conflicts.
+
+token_filter_functions = {"downcase": str.lower, "upcase": str.upper}
+
+
+def unique_key(eql_type, value, filters=()):
+    # filters are the index's token_filters, eg. [{"kind": "downcase"}]
+    if value is None:
+        return None
+    key = plaintext_encoders[eql_type](value)
+    for token_filter in filters:
+        kind = token_filter.get("kind")
+        if kind not in token_filter_functions:
+            raise ValueError(f"Unsupported token filter for unique index: {kind!r}")
+        key = token_filter_functions[kind](key)
+    return key
+
+
+# Extracting fields from encrypted JSONB documents.
+# cs_ste_vec_value_v1(column, selector) takes a selector term: a payload with
+# the JSON path as plaintext and query type "ejson_path". Selector terms only
+# depend on the path, table and column, so they are encoded once and cached.
+
+
+@lru_cache(maxsize=1024)
+def selector_term(path, table, column):
+    return json.dumps(payload(path, str(table), str(column), "ejson_path"))
+
+
+def decode_extracted(rows, paths, columns=()):
+    # rows of (*columns, one extracted value per path) -> [{column or path: value}],
+    # decoding each path's values in one pass
+    rows = [tuple(row) for row in rows]
+    offset = len(columns)
+    extracted = [
+        batch_decoders["jsonb"]([row[offset + i] for row in rows])
+        for i in range(len(paths))
+    ]
+    results = []
+    for n, row in enumerate(rows):
+        result = dict(zip(columns, row[:offset]))
+        for path, values in zip(paths, extracted):
+            result[path] = values[n]
+        results.append(result)
+    return results
@@ -0,0 +1,110 @@
+import json
+
+# Which EQL indexes each encrypted column has.
+#
+# Equality can go through the unique index (cs_unique_v1, a hash) or the
+# ore index (cs_ore_64_8_v1, much more expensive). eqlalchemy, eqldjango and
+# eqlpsycopg use equality_index() to pick the cheapest one a column has,
+# from indexes declared in code or, failing that, from the encrypt config
+# loaded with load_config():
+#
+#   with conn.cursor() as cur:
+#       load_config(cur)
+#
+# Columns with neither are assumed to have a unique index if they are text,
+# and an ore index otherwise.
+
+# Indexes that support equality, cheapest first
+EQUALITY_INDEXES = ("unique", "ore")
+
+
+class EqlConfig:
+    def __init__(self, tables=None, options=None):
+        # {table: {column: frozenset of index types}}
+        self.tables = tables or {}
+        # {(table, column, index type): index options}, eg. token_filters
+        self.options = options or {}
+
+    @classmethod
+    def from_data(cls, data):
+        # data is the "data" of a cs_configuration_v1 row, eg.
+        # {"v": 1, "tables": {"customers": {"name": {"cast_as": "text", "indexes": {"unique": {}}}}}}
+        if isinstance(data, str):
+            data = json.loads(data)
+        tables = ((data or {}).get("tables") or {}).items()
+        return cls(
+            {
+                table: {
+                    column: frozenset((config or {}).get("indexes") or {})
+                    for column, config in columns.items()
+                }
+                for table, columns in tables
+            },
+            {
+                (table, column, index): options
+                for table, columns in tables
+                for column, config in columns.items()
+                for index, options in ((config or {}).get("indexes") or {}).items()
+                if options
+            },
+        )
+
+    @classmethod
+    def load(cls, cursor, state="active"):
+        cursor.execute(
+            "SELECT data FROM cs_configuration_v1 WHERE state = %s ORDER BY id DESC LIMIT 1",
+            (state,),
+        )
+        row = cursor.fetchone()
+        return cls.from_data(row[0] if row else None)
+
+    def indexes(self, table, column):
+        # None if the column is not in the config
+        return self.tables.get(str(table), {}).get(str(column))
+
+    def index_options(self, table, column, index):
+        return self.options.get((str(table), str(column), index), {})
+
+    def declare(self, table, column, indexes):
+        # indexes are index types, or {index type: options}
+        self.tables.setdefault(str(table), {})[str(column)] = frozenset(indexes)
+        if isinstance(indexes, dict):
+            for index, options in indexes.items():
+                if options:
+                    self.options[(str(table), str(column), index)] = options
+
+
+_config = EqlConfig()
+
+
+def get_config():
+    return _config
+
+
+def set_config(config):
+    global _config
+    _config = config
+    return config
+
+
+def load_config(cursor, state="active"):
+    return set_config(EqlConfig.load(cursor, state))
+
+
+def default_equality_index(eql_type):
+    return "unique" if eql_type == "text" else "ore"
+
+
+def token_filters(table, column, index="unique"):
+    # Token filters of a column's index in the loaded config, eg. [{"kind": "downcase"}]
+    return _config.index_options(table, column, index).get("token_filters") or ()
+
+
+def equality_index(eql_type, table, column, indexes=None):
+    # indexes declared in code take precedence over the loaded config
+    if not indexes:
+        indexes = _config.indexes(table, column)
+    for index in EQUALITY_INDEXES:
+        if indexes and index in indexes:
+            return index
+    return default_equality_index(eql_type)
@@ -0,0 +1,220 @@
+import sys
+
+# A stand-in for EQL and CipherStash Proxy, for running the integration tests and
+# benchmarks against a plain PostgreSQL database (no proxy, no network to ZeroKMS).
+#
+# It defines the cs_* functions used by eqlpy with plaintext semantics, working
+# directly on the payloads eqlpy sends ({"k": "pt", "p": ..., ...}), which are
+# stored as they are. Nothing is encrypted, so never use it with real data.
+#
+# Install it with:
+#
+#   python -m eqlpy.eql_standin | psql -h localhost -p 5432 -U postgres eqlpy_test
+#
+# or from Python with install(cursor).
+#
+# Differences from EQL worth knowing about:
+# - cs_match_v1 is a set of lowercased trigrams, so terms shorter than 3
+#   characters only match values that are exactly that term
+# - cs_ore_64_8_v1 orders numeric-looking plaintexts numerically and anything
+#   else as text (ISO dates and "false" < "true" sort correctly as text)
+# - cs_add_index_v1 and friends update an "active" row in cs_configuration_v1
+#   straight away; cs_encrypt_v1 and cs_activate_v1 do nothing
+
+STANDIN_SQL = r"""
+DO $$
+BEGIN
+  CREATE DOMAIN cs_encrypted_v1 AS jsonb;
+EXCEPTION
+  WHEN duplicate_object THEN NULL;
+END
+$$;
+
+DO $$
+BEGIN
+  CREATE DOMAIN cs_unique_index_v1 AS text;
+EXCEPTION
+  WHEN duplicate_object THEN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_unique_index_eq_v1(a cs_unique_index_v1, b cs_unique_index_v1) RETURNS boolean
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT a::text = b::text
+$$;
+
+DO $$
+BEGIN
+  CREATE OPERATOR == (
+    FUNCTION = cs_unique_index_eq_v1,
+    LEFTARG = cs_unique_index_v1,
+    RIGHTARG = cs_unique_index_v1
+  );
+EXCEPTION
+  WHEN duplicate_function THEN NULL;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS cs_configuration_v1 (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  state text NOT NULL DEFAULT 'active',
+  data jsonb NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION cs_unique_v1(val jsonb) RETURNS cs_unique_index_v1
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT val->>'p'
+$$;
+
+CREATE OR REPLACE FUNCTION cs_match_v1(val jsonb) RETURNS text[]
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT CASE
+    WHEN length(t) < 3 THEN ARRAY[t]
+    ELSE ARRAY(SELECT DISTINCT substr(t, i, 3) FROM generate_series(1, length(t) - 2) AS i)
+  END
+  FROM lower(val->>'p') AS t
+$$;
+
+CREATE OR REPLACE FUNCTION cs_ore_64_8_v1(val jsonb) RETURNS jsonb
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT CASE
+    WHEN val->>'p' ~ '^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$' THEN to_jsonb((val->>'p')::numeric)
+    ELSE to_jsonb(val->>'p')
+  END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_ste_vec_v1(val jsonb) RETURNS jsonb
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT (val->>'p')::jsonb
+$$;
+
+CREATE OR REPLACE FUNCTION cs_ste_vec_term_v1(val jsonb) RETURNS jsonb
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT (val->>'p')::jsonb
+$$;
+
+CREATE OR REPLACE FUNCTION cs_ste_vec_term_v1(val jsonb, selector jsonb) RETURNS jsonb
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT jsonb_path_query_first((val->>'p')::jsonb, (selector->>'p')::jsonpath)
+$$;
+
+CREATE OR REPLACE FUNCTION cs_ste_vec_value_v1(val jsonb, selector jsonb) RETURNS jsonb
+  IMMUTABLE STRICT PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT CASE
+    WHEN extracted IS NULL THEN NULL
+    ELSE jsonb_build_object('k', 'pt', 'p', extracted::text, 'i', val->'i', 'v', 1, 'q', NULL)
+  END
+  FROM jsonb_path_query_first((val->>'p')::jsonb, (selector->>'p')::jsonpath) AS extracted
+$$;
+
+CREATE OR REPLACE FUNCTION cs_grouped_value_v1_sfunc(state jsonb, val jsonb) RETURNS jsonb
+  IMMUTABLE PARALLEL SAFE LANGUAGE sql
+AS $$
+  SELECT coalesce(state, val)
+$$;
+
+CREATE OR REPLACE AGGREGATE cs_grouped_value_v1(jsonb) (
+  SFUNC = cs_grouped_value_v1_sfunc,
+  STYPE = jsonb
+);
+
+CREATE OR REPLACE FUNCTION cs_standin_config_v1() RETURNS jsonb
+  STABLE LANGUAGE sql
+AS $$
+  SELECT coalesce(
+    (SELECT data FROM cs_configuration_v1 WHERE state = 'active' ORDER BY id DESC LIMIT 1),
+    '{"v": 1, "tables": {}}'::jsonb
+  )
+$$;
+
+CREATE OR REPLACE FUNCTION cs_standin_save_config_v1(config jsonb) RETURNS jsonb
+  LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE cs_configuration_v1 SET data = config WHERE state = 'active';
+  IF NOT FOUND THEN
+    INSERT INTO cs_configuration_v1 (state, data) VALUES ('active', config);
+  END IF;
+  RETURN config;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_add_column_v1(table_name text, column_name text) RETURNS jsonb
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  config jsonb := cs_standin_config_v1();
+BEGIN
+  IF NOT config->'tables' ? table_name THEN
+    config := jsonb_set(config, ARRAY['tables', table_name], '{}');
+  END IF;
+  IF NOT config->'tables'->table_name ? column_name THEN
+    config := jsonb_set(
+      config, ARRAY['tables', table_name, column_name], '{"cast_as": "text", "indexes": {}}'
+    );
+  END IF;
+  RETURN cs_standin_save_config_v1(config);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_add_index_v1(
+  table_name text, column_name text, index_name text, cast_as text DEFAULT 'text', opts jsonb DEFAULT '{}'
+) RETURNS jsonb
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  config jsonb := cs_add_column_v1(table_name, column_name);
+BEGIN
+  config := jsonb_set(config, ARRAY['tables', table_name, column_name, 'cast_as'], to_jsonb(cast_as));
+  config := jsonb_set(config, ARRAY['tables', table_name, column_name, 'indexes', index_name], opts);
+  RETURN cs_standin_save_config_v1(config);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_remove_index_v1(table_name text, column_name text, index_name text) RETURNS jsonb
+  LANGUAGE sql
+AS $$
+  SELECT cs_standin_save_config_v1(
+    cs_standin_config_v1() #- ARRAY['tables', table_name, column_name, 'indexes', index_name]
+  )
+$$;
+
+CREATE OR REPLACE FUNCTION cs_encrypt_v1(force boolean DEFAULT false) RETURNS boolean
+  LANGUAGE sql
+AS $$
+  SELECT true
+$$;
+
+CREATE OR REPLACE FUNCTION cs_activate_v1() RETURNS void
+  LANGUAGE plpgsql
+AS $$
+BEGIN
+  NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION cs_refresh_encrypt_config() RETURNS void
+  LANGUAGE plpgsql
+AS $$
+BEGIN
+  NULL;
+END
+$$;
+"""
+
+
+def install(cursor):
+    cursor.execute(STANDIN_SQL)
+
+
+if __name__ == "__main__":
+    sys.stdout.write(STANDIN_SQL)
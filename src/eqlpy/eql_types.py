@@ -1,83 +1,155 @@
-from datetime import datetime
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 import json
+import threading
+from eqlpy.eql_codec import payload, plaintext_decoders, plaintext_encoders
+
+# Tracing hooks
+# A codec hook is called around each encode (EqlValue.to_db_format) and decode
+# (EqlValue.from_parsed_json, and whole rows in EqlRow) with the operation
+# ("encode", "decode" or "decode_row") and a dict of attributes, and returns a
+# context manager, eg. a tracer span:
+#
+#   def eql_span(operation, attributes):
+#       return tracer.start_as_current_span(f"eql.{operation}", attributes=attributes)
+#
+#   add_codec_hook(eql_span)
+#
+# Attributes are eql.type, eql.table, eql.column and eql.query_type (eql.columns
+# for decode_row). With no hooks, encoding and decoding only check two empty
+# tuples (see python -m eqlpy.bench --codec for the overhead).
+#
+# add_codec_hook() registers a hook for the whole process (every thread and
+# asyncio task), so call it once at startup. codec_hook() adds one only for
+# the current thread or asyncio task (and the tasks it starts), for the
+# duration of a with block. Adding a hook twice runs it twice, and
+# remove_codec_hook() removes one of those copies.
+
+_codec_hooks = ()
+_codec_hooks_lock = threading.Lock()
+_scoped_codec_hooks = ContextVar("eql_codec_hooks", default=())
+
+
+def add_codec_hook(hook):
+    global _codec_hooks
+    with _codec_hooks_lock:
+        _codec_hooks = _codec_hooks + (hook,)
+
+
+def remove_codec_hook(hook):
+    global _codec_hooks
+    with _codec_hooks_lock:
+        hooks = list(_codec_hooks)
+        if hook in hooks:
+            hooks.remove(hook)
+            _codec_hooks = tuple(hooks)
+
+
+@contextmanager
+def codec_hook(hook):
+    token = _scoped_codec_hooks.set(_scoped_codec_hooks.get() + (hook,))
+    try:
+        yield hook
+    finally:
+        _scoped_codec_hooks.reset(token)
+
+
+def _active_hooks():
+    scoped = _scoped_codec_hooks.get()
+    return _codec_hooks + scoped if scoped else _codec_hooks
+
+
+def _traced(hooks, operation, attributes, function, *args):
+    if len(hooks) == 1:
+        with hooks[0](operation, attributes):
+            return function(*args)
+    with ExitStack() as stack:
+        for hook in hooks:
+            stack.enter_context(hook(operation, attributes))
+        return function(*args)
 
 
 class EqlValue:
+    eql_type = None
+
     def __init__(self, v, t: str, c: str):
         self.value = v
         self.table = t
         self.column = c
 
     def to_db_format(self, query_type=None):
-        data = {
-            "k": "pt",
-            "p": self._value_in_db_format(query_type),
-            "i": {"t": str(self.table), "c": str(self.column)},
-            "v": 1,
-            "q": query_type,
-        }
+        hooks = _active_hooks()
+        if hooks:
+            attributes = {
+                "eql.type": self.eql_type,
+                "eql.table": str(self.table),
+                "eql.column": str(self.column),
+                "eql.query_type": query_type,
+            }
+            return _traced(hooks, "encode", attributes, self._to_db_format, query_type)
+        return self._to_db_format(query_type)
+
+    def _to_db_format(self, query_type):
+        data = payload(
+            self._value_in_db_format(query_type),
+            str(self.table),
+            str(self.column),
+            query_type,
+        )
         return json.dumps(data)
 
+    def _value_in_db_format(self, query_type):
+        return plaintext_encoders[self.eql_type](self.value)
+
+    @classmethod
+    def _value_from_db_format(cls, s: str):
+        return plaintext_decoders[cls.eql_type](s)
+
     @classmethod
     def from_parsed_json(cls, parsed):
+        hooks = _active_hooks()
+        if hooks:
+            ident = parsed.get("i") or {}
+            attributes = {
+                "eql.type": cls.eql_type,
+                "eql.table": ident.get("t"),
+                "eql.column": ident.get("c"),
+                "eql.query_type": parsed.get("q"),
+            }
+            return _traced(
+                hooks, "decode", attributes, cls._value_from_db_format, parsed["p"]
+            )
         return cls._value_from_db_format(parsed["p"])
 
 
 class EqlInt(EqlValue):
-    def _value_in_db_format(self, query_type):
-        return str(self.value)
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return int(s)
+    eql_type = "int"
 
 
 class EqlBool(EqlValue):
-    def _value_in_db_format(self, query_type):
-        return str(self.value).lower()
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return s.lower() == "true"
+    eql_type = "boolean"
 
 
 class EqlDate(EqlValue):
-    def _value_in_db_format(self, query_type):
-        return self.value.isoformat()
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return datetime.fromisoformat(s).date()
+    eql_type = "date"
 
 
 class EqlFloat(EqlValue):
-    def _value_in_db_format(self, query_type):
-        return str(self.value)
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return float(s)
+    eql_type = "double"
 
 
 class EqlText(EqlValue):
-    def _value_in_db_format(self, query_type):
-        return self.value
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return s
+    eql_type = "text"
 
 
 class EqlJsonb(EqlValue):
+    eql_type = "jsonb"
+
     def _value_in_db_format(self, query_type):
         if query_type == "ejson_path":
             return self.value
         else:
-            return json.dumps(self.value)
-
-    @classmethod
-    def _value_from_db_format(cls, s: str):
-        return json.loads(s)
+            return super()._value_in_db_format(query_type)
 
 
 class EqlRow:
@@ -86,6 +158,16 @@ class EqlRow:
         return x
 
     def __init__(self, column_function_map, row):
+        hooks = _active_hooks()
+        if hooks:
+            attributes = {"eql.columns": len(column_function_map)}
+            _traced(
+                hooks, "decode_row", attributes, self._decode, column_function_map, row
+            )
+        else:
+            self._decode(column_function_map, row)
+
+    def _decode(self, column_function_map, row):
         self.row = {}
         for k, v in row.items():
             if v == None:
@@ -1,96 +1,366 @@
-from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.types import TypeDecorator, String
+from sqlalchemy import (
+    Index,
+    Integer,
+    and_,
+    cast,
+    event,
+    func,
+    inspect,
+    literal,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.orm import DeclarativeBase, Session, join, object_mapper
+from sqlalchemy.types import NullType, TypeDecorator, String
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import FunctionElement
-from functools import wraps
-from datetime import date
+from sqlalchemy.sql.type_api import to_instance
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.sql.visitors import InternalTraversal
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce, wraps
+from threading import Event, Lock, Thread
+from time import perf_counter
 import json
+import re
+from eqlpy.eql_codec import (
+    decode_extracted,
+    match_terms,
+    payload,
+    plaintext_encoders,
+    selector_term,
+    unique_key,
+    value_decoders,
+)
+from eqlpy.eql_config import equality_index, token_filters
+from eqlpy.cache import make_key
+from eqlpy.keyset import decode_token, page
+
+# Instrumentation
+# instrument(engine) records EQL traffic per statement shape (the SQL sent to
+# the database, with placeholders) into an EqlEngineStats:
+#
+#   stats = instrument(engine)
+#   ...
+#   stats.snapshot()
+#   # {"SELECT ... WHERE cs_match_v1(customers.name) @> cs_match_v1(%(param_1)s)":
+#   #   {"functions": ["cs_match_v1"], "executions": 3, "encrypted_binds": 3, ...}}
+#
+# For each statement it keeps the cs_* functions used, the number of
+# encrypted binds (EQL payloads, including query terms) and their size,
+# encode and decode counts and times of the encrypted types, and the time
+# spent in the database (including the round trip through CipherStash Proxy).
+# Rows are decoded as they are fetched, after the statement has run, so
+# decoding is counted for the last statement executed on the same engine in
+# the current context.
+#
+# stats.export(sink, interval=60) passes snapshots (reset after each one) to
+# sink periodically, from a background thread.
+# Values are only recorded for engines that are still instrumented. Other
+# engines only pay for one ContextVar lookup per value.
+
+# The statement being executed, from before_execute to after_cursor_execute
+_eql_execution = ContextVar("eql_execution", default=None)
+# The last statement executed, which fetched rows are decoded for
+_eql_fetch = ContextVar("eql_fetch", default=None)
+
+_CS_FUNCTION = re.compile(r"\b(cs_\w+)\(")
+
+_EQL_PAYLOAD_PREFIX = '{"k": "pt"'
+
+
+class EqlStatementStats:
+    def __init__(self, statement):
+        self.functions = sorted(set(_CS_FUNCTION.findall(statement)))
+        self.executions = 0
+        self.encrypted_binds = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.encodes = 0
+        self.encode_time = 0.0
+        self.decodes = 0
+        self.decode_time = 0.0
+        self.latency = 0.0
+
+    def summary(self):
+        return {
+            "functions": self.functions,
+            "executions": self.executions,
+            "encrypted_binds": self.encrypted_binds,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "encodes": self.encodes,
+            "encode_time": self.encode_time,
+            "decodes": self.decodes,
+            "decode_time": self.decode_time,
+            "latency": self.latency,
+        }
+
+
+class _EqlExecution:
+    # Encodes of the statement being executed on dialect's engine, and the
+    # statement that rows are decoded for
+    def __init__(self, stats, dialect):
+        self.stats = stats
+        self.dialect = dialect
+        self.statement = None
+        self.encodes = 0
+        self.encode_time = 0.0
+        self.start = None
+        self.token = None
+
+    def recording(self, dialect):
+        return dialect is self.dialect and dialect in self.stats._dialects
+
+    def encoded(self, elapsed):
+        self.encodes += 1
+        self.encode_time += elapsed
+
+    def finish(self):
+        if self.token is not None:
+            token, self.token = self.token, None
+            try:
+                _eql_execution.reset(token)
+            except ValueError:
+                # finished in another context than it started in
+                pass
+
+
+class EqlEngineStats:
+    def __init__(self):
+        self.statements = {}
+        self._lock = Lock()
+        self._listeners = []
+        self._dialects = set()
+
+    def _statement(self, statement):
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = EqlStatementStats(statement)
+        return stats
+
+    def executed(self, statement, parameters, execution, latency, many=False):
+        binds, size = _eql_binds(parameters, many)
+        with self._lock:
+            stats = self._statement(statement)
+            stats.executions += 1
+            stats.latency += latency
+            stats.encrypted_binds += binds
+            stats.bytes_sent += size
+            stats.encodes += execution.encodes
+            stats.encode_time += execution.encode_time
+        execution.encodes = 0
+        execution.encode_time = 0.0
+
+    def decoded(self, statement, elapsed, value):
+        with self._lock:
+            stats = self._statement(statement)
+            stats.decodes += 1
+            stats.decode_time += elapsed
+            stats.bytes_received += (
+                len(value) if isinstance(value, str) else len(json.dumps(value))
+            )
+
+    def snapshot(self, reset=False):
+        # {statement: summary}
+        with self._lock:
+            statements = self.statements
+            if reset:
+                self.statements = {}
+            return {
+                statement: stats.summary() for statement, stats in statements.items()
+            }
+
+    def export(self, sink, interval=60.0):
+        return EqlSnapshotExporter(self, sink, interval).start()
+
+    # Engine event listeners, added by instrument()
+
+    def _start(self, conn):
+        execution = _EqlExecution(self, conn.dialect)
+        execution.token = _eql_execution.set(execution)
+        return execution
+
+    def _current(self):
+        execution = _eql_execution.get()
+        if execution is None or execution.stats is not self:
+            return None
+        return execution
+
+    def _before_execute(self, conn, clauseelement, multiparams, params, options):
+        self._start(conn)
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, many
+    ):
+        execution = self._current() or self._start(conn)
+        execution.statement = statement
+        execution.start = perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, many):
+        execution = self._current()
+        if execution is None:
+            return
+        if execution.start is not None:
+            latency = perf_counter() - execution.start
+            execution.start = None
+            self.executed(statement, parameters, execution, latency, many)
+        execution.finish()
+        _eql_fetch.set(execution)
+
+    def _handle_error(self, context):
+        execution = self._current()
+        if execution is not None:
+            execution.finish()
+
+
+class EqlSnapshotExporter:
+    # Passes stats.snapshot(reset=True) to sink every interval seconds, and
+    # once more when stopped. Empty snapshots are skipped.
+    def __init__(self, stats, sink, interval=60.0):
+        self.stats = stats
+        self.sink = sink
+        self.interval = interval
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name="eqlpy-snapshots", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.export()
+
+    def export(self):
+        snapshot = self.stats.snapshot(reset=True)
+        if snapshot:
+            self.sink(snapshot)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.export()
+
+
+def _eql_binds(parameters, many=False):
+    # Number and total size of the EQL payloads in a statement's parameters
+    # (a sequence of them for executemany)
+    if many:
+        counts = [_eql_binds(p) for p in parameters]
+        return sum(n for n, _ in counts), sum(size for _, size in counts)
+    values = parameters.values() if isinstance(parameters, dict) else parameters or ()
+    payloads = [
+        len(v)
+        for v in values
+        if isinstance(v, str) and v.startswith(_EQL_PAYLOAD_PREFIX)
+    ]
+    return len(payloads), sum(payloads)
+
+
+def instrument(engine, stats=None):
+    # Records EQL traffic on engine (an Engine or AsyncEngine) into stats, a
+    # new EqlEngineStats by default, which is returned
+    engine = getattr(engine, "sync_engine", engine)
+    stats = stats or EqlEngineStats()
+    for name in (
+        "before_execute",
+        "before_cursor_execute",
+        "after_cursor_execute",
+        "handle_error",
+    ):
+        listener = getattr(stats, f"_{name}")
+        event.listen(engine, name, listener)
+        stats._listeners.append((engine, name, listener))
+    stats._dialects.add(engine.dialect)
+    return stats
+
+
+def uninstrument(stats):
+    # Stops recording into stats
+    for engine, name, listener in stats._listeners:
+        event.remove(engine, name, listener)
+    stats._listeners = []
+    stats._dialects = set()
 
 
 class EqlTypeDecorator(TypeDecorator):
-    def __init__(self, table, column):
+    eql_type = "text"
+
+    def __init__(self, table, column, indexes=None):
         super().__init__()
         self.table = table
         self.column = column
+        self.indexes = tuple(indexes) if indexes else None
 
     def process_bind_param(self, value, dialect):
-        if value is not None:
-            value_dict = {
-                "k": "pt",
-                "p": str(value),
-                "i": {"t": self.table, "c": self.column},
-                "v": 1,
-                "q": None,
-            }
-            value = json.dumps(value_dict)
+        if value is None:
+            return value
+        execution = _eql_execution.get()
+        if execution is None or not execution.recording(dialect):
+            return self.term(value)
+        start = perf_counter()
+        value = self.term(value)
+        execution.encoded(perf_counter() - start)
         return value
 
     def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return value["p"]
+        execution = _eql_fetch.get()
+        if value is None or execution is None or not execution.recording(dialect):
+            return value_decoders[self.eql_type](value)
+        start = perf_counter()
+        decoded = value_decoders[self.eql_type](value)
+        execution.stats.decoded(execution.statement, perf_counter() - start, value)
+        return decoded
+
+    def equality_index(self):
+        # "unique" or "ore", from indexes or the loaded encrypt config
+        return equality_index(self.eql_type, self.table, self.column, self.indexes)
+
+    def term(self, value, query_type=None):
+        return json.dumps(
+            payload(
+                plaintext_encoders[self.eql_type](value),
+                self.table,
+                self.column,
+                query_type,
+            )
+        )
 
 
 class EncryptedInt(EqlTypeDecorator):
     impl = String
-
-    def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return int(value["p"])
+    eql_type = "int"
 
 
 class EncryptedBoolean(EqlTypeDecorator):
     impl = String
-
-    def process_bind_param(self, value, dialect):
-        if value is not None:
-            value = str(value).lower()
-        return super().process_bind_param(value, dialect)
-
-    def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return value["p"] == "true"
+    eql_type = "boolean"
 
 
 class EncryptedDate(EqlTypeDecorator):
     impl = String
-
-    def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return date.fromisoformat(value["p"])
+    eql_type = "date"
 
 
 class EncryptedFloat(EqlTypeDecorator):
     impl = String
     cache_ok = True
-
-    def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return float(value["p"])
+    eql_type = "double"
 
 
 class EncryptedUtf8Str(EqlTypeDecorator):
     impl = String
     cache_ok = True
+    eql_type = "text"
 
 
 class EncryptedJsonb(EqlTypeDecorator):
     impl = String
     cache_ok = True
-
-    def process_bind_param(self, value, dialect):
-        if value is not None:
-            value = json.dumps(value)
-        return super().process_bind_param(value, dialect)
-
-    def process_result_value(self, value, dialect):
-        if value is None:
-            return None
-        return json.loads(value["p"])
+    eql_type = "jsonb"
 
 
 class BaseModel(DeclarativeBase):
@@ -98,47 +368,55 @@ class BaseModel(DeclarativeBase):
 
 
 # metaprogramming to add custom function calls
-def create_cs_function(function_name, param_count=1):
+# param_count is the number of arguments the function takes, or None for any.
+# type_ sets the result type, so that results are decoded by SQLAlchemy, eg.
+#   select(cs_ste_vec_value_v1(Customer.extra_info, term, type_=EncryptedJsonb("customers", "extra_info")))
+def create_cs_function(function_name, param_count=None):
     def decorator(func):
         class CsFunction(FunctionElement):
             inherit_cache = True
             name = function_name
+            # the result type is part of the cache key, as it decides how
+            # results are processed
+            _traverse_internals = FunctionElement._traverse_internals + [
+                ("type", InternalTraversal.dp_type)
+            ]
+
+            def __init__(self, *clauses, type_=None):
+                if param_count is not None and len(clauses) != param_count:
+                    raise ValueError(
+                        f"Invalid number of parameters for {function_name}"
+                    )
+                super().__init__(*clauses)
+                if type_ is not None:
+                    self.type = to_instance(type_)
 
         @compiles(CsFunction, "postgresql")
         @wraps(func)
         def compile_cs_function(element, compiler, **kw):
-            if param_count == 1:
-                return f"{function_name}(%s)" % compiler.process(element.clauses)
-            elif param_count == 2:
-                args = list(element.clauses)
-                return f"{function_name}(%s, %s)" % (
-                    compiler.process(args[0]),
-                    compiler.process(args[1]),
-                )
-            else:
-                raise ValueError(f"Invalid number of parameters for {function_name}")
+            return f"{function_name}(%s)" % compiler.process(element.clauses, **kw)
 
         return CsFunction
 
     return decorator
 
 
-@create_cs_function("cs_unique_v1")
+@create_cs_function("cs_unique_v1", 1)
 def cs_unique_v1():
     pass
 
 
-@create_cs_function("cs_match_v1")
+@create_cs_function("cs_match_v1", 1)
 def cs_match_v1():
     pass
 
 
-@create_cs_function("cs_ore_64_8_v1")
+@create_cs_function("cs_ore_64_8_v1", 1)
 def cs_ore_64_8_v1():
     pass
 
 
-@create_cs_function("cs_ste_vec_v1")
+@create_cs_function("cs_ste_vec_v1", 1)
 def cs_ste_vec_v1():
     pass
 
@@ -148,11 +426,483 @@ def cs_ste_vec_value_v1():
     pass
 
 
-@create_cs_function("cs_ste_vec_term_v1", 1)
+@create_cs_function("cs_ste_vec_term_v1")
 def cs_ste_vec_term_v1(*args):
     pass
 
 
-@create_cs_function("cs_grouped_value_v1")
+@create_cs_function("cs_grouped_value_v1", 1)
 def cs_grouped_value_v1():
     pass
+
+
+def eql_eq(column, value):
+    # Equality on an encrypted column through the cheapest index it has, eg.
+    #   select(Customer).where(eql_eq(Customer.age, 31))
+    eql_type = column.type
+    index = eql_type.equality_index()
+    cs_function = cs_unique_v1 if index == "unique" else cs_ore_64_8_v1
+    return cs_function(column) == cs_function(eql_type.term(value, index))
+
+
+def _ore_term(column, value):
+    return cs_ore_64_8_v1(column.type.term(value, "ore"))
+
+
+def eql_lt(column, value):
+    return cs_ore_64_8_v1(column) < _ore_term(column, value)
+
+
+def eql_lte(column, value):
+    return cs_ore_64_8_v1(column) <= _ore_term(column, value)
+
+
+def eql_gt(column, value):
+    return cs_ore_64_8_v1(column) > _ore_term(column, value)
+
+
+def eql_gte(column, value):
+    return cs_ore_64_8_v1(column) >= _ore_term(column, value)
+
+
+def eql_between(column, low, high):
+    # Inclusive range on an ORE-indexed encrypted column, eg.
+    #   select(Customer).where(eql_between(Customer.start_date, date(2024, 1, 1), date(2024, 1, 31)))
+    return cs_ore_64_8_v1(column).between(
+        _ore_term(column, low), _ore_term(column, high)
+    )
+
+
+def eql_range(column, low=None, high=None, bounds="[)"):
+    # Range with PostgreSQL range bounds: "[)" includes low and excludes high,
+    # "[]", "(]" and "()" likewise. A missing bound leaves that side open.
+    if bounds not in ("[)", "[]", "(]", "()"):
+        raise ValueError(f"Invalid range bounds: {bounds}")
+    if low is not None and high is not None and bounds == "[]":
+        return eql_between(column, low, high)
+    conditions = []
+    if low is not None:
+        conditions.append((eql_gte if bounds[0] == "[" else eql_gt)(column, low))
+    if high is not None:
+        conditions.append((eql_lte if bounds[1] == "]" else eql_lt)(column, high))
+    if not conditions:
+        raise ValueError("eql_range needs at least one bound")
+    return and_(*conditions)
+
+
+# Joins on encrypted columns
+# Rows of two tables with the same encrypted value have the same unique term
+# (as long as both columns use the same unique index settings, such as token
+# filters), so they can be joined on cs_unique_v1 without decrypting:
+#
+#   select(Order, Customer).join(Customer, eql_on(Order.customer_email, Customer.email))
+#
+# With a cs_unique_v1 index on the join columns (see eql_index), PostgreSQL
+# can use hash, merge or index nested loop joins.
+
+
+def eql_on(left, right):
+    return cs_unique_v1(left) == cs_unique_v1(right)
+
+
+def eql_join(left, right, left_column, right_column, isouter=False, full=False):
+    return join(left, right, eql_on(left_column, right_column), isouter, full)
+
+
+eql_index_functions = {
+    "unique": (cs_unique_v1, None, "unq"),
+    "match": (cs_match_v1, "gin", "mch"),
+    "ore": (cs_ore_64_8_v1, None, "ore"),
+    "ste_vec": (cs_ste_vec_v1, "gin", "stv"),
+}
+
+
+def eql_index(column, index_type="unique", name=None, **kwargs):
+    # Functional index for an EQL index type, eg. eql_index(Customer.email)
+    # for CREATE INDEX customers_email_unq ON customers (cs_unique_v1(email)).
+    # It's added to the column's table, so metadata.create_all() creates it.
+    # Other arguments, such as unique=True, are passed to Index.
+    if index_type not in eql_index_functions:
+        raise ValueError(
+            f"Invalid EQL index type {index_type!r}, expected one of "
+            f"{', '.join(eql_index_functions)}"
+        )
+    column = _column(column)
+    function, using, suffix = eql_index_functions[index_type]
+    if using:
+        kwargs.setdefault("postgresql_using", using)
+    return Index(
+        name or f"{column.table.name}_{column.name}_{suffix}",
+        function(column),
+        **kwargs,
+    )
+
+
+# Upserts keyed on encrypted columns
+# INSERT ... ON CONFLICT (cs_unique_v1(key)) DO UPDATE, which needs a unique
+# index on cs_unique_v1(key) (eg. eql_index(Customer.email, unique=True)):
+#
+#   session.execute(upsert_statement(Customer, rows, Customer.email))
+#
+# upsert() does the same for any number of rows, one statement per batch.
+
+
+def upsert_statement(table, rows, key, update=None):
+    # rows are dicts of column values; update lists the columns to update on
+    # conflict, by default all the given ones except key
+    from sqlalchemy.dialects.postgresql import insert
+
+    key = _column(key)
+    rows = list(rows)
+    if update is None:
+        update = [name for name in rows[0] if name != key.key]
+    statement = insert(table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[cs_unique_v1(key)],
+        set_={name: statement.excluded[name] for name in update or [key.key]},
+    )
+
+
+def upsert(session, table, rows, key, update=None, batch_size=1000):
+    # Upserts rows (an iterable of dicts) in batches, one statement each, and
+    # returns the number of rows. Within a batch the last row for a key wins,
+    # as PostgreSQL can't update a row twice in one statement.
+    key = _column(key)
+    filters = token_filters(key.type.table, key.type.column)
+    count = 0
+    batch = {}
+    for row in rows:
+        value = unique_key(key.type.eql_type, row[key.key], filters)
+        # rows without a key never conflict
+        batch[object() if value is None else value] = row
+        if len(batch) >= batch_size:
+            session.execute(upsert_statement(table, batch.values(), key, update))
+            count += len(batch)
+            batch = {}
+    if batch:
+        session.execute(upsert_statement(table, batch.values(), key, update))
+        count += len(batch)
+    return count
+
+
+# Cached results (see eqlpy.cache)
+
+# session.info key of the tables a session has written to, per cache, in its
+# current transaction
+_pending_tables = "eqlpy_pending_tables"
+
+
+def cached_execute(session, statement, cache):
+    # Rows of statement (entities for select(Model)), read through cache (an
+    # EqlResultCache). Results are invalidated by writes to the tables the
+    # statement reads, with invalidate_on_flush(). Cached entities are
+    # expunged from the session that loaded them.
+    bind = session.get_bind()
+    compiled = statement.compile(dialect=bind.dialect)
+    params = sorted(compiled.params.items())
+    tables = {table.name for table in find_tables(statement, check_columns=True)}
+    if tables & session.info.get((_pending_tables, cache), set()):
+        # the session has uncommitted writes to these tables
+        return _load(session, statement)
+
+    def load():
+        return _load(session, statement, expunge=True)
+
+    return cache.get_or_load(
+        make_key(str(bind.url), str(compiled), params), tables, load
+    )
+
+
+def _load(session, statement, expunge=False):
+    result = session.execute(statement)
+    if not _selects_entity(statement):
+        return result.all()
+    entities = result.scalars().all()
+    if expunge:
+        for entity in entities:
+            session.expunge(entity)
+    return entities
+
+
+class _InvalidateOnFlush:
+    # Session event listeners of invalidate_on_flush(). Tables written by a
+    # session are kept in its info until the transaction ends.
+    def __init__(self, cache):
+        self.cache = cache
+        self.key = (_pending_tables, cache)
+
+    def written(self, session, tables):
+        session.info.setdefault(self.key, set()).update(tables)
+        self.cache.invalidate(*tables)
+
+    def after_flush(self, session, flush_context):
+        self.written(
+            session,
+            {
+                table.name
+                for obj in (*session.new, *session.dirty, *session.deleted)
+                for table in object_mapper(obj).tables
+            },
+        )
+
+    def do_orm_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            self.written(state.session, {state.statement.table.name})
+
+    def after_commit(self, session):
+        self.cache.invalidate(*session.info.pop(self.key, ()))
+
+    def after_soft_rollback(self, session, previous_transaction):
+        self.cache.invalidate(*session.info.get(self.key, ()))
+        if previous_transaction.parent is None:
+            session.info.pop(self.key, None)
+
+
+def invalidate_on_flush(cache, target=Session):
+    # Invalidates cache for the tables written by flushes and ORM-enabled
+    # insert(), update() and delete() statements of target (a Session,
+    # sessionmaker or Session class), and again when the transaction commits
+    # or rolls back. Until then, cached_execute() doesn't cache the tables
+    # written. Returns a function removing the listeners.
+    invalidator = _InvalidateOnFlush(cache)
+    listeners = [
+        (name, getattr(invalidator, name))
+        for name in (
+            "after_flush",
+            "do_orm_execute",
+            "after_commit",
+            "after_soft_rollback",
+        )
+    ]
+    for name, listener in listeners:
+        event.listen(target, name, listener)
+
+    def remove():
+        for name, listener in listeners:
+            event.remove(target, name, listener)
+
+    return remove
+
+
+# Session routing
+# EqlRoutingSession sends statements that only use tables without encrypted
+# columns straight to PostgreSQL (direct_bind), and everything else, including
+# text() statements it can't inspect, through CipherStash Proxy (bind):
+#
+#   Session = sessionmaker(class_=EqlRoutingSession, bind=proxy_engine, direct_bind=postgres_engine)
+#
+# A session holds a connection, and a transaction, per bind it has used, and
+# commit() commits them one after the other, so it's not atomic across the
+# two. Writes that must commit or roll back together go in
+# session.proxy_only(), which routes every statement through the proxy.
+# Statements can also be sent to either engine with
+# bind_arguments={"bind": engine}.
+
+
+def has_encrypted_columns(table):
+    return any(isinstance(column.type, EqlTypeDecorator) for column in table.columns)
+
+
+class EqlRoutingSession(Session):
+    def __init__(self, *args, direct_bind=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.direct_bind = direct_bind
+        self._proxy_only = False
+
+    @contextmanager
+    def proxy_only(self):
+        previous, self._proxy_only = self._proxy_only, True
+        try:
+            yield self
+        finally:
+            self._proxy_only = previous
+
+    def get_bind(self, mapper=None, *, clause=None, bind=None, **kw):
+        if bind is None and self.direct_bind is not None and not self._proxy_only:
+            tables = []
+            if mapper is not None:
+                tables.extend(inspect(mapper).tables)
+            if clause is not None:
+                tables.extend(
+                    find_tables(clause, check_columns=True, include_crud=True)
+                )
+            if tables and not any(has_encrypted_columns(table) for table in tables):
+                return self.direct_bind
+        return super().get_bind(mapper, clause=clause, bind=bind, **kw)
+
+
+# Text search over several terms and columns
+
+
+class EqlSearch:
+    # Search for any of terms in any of columns (all with match indexes):
+    #   search = EqlSearch([Customer.name, Customer.email], ["ali", "dev"])
+    #   select(Customer, search.rank.label("rank")).where(search.condition).order_by(search.rank.desc())
+    # condition matches rows with at least one of the terms, and rank is the
+    # number of terms a row matches. Both use the same bound terms, encoded
+    # once per column.
+    def __init__(self, columns, terms):
+        columns = [_column(c) for c in columns]
+        terms = [terms] if isinstance(terms, str) else list(terms)
+        encoded = [
+            [literal(term) for term in match_terms(c.type.table, c.type.column, terms)]
+            for c in columns
+        ]
+        self.matches = [
+            [
+                cs_match_v1(c).op("@>")(cs_match_v1(encoded[n][i]))
+                for n, c in enumerate(columns)
+            ]
+            for i in range(len(terms))
+        ]
+        self.condition = or_(*(m for term in self.matches for m in term))
+        self.rank = reduce(
+            lambda a, b: a + b,
+            (cast(or_(*term), Integer) for term in self.matches),
+        )
+
+
+def eql_search(columns, terms):
+    return EqlSearch(columns, terms)
+
+
+def search_select(statement, columns, terms, rank=False):
+    # statement filtered to rows matching any of terms in any of columns,
+    # with rank=True ordered by the number of terms matched
+    search = EqlSearch(columns, terms)
+    statement = statement.where(search.condition)
+    if rank:
+        statement = statement.order_by(search.rank.desc())
+    return statement
+
+
+# Extracting fields from encrypted JSONB
+
+
+def extract_columns(column, paths):
+    # cs_ste_vec_value_v1 of column for each path, to select, eg.
+    #   select(Customer.id, *extract_columns(Customer.extra_info, ["$.num", "$.cat"]))
+    column = _column(column)
+    return [
+        cs_ste_vec_value_v1(
+            column, selector_term(path, column.type.table, column.type.column)
+        ).label(f"eql_extract_{i}")
+        for i, path in enumerate(paths)
+    ]
+
+
+def extract(session, column, paths, *columns, where=None):
+    # Values at paths of an EncryptedJsonb column, in one query, eg.
+    #   extract(session, Customer.extra_info, ["$.num", "$.cat"], Customer.id)
+    #   -> [{"id": 1, "$.num": 1, "$.cat": "a"}, ...]
+    # Missing paths are None. where is an optional condition.
+    paths = list(paths)
+    column = _column(column)
+    statement = select(*columns, *extract_columns(column, paths))
+    if not columns:
+        statement = statement.select_from(column.table)
+    if where is not None:
+        statement = statement.where(where)
+    result = session.execute(statement)
+    keys = list(result.keys())[: len(columns)]
+    return decode_extracted(result.all(), paths, keys)
+
+
+def group_by_select(column, path, aggregates=None):
+    # Statement grouping by the value at path of an EncryptedJsonb column:
+    # cs_ste_vec_term_v1(column, selector) to group on, and
+    # cs_grouped_value_v1(cs_ste_vec_value_v1(column, selector)) for each
+    # group's value. aggregates is {label: expression}, {"count": func.count()}
+    # by default.
+    column = _column(column)
+    aggregates = aggregates or {"count": func.count()}
+    selector = selector_term(path, column.type.table, column.type.column)
+    group = cs_ste_vec_term_v1(column, selector)
+    return (
+        select(
+            *(aggregate.label(name) for name, aggregate in aggregates.items()),
+            cs_grouped_value_v1(cs_ste_vec_value_v1(column, selector)).label(
+                "eql_value"
+            ),
+        )
+        .select_from(column.table)
+        .group_by(group)
+        .order_by(group)
+    )
+
+
+def group_by_encrypted(session, column, path, aggregates=None, where=None):
+    # Groups in the database, eg.
+    #   group_by_encrypted(session, Customer.extra_info, "$.cat", {"count": func.count()})
+    #   -> [{"count": 1, "$.cat": "a"}, {"count": 2, "$.cat": "b"}]
+    aggregates = aggregates or {"count": func.count()}
+    statement = group_by_select(column, path, aggregates)
+    if where is not None:
+        statement = statement.where(where)
+    return decode_extracted(session.execute(statement).all(), [path], list(aggregates))
+
+
+# Keyset pagination (see eqlpy.keyset)
+
+
+def keyset_select(statement, column, after=None, size=50, descending=False):
+    # statement ordered by an ORE-indexed encrypted column (and the primary key
+    # of its table), starting after the row the `after` token points to. Rows
+    # end with the column's ORE term, labelled eql_keyset_term.
+    column = _column(column)
+    (pk,) = column.table.primary_key.columns
+    ore = cs_ore_64_8_v1(column)
+    statement = (
+        statement.add_columns(cast(ore, String).label("eql_keyset_term"))
+        .order_by(None)
+        .order_by(
+            ore.desc() if descending else ore.asc(),
+            pk.desc() if descending else pk.asc(),
+        )
+    )
+    if after is not None:
+        last_pk, last_term = decode_token(column.name, after)
+        # the term is sent untyped, as PostgreSQL reads it as the ORE type
+        last_row = tuple_(literal(last_term, NullType()), literal(last_pk, pk.type))
+        statement = statement.where(
+            tuple_(ore, pk).op("<" if descending else ">")(last_row)
+        )
+    return statement.limit(size + 1)
+
+
+def keyset_page(session, statement, column, after=None, size=50, descending=False):
+    # One page of ORM entities (or rows) for keyset_select(); session may also
+    # be a Connection
+    column = _column(column)
+    (pk,) = column.table.primary_key.columns
+    columns = len(statement.column_descriptions)
+    result = session.execute(keyset_select(statement, column, after, size, descending))
+    rows = result.freeze()
+    terms = rows().scalars(columns).all()
+    if _selects_entity(statement):
+        items = rows().scalars().all()
+    else:
+        items = rows().columns(*range(columns)).all()
+    keys = [(_pk_value(item, pk), term) for item, term in zip(items, terms)]
+    return page(items, keys, size, column.name)
+
+
+def _column(column):
+    # Customer.start_date -> the start_date Column
+    if hasattr(column, "__clause_element__"):
+        return column.__clause_element__()
+    return column
+
+
+def _selects_entity(statement):
+    # select(Customer) rather than select(Customer.id, Customer.name)
+    descriptions = statement.column_descriptions
+    return len(descriptions) == 1 and descriptions[0]["type"] is descriptions[0].get(
+        "entity"
+    )
+
+
+def _pk_value(row, pk):
+    if hasattr(row, "_mapping"):
+        return row._mapping[pk]
+    return getattr(row, pk.key)
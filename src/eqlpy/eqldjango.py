@@ -1,55 +1,214 @@
 import json
-from django.db import models
-from datetime import datetime
-from django.db.models import Func, JSONField, Aggregate
-from django.db.models.fields import BooleanField
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.migrations.operations import AddIndex, RemoveIndex
+from django.db.models import (
+    Aggregate,
+    Count,
+    Exists,
+    ExpressionWrapper,
+    Func,
+    JSONField,
+    OuterRef,
+    Subquery,
+)
+from django.db.models.fields import BooleanField, IntegerField, TextField
+from django.db.models.functions import Cast
 from django.db.models import Q, F, Value
+from django.db.models.expressions import RawSQL
+from django.core.exceptions import EmptyResultSet
 from django.db.models.lookups import Lookup
+from django.db.models.signals import post_delete, post_save
+from django.db.models.sql import Query
+from django.db.models.query import (
+    FlatValuesListIterable,
+    ModelIterable,
+    NamedValuesListIterable,
+    ValuesListIterable,
+)
+from django.db.models.utils import create_namedtuple_class
+from django.utils.module_loading import import_string
+from eqlpy.eql_codec import (
+    batch_decoders,
+    decode_extracted,
+    match_terms,
+    payload,
+    plaintext_encoders,
+    selector_term,
+    unique_key,
+    value_decoders,
+)
+from eqlpy.eql_config import equality_index, token_filters
 from eqlpy.eql_types import EqlFloat, EqlText, EqlJsonb
+from eqlpy.cache import make_key
+from eqlpy.keyset import decode_token, page
 from functools import reduce
+from operator import add, or_
+
+# Instrumentation
+# While eql_instrumentation() is active (or EqlInstrumentationMiddleware for a
+# request), encrypted fields and lookups record counts, timings and payload sizes
+# into an EqlStats. When it's not active the only cost is one ContextVar lookup.
+
+_eql_stats = ContextVar("eql_stats", default=None)
+
+
+class EqlStats:
+    def __init__(self):
+        self.encodes = Counter()
+        self.encode_time = Counter()
+        self.decodes = Counter()
+        self.decode_time = Counter()
+        self.lookups = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def encoded(self, field, elapsed, prep_value):
+        field_type = type(field).__name__
+        self.encodes[field_type] += 1
+        self.encode_time[field_type] += elapsed
+        if prep_value is not None:
+            self.bytes_sent += len(json.dumps(prep_value))
+
+    def decoded(self, field, decode, values):
+        start = perf_counter()
+        decoded = decode(values)
+        elapsed = perf_counter() - start
+        field_type = type(field).__name__
+        self.decodes[field_type] += sum(1 for v in values if v is not None)
+        self.decode_time[field_type] += elapsed
+        self.bytes_received += sum(
+            len(v) if isinstance(v, str) else len(json.dumps(v))
+            for v in values
+            if v is not None
+        )
+        return decoded
+
+    def looked_up(self, query_type):
+        self.lookups[query_type] += 1
+
+    def summary(self):
+        return {
+            "encodes": {
+                t: {"count": n, "time": self.encode_time[t]}
+                for t, n in self.encodes.items()
+            },
+            "decodes": {
+                t: {"count": n, "time": self.decode_time[t]}
+                for t, n in self.decodes.items()
+            },
+            "lookups": dict(self.lookups),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+@contextmanager
+def eql_instrumentation(sink=None):
+    stats = EqlStats()
+    token = _eql_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _eql_stats.reset(token)
+        if sink is not None:
+            sink(stats.summary())
+
+
+# Add "eqlpy.eqldjango.EqlInstrumentationMiddleware" to MIDDLEWARE to record
+# stats for each request. The stats are available as request.eql_stats, and the
+# summary is passed to the callable named by settings.EQLPY_INSTRUMENTATION_SINK
+# (a dotted path) when the request finishes.
+class EqlInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        sink = getattr(settings, "EQLPY_INSTRUMENTATION_SINK", None)
+        self.sink = import_string(sink) if isinstance(sink, str) else sink
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with eql_instrumentation(self.sink) as stats:
+            request.eql_stats = stats
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with eql_instrumentation(self.sink) as stats:
+            request.eql_stats = stats
+            return await self.get_response(request)
 
 
 class EncryptedValue(models.JSONField):
+    eql_type = "text"
+
     def __init__(self, *args, **kwargs):
         self.eql_table = kwargs.pop("eql_table", None)
         self.eql_column = kwargs.pop("eql_column", None)
+        self.eql_indexes = list(kwargs.pop("eql_indexes", None) or [])
         super().__init__(*args, **kwargs)
 
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         kwargs["eql_table"] = self.eql_table
         kwargs["eql_column"] = self.eql_column
+        if self.eql_indexes:
+            kwargs["eql_indexes"] = self.eql_indexes
         return name, path, args, kwargs
 
     def get_prep_value(self, value):
-        if value is not None:
-            dict = {
-                "k": "pt",
-                "p": self._to_db_format(value),
-                "i": {"t": self.eql_table, "c": self.eql_column},
-                "v": 1,
-                "q": None,
-            }
-            return dict
-        else:
-            return None
-
-    def _to_db_format(self, value):
+        stats = _eql_stats.get()
+        if stats is None:
+            return self._get_prep_value(value)
+        start = perf_counter()
+        prep_value = self._get_prep_value(value)
+        stats.encoded(self, perf_counter() - start, prep_value)
+        return prep_value
+
+    def _get_prep_value(self, value):
         if value is None:
             return None
-        return str(value)
+        return payload(
+            plaintext_encoders[self.eql_type](value), self.eql_table, self.eql_column
+        )
 
     def from_db_value(self, value, expression, connection):
         if value is None:
             return None
-        if isinstance(value, str):
-            # TODO: seems like we get a string from the database, but we should be getting a dict
-            value = json.loads(value)
-        return self._from_db_format(value["p"])
+        stats = _eql_stats.get()
+        if stats is not None:
+            return stats.decoded(self, self._from_db_values, [value])[0]
+        return value_decoders[self.eql_type](value)
+
+    def from_db_values(self, values):
+        stats = _eql_stats.get()
+        if stats is not None:
+            return stats.decoded(self, self._from_db_values, values)
+        return self._from_db_values(values)
+
+    def _from_db_values(self, values):
+        # Decodes a whole batch (eg. one fetched chunk of a column) in one pass
+        return batch_decoders[self.eql_type](values)
 
     def db_type(self, connection):
         return "cs_encrypted_v1"
 
+    def equality_index(self):
+        # "unique" or "ore", from eql_indexes or the loaded encrypt config
+        return equality_index(
+            self.eql_type, self.eql_table, self.eql_column, self.eql_indexes
+        )
+
     def contribute_to_class(self, cls, name, **kwargs):
         super().contribute_to_class(cls, name, **kwargs)
         # if table or column are not set, use cls and name
@@ -57,113 +216,114 @@ class EncryptedValue(models.JSONField):
             self.eql_table = cls._meta.db_table
         if (not hasattr(self, "eql_column")) or (getattr(self, "eql_column") is None):
             self.eql_column = name
+        if self.eql_indexes and not cls._meta.abstract:
+            self._add_eql_indexes(cls, name)
+
+    def _add_eql_indexes(self, cls, name):
+        # Indexes declared with eql_indexes are added to Meta.indexes, so that
+        # makemigrations picks them up as regular AddIndex/RemoveIndex operations.
+        # Models rendered from migration state already have them in Meta.
+        existing = {
+            (index.fields[0], index.index_type)
+            for index in cls._meta.indexes
+            if isinstance(index, EqlIndex)
+        }
+        cls._meta.indexes = cls._meta.indexes + [
+            EqlIndex(field=name, index_type=index_type)
+            for index_type in self.eql_indexes
+            if (name, index_type) not in existing
+        ]
+        cls._meta.original_attrs["indexes"] = cls._meta.indexes
 
 
 class EncryptedInt(EncryptedValue):
-    def _from_db_format(self, value):
-        return int(value)
+    eql_type = "int"
 
 
 class EncryptedBoolean(EncryptedValue):
-    def _to_db_format(self, value):
-        if value is None:
-            return None
-        elif value == True:
-            return "true"
-        else:
-            return "false"
-
-    def _from_db_format(self, value):
-        return value == "true"
+    eql_type = "boolean"
 
 
 class EncryptedDate(EncryptedValue):
-    def _to_db_format(self, value):
-        if value is None:
-            return None
-
-        return value.isoformat()
-
-    def _from_db_format(self, value):
-        return datetime.fromisoformat(value).date()
+    eql_type = "date"
 
 
 class EncryptedFloat(EncryptedValue):
-    def _from_db_format(self, value):
-        return float(value)
+    eql_type = "double"
 
 
 class EncryptedText(EncryptedValue):
-    def _from_db_format(self, value):
-        return value
+    eql_type = "text"
 
 
 class EncryptedJsonb(EncryptedValue):
-    def _to_db_format(self, value):
-        return json.dumps(value)
+    eql_type = "jsonb"
 
-    def _from_db_format(self, value):
-        return json.loads(value)
 
-
-class EncryptedUniqueEquals(Lookup):
-    lookup_name = "eq"
+class EncryptedLookup(Lookup):
+    query_type = None
+    template = None
 
     def as_sql(self, compiler, connection):
         lhs, lhs_params = self.process_lhs(compiler, connection)
         rhs, rhs_params = self.process_rhs(compiler, connection)
         # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="unique") for e in rhs_params]
+        rhs_params = [dict(e, q=self.query_type) for e in rhs_params]
         params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_unique_v1(%s) = cs_unique_v1(%s)" % (lhs, rhs), params
+        stats = _eql_stats.get()
+        if stats is not None:
+            stats.looked_up(self.query_type)
+        if not isinstance(rhs, tuple):
+            rhs = (rhs,)
+        return self.template % (lhs, *rhs), params
 
 
-EncryptedText.register_lookup(EncryptedUniqueEquals)
+class EncryptedUniqueEquals(EncryptedLookup):
+    lookup_name = "eq"
+    query_type = "unique"
+    template = "cs_unique_v1(%s) = cs_unique_v1(%s)"
 
 
-class EncryptedOreEquals(Lookup):
+class EncryptedOreEquals(EncryptedLookup):
     lookup_name = "eq"
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) = cs_ore_64_8_v1(%s)"
 
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="ore") for e in rhs_params]
-        params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_ore_64_8_v1(%s) = cs_ore_64_8_v1(%s)" % (lhs, rhs), params
 
+class EncryptedEquals(EncryptedLookup):
+    # Equality through the cheapest index the column has (see eql_config)
+    lookup_name = "eq"
+    lookups = {"unique": EncryptedUniqueEquals, "ore": EncryptedOreEquals}
 
-EncryptedBoolean.register_lookup(EncryptedOreEquals)
-EncryptedDate.register_lookup(EncryptedOreEquals)
-EncryptedInt.register_lookup(EncryptedOreEquals)
-EncryptedFloat.register_lookup(EncryptedOreEquals)
+    @property
+    def query_type(self):
+        return self.lhs.output_field.equality_index()
 
+    @property
+    def template(self):
+        return self.lookups[self.query_type].template
 
-class EncryptedTextMatch(Lookup):
-    lookup_name = "match"
 
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="match") for e in rhs_params]
-        params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_match_v1(%s) @> cs_match_v1(%s)" % (lhs, rhs), params
+EncryptedText.register_lookup(EncryptedEquals)
+EncryptedBoolean.register_lookup(EncryptedEquals)
+EncryptedDate.register_lookup(EncryptedEquals)
+EncryptedInt.register_lookup(EncryptedEquals)
+EncryptedFloat.register_lookup(EncryptedEquals)
+
+
+class EncryptedTextMatch(EncryptedLookup):
+    lookup_name = "match"
+    query_type = "match"
+    template = "cs_match_v1(%s) @> cs_match_v1(%s)"
 
 
 EncryptedText.register_lookup(EncryptedTextMatch)
 
 
-class EncryptedOreLt(Lookup):
+class EncryptedOreLt(EncryptedLookup):
     lookup_name = "lt"
-
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="ore") for e in rhs_params]
-        params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_ore_64_8_v1(%s) < cs_ore_64_8_v1(%s)" % (lhs, rhs), params
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) < cs_ore_64_8_v1(%s)"
 
 
 EncryptedFloat.register_lookup(EncryptedOreLt)
@@ -171,16 +331,10 @@ EncryptedInt.register_lookup(EncryptedOreLt)
 EncryptedDate.register_lookup(EncryptedOreLt)
 
 
-class EncryptedOreGt(Lookup):
+class EncryptedOreGt(EncryptedLookup):
     lookup_name = "gt"
-
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="ore") for e in rhs_params]
-        params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_ore_64_8_v1(%s) > cs_ore_64_8_v1(%s)" % (lhs, rhs), params
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) > cs_ore_64_8_v1(%s)"
 
 
 EncryptedFloat.register_lookup(EncryptedOreGt)
@@ -188,20 +342,226 @@ EncryptedInt.register_lookup(EncryptedOreGt)
 EncryptedDate.register_lookup(EncryptedOreGt)
 
 
-class EncryptedJsonContains(Lookup):
-    lookup_name = "contains"
+class EncryptedOreLte(EncryptedLookup):
+    lookup_name = "lte"
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) <= cs_ore_64_8_v1(%s)"
 
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        # TODO: could this be done in get_prep_value?
-        rhs_params = [dict(e, q="ste_vec") for e in rhs_params]
-        params = map(json.dumps, (lhs_params + rhs_params))
-        return "cs_ste_vec_v1(%s) @> cs_ste_vec_v1(%s)" % (lhs, rhs), params
+
+EncryptedFloat.register_lookup(EncryptedOreLte)
+EncryptedInt.register_lookup(EncryptedOreLte)
+EncryptedDate.register_lookup(EncryptedOreLte)
+
+
+class EncryptedOreGte(EncryptedLookup):
+    lookup_name = "gte"
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) >= cs_ore_64_8_v1(%s)"
+
+
+EncryptedFloat.register_lookup(EncryptedOreGte)
+EncryptedInt.register_lookup(EncryptedOreGte)
+EncryptedDate.register_lookup(EncryptedOreGte)
+
+
+class EncryptedOreRange(EncryptedLookup):
+    # Inclusive, like Django's range: start_date__range=(date(2024, 1, 1), date(2024, 1, 31)).
+    # Each bound is encoded once, and PostgreSQL turns BETWEEN into a single
+    # range scan of the ore index.
+    lookup_name = "range"
+    query_type = "ore"
+    template = "cs_ore_64_8_v1(%s) BETWEEN cs_ore_64_8_v1(%s) AND cs_ore_64_8_v1(%s)"
+
+    def get_prep_lookup(self):
+        low, high = self.rhs
+        if low is None or high is None:
+            raise ValueError("Cannot use None as a query value")
+        field = self.lhs.output_field
+        return [field.get_prep_value(low), field.get_prep_value(high)]
+
+    def process_rhs(self, compiler, connection):
+        return ("%s", "%s"), list(self.rhs)
+
+
+EncryptedFloat.register_lookup(EncryptedOreRange)
+EncryptedInt.register_lookup(EncryptedOreRange)
+EncryptedDate.register_lookup(EncryptedOreRange)
+
+
+class EncryptedJsonContains(EncryptedLookup):
+    lookup_name = "contains"
+    query_type = "ste_vec"
+    template = "cs_ste_vec_v1(%s) @> cs_ste_vec_v1(%s)"
 
 
 EncryptedJsonb.register_lookup(EncryptedJsonContains)
 
+# EQL indexes and migration operations
+# An EqlIndex registers an index with the EQL configuration (cs_add_index_v1)
+# and creates the matching functional index, eg. for index_type "match":
+#
+#   SELECT cs_add_index_v1('customers', 'name', 'match', 'text', '{}');
+#   CREATE INDEX customers_name_7f3a2c_mch ON "customers" USING GIN (cs_match_v1("name"));
+#
+# The EQL configuration stays pending until cs_encrypt_v1() and cs_activate_v1()
+# are called.
+
+
+class EqlIndex(models.Index):
+    index_functions = {
+        "unique": ("cs_unique_v1", "", "unq"),
+        "match": ("cs_match_v1", "GIN", "mch"),
+        "ore": ("cs_ore_64_8_v1", "", "ore"),
+        "ste_vec": ("cs_ste_vec_v1", "GIN", "stv"),
+    }
+
+    def __init__(
+        self,
+        *,
+        field,
+        index_type,
+        cast_as=None,
+        opts=None,
+        unique=False,
+        keyset=False,
+        name=None,
+    ):
+        if index_type not in self.index_functions:
+            raise ValueError(
+                f"Invalid EQL index type {index_type!r}, expected one of "
+                f"{', '.join(self.index_functions)}"
+            )
+        if keyset and index_type != "ore":
+            raise ValueError("keyset is only supported for ore indexes")
+        super().__init__(fields=[field], name=name)
+        self.index_type = index_type
+        self.cast_as = cast_as
+        self.opts = opts
+        self.unique = unique
+        # also index the primary key, for keyset_page() on this field
+        self.keyset = keyset
+        self.suffix = self.index_functions[index_type][2]
+
+    def deconstruct(self):
+        path = "%s.%s" % (self.__class__.__module__, self.__class__.__name__)
+        kwargs = {
+            "name": self.name,
+            "field": self.fields[0],
+            "index_type": self.index_type,
+        }
+        if self.cast_as is not None:
+            kwargs["cast_as"] = self.cast_as
+        if self.opts is not None:
+            kwargs["opts"] = self.opts
+        if self.unique:
+            kwargs["unique"] = self.unique
+        if self.keyset:
+            kwargs["keyset"] = self.keyset
+        return (path, (), kwargs)
+
+    def create_statements(self, model, schema_editor, concurrently=False):
+        field = model._meta.get_field(self.fields[0])
+        function, method, _ = self.index_functions[self.index_type]
+        cast_as = self.cast_as or field.eql_type
+        opts = self.opts
+        if opts is None and self.index_type == "ste_vec":
+            opts = {"prefix": f"{field.eql_table}/{field.eql_column}"}
+        return [
+            "SELECT cs_add_index_v1(%s, %s, %s, %s, %s)"
+            % tuple(
+                map(
+                    schema_editor.quote_value,
+                    (
+                        field.eql_table,
+                        field.eql_column,
+                        self.index_type,
+                        cast_as,
+                        json.dumps(opts or {}),
+                    ),
+                )
+            ),
+            "CREATE %sINDEX %s%s ON %s %s(%s(%s)%s)"
+            % (
+                "UNIQUE " if self.unique else "",
+                "CONCURRENTLY " if concurrently else "",
+                schema_editor.quote_name(self.name),
+                schema_editor.quote_name(model._meta.db_table),
+                f"USING {method} " if method else "",
+                function,
+                schema_editor.quote_name(field.column),
+                (
+                    ", " + schema_editor.quote_name(model._meta.pk.column)
+                    if self.keyset
+                    else ""
+                ),
+            ),
+        ]
+
+    def remove_statements(self, model, schema_editor, concurrently=False):
+        field = model._meta.get_field(self.fields[0])
+        return [
+            "DROP INDEX %sIF EXISTS %s"
+            % (
+                "CONCURRENTLY " if concurrently else "",
+                schema_editor.quote_name(self.name),
+            ),
+            "SELECT cs_remove_index_v1(%s, %s, %s)"
+            % tuple(
+                map(
+                    schema_editor.quote_value,
+                    (field.eql_table, field.eql_column, self.index_type),
+                )
+            ),
+        ]
+
+    def create_sql(self, model, schema_editor, using="", concurrently=False, **kwargs):
+        return ";\n".join(self.create_statements(model, schema_editor, concurrently))
+
+    def remove_sql(self, model, schema_editor, concurrently=False, **kwargs):
+        return ";\n".join(self.remove_statements(model, schema_editor, concurrently))
+
+
+# AddEqlIndex and RemoveEqlIndex behave like AddIndex and RemoveIndex, but run
+# each statement separately so the index is built CONCURRENTLY whenever the
+# migration is not atomic (atomic = False on the Migration).
+
+
+class AddEqlIndex(AddIndex):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            _execute_statements(schema_editor, self.index.create_statements, model)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            _execute_statements(schema_editor, self.index.remove_statements, model)
+
+
+class RemoveEqlIndex(RemoveIndex):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[
+                app_label, self.model_name_lower
+            ].get_index_by_name(self.name)
+            _execute_statements(schema_editor, index.remove_statements, model)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = to_state.models[app_label, self.model_name_lower].get_index_by_name(
+                self.name
+            )
+            _execute_statements(schema_editor, index.create_statements, model)
+
+
+def _execute_statements(schema_editor, statements, model):
+    concurrently = not schema_editor.connection.in_atomic_block
+    for sql in statements(model, schema_editor, concurrently=concurrently):
+        schema_editor.execute(sql, params=None)
+
+
 # EQL functions
 # These classes are data structures that represent EQL functions
 # Needed for complex EQL queries
@@ -276,3 +636,681 @@ CsContainedBy = create_operator("CsContainedBy", "%(left)s <@ %(right)s")
 CsEquals = create_operator("CsEquals", "%(left)s = %(right)s")
 CsGt = create_operator("CsGt", "%(left)s > %(right)s")
 CsLt = create_operator("CsLt", "%(left)s < %(right)s")
+
+
+# Async helpers
+# Django's async queryset API (aiterator, aget, afirst, ...) already runs
+# from_db_value in a worker thread one chunk at a time. These helpers do the same
+# for values that Django doesn't decode for us, such as results of
+# CsSteVecValueV1 or CsGroupedValueV1 annotations.
+
+
+async def adecode(field, values):
+    return await sync_to_async(field.from_db_values, thread_sensitive=False)(
+        list(values)
+    )
+
+
+async def adecoded(aiterable, field, chunk_size=2000):
+    chunk = []
+    async for value in aiterable:
+        chunk.append(value)
+        if len(chunk) >= chunk_size:
+            for decoded in await adecode(field, chunk):
+                yield decoded
+            chunk = []
+    if chunk:
+        for decoded in await adecode(field, chunk):
+            yield decoded
+
+
+# Streaming
+# QuerySet.iterator() calls from_db_value once per cell. EncryptedQuerySet.stream()
+# instead decodes each fetched chunk one column at a time with from_db_values,
+# and reads through a server-side cursor so memory stays bounded by chunk_size.
+
+
+def _column_decoders(compiler, expressions):
+    connection = compiler.connection
+    decoders = []
+    for pos, (convs, expression) in compiler.get_converters(expressions).items():
+        field = getattr(expression, "output_field", None)
+        if isinstance(field, EncryptedValue):
+            decoders.append((pos, field.from_db_values))
+        else:
+
+            def convert(values, convs=convs, expression=expression):
+                converted = []
+                for value in values:
+                    for converter in convs:
+                        value = converter(value, expression, connection)
+                    converted.append(value)
+                return converted
+
+            decoders.append((pos, convert))
+    return decoders
+
+
+def _decode_chunk(chunk, column_decoders):
+    if not chunk:
+        return []
+    columns = list(zip(*chunk))
+    for pos, decode in column_decoders:
+        columns[pos] = decode(columns[pos])
+    return zip(*columns)
+
+
+class EncryptedModelIterable(ModelIterable):
+    def __iter__(self):
+        queryset = self.queryset
+        if queryset.query.select_related or queryset._known_related_objects:
+            yield from super().__iter__()
+            return
+
+        db = queryset.db
+        compiler = queryset.query.get_compiler(using=db)
+        results = compiler.execute_sql(
+            chunked_fetch=self.chunked_fetch, chunk_size=self.chunk_size
+        )
+        select, klass_info, annotation_col_map = (
+            compiler.select,
+            compiler.klass_info,
+            compiler.annotation_col_map,
+        )
+        model_cls = klass_info["model"]
+        select_fields = klass_info["select_fields"]
+        model_fields_start, model_fields_end = select_fields[0], select_fields[-1] + 1
+        init_list = [
+            f[0].target.attname for f in select[model_fields_start:model_fields_end]
+        ]
+        column_decoders = _column_decoders(
+            compiler, [s[0] for s in select[: compiler.col_count]]
+        )
+        from_db = model_cls.from_db
+
+        for chunk in results:
+            for row in _decode_chunk(chunk, column_decoders):
+                obj = from_db(db, init_list, row[model_fields_start:model_fields_end])
+                if annotation_col_map:
+                    for attr_name, col_pos in annotation_col_map.items():
+                        setattr(obj, attr_name, row[col_pos])
+                yield obj
+
+
+# Keyset pagination (see eqlpy.keyset)
+
+
+def keyset_page(queryset, field_name, after=None, size=50, descending=False):
+    # One page of queryset ordered by an ORE-indexed encrypted field, starting
+    # after the row the `after` token (a previous page's next_token) points to
+    model = queryset.model
+    field = model._meta.get_field(field_name)
+    ore = CsOre648V1(F(field_name))
+    iterable = queryset._iterable_class
+    names = _values_names(queryset) if iterable is NamedValuesListIterable else None
+    queryset = queryset.annotate(
+        eql_keyset_term=Cast(ore, output_field=TextField()), eql_keyset_pk=F("pk")
+    ).order_by(ore.desc() if descending else ore.asc(), "-pk" if descending else "pk")
+    if iterable in (FlatValuesListIterable, NamedValuesListIterable):
+        # rows ending with the term and pk, which are flattened or named below
+        queryset._iterable_class = ValuesListIterable
+    if after is not None:
+        pk, term = decode_token(field.column, after)
+        qn = connections[queryset.db].ops.quote_name
+        table = qn(model._meta.db_table)
+        column, pk_column = qn(field.column), qn(model._meta.pk.column)
+        # the term is sent untyped, as PostgreSQL reads it as the ORE type
+        seek = RawSQL(
+            f"(cs_ore_64_8_v1({table}.{column}), {table}.{pk_column})"
+            f" {'<' if descending else '>'} (%s, %s)",
+            [term, pk],
+            output_field=BooleanField(),
+        )
+        queryset = queryset.filter(seek)
+    rows = [_keyset_row(row, iterable, names) for row in queryset[: size + 1]]
+    return page(
+        [item for item, _ in rows], [key for _, key in rows], size, field.column
+    )
+
+
+def _values_names(queryset):
+    # field names of values_list(named=True) rows
+    if queryset._fields:
+        return list(queryset._fields)
+    query = queryset.query
+    return [*query.extra_select, *query.values_select, *query.annotation_select]
+
+
+def _keyset_row(row, iterable, names):
+    # (item, (pk, ORE term)) for a keyset_page() row
+    if isinstance(row, dict):
+        return row, (row.pop("eql_keyset_pk"), row.pop("eql_keyset_term"))
+    if isinstance(row, tuple):
+        item = row[:-2]
+        if iterable is FlatValuesListIterable:
+            item = item[0]
+        elif iterable is NamedValuesListIterable:
+            item = create_namedtuple_class(*names)(*item)
+        return item, (row[-1], row[-2])
+    return row, (row.__dict__.pop("eql_keyset_pk"), row.__dict__.pop("eql_keyset_term"))
+
+
+async def akeyset_page(queryset, field_name, after=None, size=50, descending=False):
+    return await sync_to_async(keyset_page)(
+        queryset, field_name, after, size, descending
+    )
+
+
+def extract(queryset, field_name, paths, *fields):
+    # Values at JSON paths of an EncryptedJsonb field, in one query, eg.
+    #   extract(Customer.objects.all(), "extra_info", ["$.num", "$.cat"], "id")
+    #   -> [{"id": 1, "$.num": 1, "$.cat": "a"}, ...]
+    # Missing paths are None.
+    field = queryset.model._meta.get_field(field_name)
+    paths = list(paths)
+    expressions = {
+        f"eql_extract_{i}": CsSteVecValueV1(
+            F(field_name),
+            Value(selector_term(path, field.eql_table, field.eql_column)),
+        )
+        for i, path in enumerate(paths)
+    }
+    rows = queryset.annotate(**expressions).values_list(*fields, *expressions)
+    return decode_extracted(rows, paths, fields)
+
+
+async def aextract(queryset, field_name, paths, *fields):
+    return await sync_to_async(extract)(queryset, field_name, paths, *fields)
+
+
+# Joins on encrypted fields
+# Rows with the same encrypted value have the same unique term (as long as
+# both fields use the same unique index settings, such as token filters), so
+# models without a relation between them can be matched on cs_unique_v1:
+#
+#   Order.objects.annotate(customer_id=join_subquery(Customer.objects.all(), "email", "customer_email"))
+#   join_exists(Order.objects.all(), "customer_email", Customer.objects.all(), "email")
+#
+# Django can only join models through relations, so these are correlated
+# subqueries. PostgreSQL runs EXISTS as a (hash) semi-join, and the subquery
+# as an index lookup with an EqlIndex(field=..., index_type="unique").
+
+
+def unique_equals(left, right):
+    # cs_unique_v1(left) = cs_unique_v1(right), for field names or expressions
+    left = F(left) if isinstance(left, str) else left
+    right = F(right) if isinstance(right, str) else right
+    return CsEquals(CsUniqueV1(left), CsUniqueV1(right))
+
+
+def join_exists(queryset, field_name, other, other_field_name):
+    # Rows of queryset with a row in other with the same encrypted value
+    return queryset.filter(
+        Exists(other.filter(unique_equals(other_field_name, OuterRef(field_name))))
+    )
+
+
+def join_subquery(other, other_field_name, outer_field_name, value="pk"):
+    # value of the first row of other with the same encrypted value as
+    # outer_field_name, to annotate
+    return Subquery(
+        other.filter(unique_equals(other_field_name, OuterRef(outer_field_name)))
+        .order_by()
+        .values(value)[:1]
+    )
+
+
+def search(queryset, field_names, terms, rank=False):
+    # Rows matching any of terms in any of the EncryptedText fields (with
+    # match indexes), eg.
+    #   search(Customer.objects.all(), ["name", "email"], ["ali", "dev"], rank=True)
+    # With rank=True rows are annotated with eql_rank, the number of terms
+    # they match, and ordered by it. Terms are encoded once per field.
+    terms = [terms] if isinstance(terms, str) else list(terms)
+    encoded = {}
+    for field_name in field_names:
+        field = queryset.model._meta.get_field(field_name)
+        encoded[field_name] = match_terms(field.eql_table, field.eql_column, terms)
+    matches = [
+        [
+            Q(
+                CsMatch(
+                    CsMatchV1(F(field_name)),
+                    CsMatchV1(Value(encoded[field_name][i])),
+                )
+            )
+            for field_name in field_names
+        ]
+        for i in range(len(terms))
+    ]
+    queryset = queryset.filter(reduce(or_, (m for term in matches for m in term)))
+    if rank:
+        queryset = queryset.annotate(
+            eql_rank=reduce(
+                add,
+                (
+                    Cast(
+                        ExpressionWrapper(
+                            reduce(or_, term), output_field=BooleanField()
+                        ),
+                        IntegerField(),
+                    )
+                    for term in matches
+                ),
+            )
+        ).order_by("-eql_rank", "pk")
+    return queryset
+
+
+def group_by_encrypted(queryset, field_name, path, aggregates=None):
+    # Groups by the value at path of an EncryptedJsonb field, in the database:
+    #   group_by_encrypted(Customer.objects.all(), "extra_info", "$.cat", {"count": Count("*")})
+    #   -> [{"count": 1, "$.cat": "a"}, {"count": 2, "$.cat": "b"}]
+    # Groups on cs_ste_vec_term_v1(field, selector), and takes each group's
+    # value with cs_grouped_value_v1(cs_ste_vec_value_v1(field, selector)).
+    # aggregates defaults to {"count": Count("*")}.
+    field = queryset.model._meta.get_field(field_name)
+    aggregates = aggregates or {"count": Count("*")}
+    selector = Value(selector_term(path, field.eql_table, field.eql_column))
+    rows = (
+        queryset.values(eql_group=CsSteVecTermV1(F(field_name), selector))
+        .annotate(
+            eql_value=CsGroupedValueV1(CsSteVecValueV1(F(field_name), selector)),
+            **aggregates,
+        )
+        .order_by("eql_group")
+        .values_list(*aggregates, "eql_value")
+    )
+    return decode_extracted(rows, [path], list(aggregates))
+
+
+async def agroup_by_encrypted(queryset, field_name, path, aggregates=None):
+    return await sync_to_async(group_by_encrypted)(
+        queryset, field_name, path, aggregates
+    )
+
+
+# Upserts keyed on encrypted fields
+# INSERT ... ON CONFLICT (cs_unique_v1(key)) DO UPDATE, which needs a unique
+# index on the key (EqlIndex(field=key, index_type="unique", unique=True)):
+#
+#   bulk_upsert(Customer.objects.all(), customers, "email")
+#   customer, created = upsert(Customer.objects.all(), "email", "alice@example.com", {"name": "Alice"})
+#
+# bulk_create(update_conflicts=True) can only name columns as the conflict
+# target, not the cs_unique_v1 expression the index is on, and
+# update_or_create() looks the row up before writing it, so neither works
+# for encrypted keys.
+
+
+def _upsert_sql(model, fields, key_field, update_fields, rows, connection):
+    qn = connection.ops.quote_name
+    opts = model._meta
+    row = "(%s)" % ", ".join(["%s"] * len(fields))
+    updates = ", ".join(
+        f"{qn(f.column)} = EXCLUDED.{qn(f.column)}"
+        for f in update_fields or [key_field]
+    )
+    return (
+        f"INSERT INTO {qn(opts.db_table)} ({', '.join(qn(f.column) for f in fields)})"
+        f" VALUES {', '.join([row] * rows)}"
+        f" ON CONFLICT (cs_unique_v1({qn(key_field.column)})) DO UPDATE SET {updates}"
+        f" RETURNING {qn(opts.pk.column)}, (xmax = 0)"
+    )
+
+
+def _upsert_fields(model, key, update_fields):
+    opts = model._meta
+    key_field = opts.get_field(key)
+    fields = [
+        f
+        for f in opts.concrete_fields
+        if f is not opts.pk and not getattr(f, "generated", False)
+    ]
+    if update_fields is None:
+        update_fields = [f for f in fields if f is not key_field]
+    else:
+        update_fields = [opts.get_field(name) for name in update_fields]
+    return key_field, fields, update_fields
+
+
+def _unique_token_filters(model, field):
+    # Token filters of field's unique index, from an EqlIndex or the loaded
+    # encrypt config
+    for index in model._meta.indexes:
+        if (
+            isinstance(index, EqlIndex)
+            and index.index_type == "unique"
+            and index.fields == [field.name]
+            and index.opts
+        ):
+            return index.opts.get("token_filters") or ()
+    return token_filters(field.eql_table, field.eql_column)
+
+
+def _upsert_batch(queryset, objs, key_field, fields, update_fields):
+    # Upserts objs in one statement, setting their primary keys, and returns
+    # [(obj, created)]. The last obj for a key wins, as PostgreSQL can't
+    # update a row twice in one statement.
+    db = queryset.db
+    connection = connections[db]
+    filters = _unique_token_filters(queryset.model, key_field)
+    groups = {}
+    for obj in objs:
+        value = key_field.value_from_object(obj)
+        key = unique_key(key_field.eql_type, value, filters)
+        # rows without a key never conflict
+        groups.setdefault(object() if key is None else key, []).append(obj)
+    rows = [group[-1] for group in groups.values()]
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, True), connection)
+        for obj in rows
+        for field in fields
+    ]
+    sql = _upsert_sql(
+        queryset.model, fields, key_field, update_fields, len(rows), connection
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+    upserted = []
+    for group, (pk, created) in zip(groups.values(), results):
+        for obj in group:
+            obj.pk = pk
+            obj._state.adding = False
+            obj._state.db = db
+            upserted.append((obj, created))
+    return upserted
+
+
+def bulk_upsert(queryset, objs, key, update_fields=None, batch_size=1000):
+    # Inserts objs, or updates update_fields (by default all but the primary
+    # key and key) of the rows with the same encrypted key, in one statement
+    # per batch_size objs. Sets the primary keys of objs and returns them.
+    objs = list(objs)
+    key_field, fields, update_fields = _upsert_fields(
+        queryset.model, key, update_fields
+    )
+    with transaction.atomic(using=queryset.db, savepoint=False):
+        for start in range(0, len(objs), batch_size):
+            end = start + batch_size
+            _upsert_batch(
+                queryset,
+                objs[start:end],
+                key_field,
+                fields,
+                update_fields,
+            )
+    return objs
+
+
+async def abulk_upsert(queryset, objs, key, update_fields=None, batch_size=1000):
+    return await sync_to_async(bulk_upsert)(
+        queryset, objs, key, update_fields, batch_size
+    )
+
+
+def upsert(queryset, key, value, defaults=None):
+    # Like update_or_create(), in one statement: creates a row with key set
+    # to value and defaults, or updates the defaults of the row with that
+    # encrypted value. Returns (obj, created).
+    defaults = defaults or {}
+    obj = queryset.model(**{key: value, **defaults})
+    key_field, fields, update_fields = _upsert_fields(
+        queryset.model, key, list(defaults)
+    )
+    [(obj, created)] = _upsert_batch(queryset, [obj], key_field, fields, update_fields)
+    stale = [f.attname for f in fields if f is not key_field and f not in update_fields]
+    if not created and stale:
+        obj.refresh_from_db(using=queryset.db, fields=stale)
+    return obj, created
+
+
+async def aupsert(queryset, key, value, defaults=None):
+    return await sync_to_async(upsert)(queryset, key, value, defaults)
+
+
+# Cached results (see eqlpy.cache)
+
+
+def cached(queryset, cache):
+    # Results of queryset as a list, read through cache (an EqlResultCache).
+    # Results are invalidated by writes to the tables of the queryset's model,
+    # joins and subqueries (eg. join_exists()), with invalidate_on_signals().
+    query = queryset.query.clone()
+    try:
+        sql, params = query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return []
+    tables = _query_tables(query)
+    # values(), values_list() and flat=True return the same SQL differently
+    key = make_key((queryset.db, queryset._iterable_class.__name__), sql, params)
+    if tables & _pending_tables(cache, queryset.db):
+        # uncommitted writes to these tables are visible on this connection
+        return list(queryset.all())
+    # loads a copy, so queryset's own result cache isn't filled
+    return cache.get_or_load(key, tables, lambda: list(queryset.all()))
+
+
+def _query_tables(query):
+    # Tables read by query: its model, its joins, and the tables of queries
+    # nested in it (Exists(), Subquery(), __in=queryset, union(), ...)
+    tables = {query.model._meta.db_table}
+    tables.update(alias.table_name for alias in query.alias_map.values())
+    nodes = [query.where, *query.annotations.values(), *query.order_by]
+    nodes.extend(query.combined_queries)
+    while nodes:
+        node = nodes.pop()
+        inner = node if isinstance(node, Query) else getattr(node, "query", None)
+        if isinstance(inner, Query):
+            tables |= _query_tables(inner)
+        elif hasattr(node, "get_source_expressions"):
+            nodes.extend(node.get_source_expressions())
+    return tables
+
+
+async def acached(queryset, cache):
+    return await sync_to_async(cached)(queryset, cache)
+
+
+class _InvalidateOnCommit:
+    # transaction.on_commit() callback, which also marks table as written by
+    # the transaction until it commits or rolls back
+    def __init__(self, cache, table):
+        self.cache = cache
+        self.table = table
+
+    def __call__(self):
+        self.cache.invalidate(self.table)
+
+
+def _pending_tables(cache, using):
+    # Tables written to for cache by the current transaction on using
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        return set()
+    return {
+        callback.table
+        for _, callback, *_ in connection.run_on_commit
+        if isinstance(callback, _InvalidateOnCommit) and callback.cache is cache
+    }
+
+
+def invalidate_on_signals(cache, sender=None):
+    # Invalidates cache on post_save and post_delete (of sender, or any
+    # model), and again when the transaction commits. Until then, cached()
+    # doesn't cache the tables written on that connection. Returns a function
+    # that disconnects the receivers.
+    def invalidate(sender, using, **kwargs):
+        table = sender._meta.db_table
+        cache.invalidate(table)
+        if connections[using].in_atomic_block:
+            transaction.on_commit(_InvalidateOnCommit(cache, table), using=using)
+
+    for signal in (post_save, post_delete):
+        signal.connect(invalidate, sender=sender, weak=False)
+
+    def disconnect():
+        for signal in (post_save, post_delete):
+            signal.disconnect(invalidate, sender=sender)
+
+    return disconnect
+
+
+class EncryptedQuerySet(models.QuerySet):
+    def keyset_page(self, field_name, after=None, size=50, descending=False):
+        return keyset_page(self, field_name, after, size, descending)
+
+    async def akeyset_page(self, field_name, after=None, size=50, descending=False):
+        return await akeyset_page(self, field_name, after, size, descending)
+
+    def extract(self, field_name, paths, *fields):
+        return extract(self, field_name, paths, *fields)
+
+    async def aextract(self, field_name, paths, *fields):
+        return await aextract(self, field_name, paths, *fields)
+
+    def join_exists(self, field_name, other, other_field_name):
+        return join_exists(self, field_name, other, other_field_name)
+
+    def search(self, field_names, terms, rank=False):
+        return search(self, field_names, terms, rank)
+
+    def bulk_upsert(self, objs, key, update_fields=None, batch_size=1000):
+        return bulk_upsert(self, objs, key, update_fields, batch_size)
+
+    async def abulk_upsert(self, objs, key, update_fields=None, batch_size=1000):
+        return await abulk_upsert(self, objs, key, update_fields, batch_size)
+
+    def upsert(self, key, value, defaults=None):
+        return upsert(self, key, value, defaults)
+
+    async def aupsert(self, key, value, defaults=None):
+        return await aupsert(self, key, value, defaults)
+
+    def group_by_encrypted(self, field_name, path, aggregates=None):
+        return group_by_encrypted(self, field_name, path, aggregates)
+
+    async def agroup_by_encrypted(self, field_name, path, aggregates=None):
+        return await agroup_by_encrypted(self, field_name, path, aggregates)
+
+    def cached(self, cache):
+        return cached(self, cache)
+
+    async def acached(self, cache):
+        return await acached(self, cache)
+
+    def stream(self, chunk_size=2000):
+        return self._streaming().iterator(chunk_size=chunk_size)
+
+    def astream(self, chunk_size=2000):
+        return self._streaming().aiterator(chunk_size=chunk_size)
+
+    def _streaming(self):
+        if self._iterable_class is not ModelIterable:
+            raise TypeError(
+                "stream() can only be used on querysets of model instances."
+            )
+        clone = self._chain()
+        clone._iterable_class = EncryptedModelIterable
+        return clone
+
+
+EncryptedManager = models.Manager.from_queryset(EncryptedQuerySet)
+
+
+# Database routing
+# EncryptedModelRouter sends reads and writes of models with encrypted fields
+# (or listed in EQLPY_PROXY_MODELS) to the database alias that goes through
+# CipherStash Proxy, and everything else straight to PostgreSQL:
+#
+#   DATABASES = {"default": {...proxy...}, "direct": {...postgres...}}
+#   DATABASE_ROUTERS = ["eqlpy.eqldjango.EncryptedModelRouter"]
+#   EQLPY_PROXY_DATABASE = "default"
+#   EQLPY_DIRECT_DATABASE = "direct"
+#   EQLPY_PROXY_MODELS = ["billing.Invoice"]
+#
+# Both aliases are the same database, so relations between their objects are
+# allowed and migrations only run through the proxy.
+#
+# Each alias has its own connection, and so its own transactions:
+# transaction.atomic() on one alias doesn't cover writes routed to the other.
+# Writes that must commit or roll back together go in eql_atomic(), which
+# routes every model to the proxy while it's open. Queries on plain models
+# that filter on, or select_related, encrypted models need the proxy too:
+# list the models in EQLPY_PROXY_MODELS, or use .using() or eql_atomic().
+
+_eql_proxy_only = ContextVar("eql_proxy_only", default=False)
+
+
+def has_encrypted_fields(model):
+    return any(isinstance(f, EncryptedValue) for f in model._meta.concrete_fields)
+
+
+def _proxy_database():
+    return getattr(settings, "EQLPY_PROXY_DATABASE", DEFAULT_DB_ALIAS)
+
+
+class EncryptedModelRouter:
+    def __init__(self, proxy=None, direct=None, proxy_models=None):
+        # Aliases and model labels default to the EQLPY_* settings
+        self._proxy = proxy
+        self._direct = direct
+        self._proxy_models = proxy_models
+        self._uses_proxy = {}
+
+    @property
+    def proxy(self):
+        return self._proxy or _proxy_database()
+
+    @property
+    def direct(self):
+        return self._direct or getattr(settings, "EQLPY_DIRECT_DATABASE", self.proxy)
+
+    @property
+    def proxy_models(self):
+        if self._proxy_models is None:
+            self._proxy_models = set(getattr(settings, "EQLPY_PROXY_MODELS", ()))
+        return self._proxy_models
+
+    def uses_proxy(self, model):
+        uses_proxy = self._uses_proxy.get(model)
+        if uses_proxy is None:
+            uses_proxy = self._uses_proxy[model] = (
+                model._meta.label in self.proxy_models or has_encrypted_fields(model)
+            )
+        return uses_proxy
+
+    def db_for_read(self, model, **hints):
+        if _eql_proxy_only.get() or self.uses_proxy(model):
+            return self.proxy
+        return self.direct
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {self.proxy, self.direct}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if self.proxy != self.direct and db in (self.proxy, self.direct):
+            return db == self.proxy
+        return None
+
+
+@contextmanager
+def eql_atomic(using=None, savepoint=True, durable=False):
+    # transaction.atomic() on the proxy alias (EQLPY_PROXY_DATABASE by
+    # default), with EncryptedModelRouter sending every model to it, so plain
+    # and encrypted writes in the block commit or roll back together
+    token = _eql_proxy_only.set(True)
+    try:
+        with transaction.atomic(
+            using=using or _proxy_database(), savepoint=savepoint, durable=durable
+        ):
+            yield
+    finally:
+        _eql_proxy_only.reset(token)
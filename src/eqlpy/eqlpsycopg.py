@@ -0,0 +1,242 @@
+from eqlpy.eql_codec import (
+    decode_extracted,
+    match_terms,
+    selector_term,
+    value_decoders,
+)
+from eqlpy.eql_config import equality_index
+
+# Helpers for using EQL directly with psycopg.
+#
+# EqlBatch queues independent queries on encrypted columns and sends them
+# with psycopg 3 pipeline mode, so N lookups cost one round trip to
+# CipherStash Proxy instead of N:
+#
+#   batch = EqlBatch(conn)
+#   alice = batch.unique(EqlText("Alice", "customers", "name"))
+#   adults = batch.eq(EqlInt(18, "customers", "age"))
+#   devs = batch.match(EqlText("dev", "customers", "name"), limit=10)
+#   batch.add("SELECT count(*) AS n FROM customers")
+#   results = batch.execute()
+#   results[alice]  # [{"id": 1, "name": "Alice", ...}]
+#
+# Results are lists of dict rows, in the order the queries were added, with
+# the searched column (plus any in decoders=) decoded to Python values.
+# With psycopg2, or a libpq without pipeline support, queries run one
+# after another on the same connection.
+
+
+def eql_eq(term, indexes=None):
+    # Equality condition on term's column through the cheapest index it has:
+    #   sql, param = eql_eq(EqlInt(31, "customers", "age"))
+    #   cur.execute(f"SELECT * FROM customers WHERE {sql}", (param,))
+    index = equality_index(term.eql_type, term.table, term.column, indexes)
+    cs_function = "cs_unique_v1" if index == "unique" else "cs_ore_64_8_v1"
+    return (
+        f"{cs_function}({term.column}) = {cs_function}(%s)",
+        term.to_db_format(index),
+    )
+
+
+def eql_search(table, columns, terms):
+    # Text search for any of terms in any of columns (all with match indexes):
+    #   condition, rank, params = eql_search("customers", ["name", "email"], ["ali", "dev"])
+    # condition matches rows with at least one of the terms, and rank is the
+    # number of terms a row matches. Each takes params.
+    terms = [terms] if isinstance(terms, str) else list(terms)
+    encoded = {column: match_terms(table, column, terms) for column in columns}
+    matches = [
+        [
+            (f"cs_match_v1({column}) @> cs_match_v1(%s)", encoded[column][i])
+            for column in columns
+        ]
+        for i in range(len(terms))
+    ]
+    condition = " OR ".join(sql for term in matches for sql, _ in term)
+    rank = " + ".join(
+        "(" + " OR ".join(sql for sql, _ in term) + ")::int" for term in matches
+    )
+    params = [param for term in matches for _, param in term]
+    return f"({condition})", rank, params
+
+
+def search(conn, table, columns, terms, select="*", rank=False, limit=None):
+    # Rows matching any of terms in any of columns, as in EqlBatch.search
+    batch = EqlBatch(conn)
+    batch.search(table, columns, terms, select, rank, limit)
+    return batch.execute()[0]
+
+
+def eql_extract(table, column, paths):
+    # Select list extracting paths of an encrypted JSONB column, and its params:
+    #   sql, params = eql_extract("customers", "extra_info", ["$.num", "$.cat"])
+    #   cur.execute(f"SELECT id, {sql} FROM customers", params)
+    #   decode_extracted(cur.fetchall(), ["$.num", "$.cat"], ["id"])
+    sql = ", ".join(f"cs_ste_vec_value_v1({column}, %s)" for _ in paths)
+    return sql, [selector_term(path, table, column) for path in paths]
+
+
+def extract(cur, table, column, paths, columns=(), where=None, params=()):
+    # Values at paths, with columns, as [{column or path: value}] in one query.
+    # where is SQL with %s placeholders for params.
+    paths = list(paths)
+    select_list, select_params = eql_extract(table, column, paths)
+    sql = f"SELECT {', '.join([*columns, select_list])} FROM {table}"
+    if where:
+        sql += f" WHERE {where}"
+    cur.execute(sql, [*select_params, *params])
+    return decode_extracted(cur.fetchall(), paths, columns)
+
+
+class EqlQuery:
+    def __init__(self, sql, params, decoders):
+        self.sql = sql
+        self.params = params
+        self.decoders = decoders
+
+    def decode(self, rows):
+        if not self.decoders:
+            return rows
+        for row in rows:
+            for column, decode in self.decoders.items():
+                if column in row:
+                    row[column] = decode(row[column])
+        return rows
+
+
+def _decoders(decoders):
+    # {column: eql_type or callable} -> {column: callable}
+    return {
+        column: value_decoders[d] if isinstance(d, str) else d
+        for column, d in (decoders or {}).items()
+    }
+
+
+class EqlBatch:
+    def __init__(self, conn):
+        self.conn = conn
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def add(self, sql, params=(), decoders=None):
+        # Returns the index of this query's result in execute()
+        self.queries.append(EqlQuery(sql, params, _decoders(decoders)))
+        return len(self.queries) - 1
+
+    def _search(self, term, condition, param, columns, limit, decoders):
+        sql = f"SELECT {columns} FROM {term.table} WHERE {condition}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.add(sql, (param,), {term.column: term.eql_type, **(decoders or {})})
+
+    def eq(self, term, columns="*", limit=None, decoders=None, indexes=None):
+        # Through the cheapest index term's column has (see eql_config)
+        condition, param = eql_eq(term, indexes)
+        return self._search(term, condition, param, columns, limit, decoders)
+
+    def unique(self, term, columns="*", limit=None, decoders=None):
+        return self._search(
+            term,
+            f"cs_unique_v1({term.column}) = cs_unique_v1(%s)",
+            term.to_db_format("unique"),
+            columns,
+            limit,
+            decoders,
+        )
+
+    def match(self, term, columns="*", limit=None, decoders=None):
+        return self._search(
+            term,
+            f"cs_match_v1({term.column}) @> cs_match_v1(%s)",
+            term.to_db_format("match"),
+            columns,
+            limit,
+            decoders,
+        )
+
+    def contains(self, term, columns="*", limit=None, decoders=None):
+        return self._search(
+            term,
+            f"cs_ste_vec_v1({term.column}) @> cs_ste_vec_v1(%s)",
+            term.to_db_format("ste_vec"),
+            columns,
+            limit,
+            decoders,
+        )
+
+    def search(
+        self,
+        table,
+        columns,
+        terms,
+        select="*",
+        rank=False,
+        limit=None,
+        decoders=None,
+    ):
+        # Rows matching any of terms in any of columns. With rank=True rows
+        # get an eql_rank (the number of terms they match) and come best first.
+        condition, rank_sql, params = eql_search(table, columns, terms)
+        if rank:
+            sql = (
+                f"SELECT {select}, {rank_sql} AS eql_rank FROM {table}"
+                f" WHERE {condition} ORDER BY eql_rank DESC"
+            )
+            params = params + params
+        else:
+            sql = f"SELECT {select} FROM {table} WHERE {condition}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.add(
+            sql, params, {**{c: "text" for c in columns}, **(decoders or {})}
+        )
+
+    def execute(self):
+        queries, self.queries = self.queries, []
+        if not queries:
+            return []
+        if _pipeline_supported(self.conn):
+            cursors = []
+            with self.conn.pipeline():
+                for query in queries:
+                    cur = self.conn.cursor()
+                    cur.execute(query.sql, query.params)
+                    cursors.append(cur)
+            rows = [_fetchall(cur) for cur in cursors]
+        else:
+            rows = [_execute(self.conn, query) for query in queries]
+        return [query.decode(r) for query, r in zip(queries, rows)]
+
+
+def _pipeline_supported(conn):
+    # psycopg 3 connections have pipeline(), which needs libpq 14 or later
+    if not hasattr(conn, "pipeline"):
+        return False
+    if not type(conn).__module__.startswith("psycopg."):
+        return True
+    from psycopg import Pipeline
+
+    return Pipeline.is_supported()
+
+
+def _fetchall(cur):
+    # rows of an executed cursor as dicts
+    try:
+        if cur.description is None:
+            return []
+        columns = [c[0] for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def _execute(conn, query):
+    cur = conn.cursor()
+    try:
+        cur.execute(query.sql, query.params)
+    except Exception:
+        cur.close()
+        raise
+    return _fetchall(cur)
@@ -0,0 +1,180 @@
+import json
+import re
+
+# Query plan checks for EQL queries.
+#
+# An encrypted filter only uses an index if the expression in the query
+# matches the functional index exactly (eg. cs_unique_v1(name) for
+# CREATE INDEX ... (cs_unique_v1(name))). Otherwise PostgreSQL silently
+# falls back to a sequential scan, calling cs_* functions on every row.
+#
+# assert_uses_index() runs EXPLAIN (FORMAT JSON) on a query and raises
+# EqlPlanError if the plan filters rows without an index:
+#
+#   assert_uses_index(Customer.objects.filter(name__eq="Alice"))
+#   assert_uses_index(select(Customer).where(...), session)
+#   assert_uses_index("SELECT ... WHERE cs_match_v1(name) @> cs_match_v1(%s)", cursor, params)
+#
+# Sequential scans are disabled (enable_seqscan = off) while explaining, so
+# that the result doesn't depend on how many rows the test database has:
+# a plan that still has a filtering Seq Scan has no index it can use.
+#
+# With pytest, add the eql_plan fixture with:
+#
+#   pytest_plugins = ["eqlpy.pytest_plugin"]
+#
+# and use it in tests as eql_plan.assert_uses_index(...).
+
+_CS_FUNCTION = re.compile(r"\bcs_\w+\(")
+
+SEQ_SCAN_NODES = ("Seq Scan",)
+
+try:
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.sql.expression import ClauseElement, Executable
+except ImportError:
+    Explain = None
+else:
+
+    class Explain(Executable, ClauseElement):
+        inherit_cache = False
+
+        def __init__(self, statement):
+            self.statement = statement
+
+    @compiles(Explain, "postgresql")
+    def compile_explain(element, compiler, **kw):
+        return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+class EqlPlanError(AssertionError):
+    def __init__(self, problems, plan):
+        self.problems = problems
+        self.plan = plan
+        super().__init__(
+            "Query plan doesn't use an index:\n"
+            + "\n".join(f"- {p}" for p in problems)
+            + "\n\n"
+            + json.dumps(plan, indent=2)
+        )
+
+
+def plan_nodes(plan):
+    # All nodes of a plan, as returned by EXPLAIN (FORMAT JSON)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    if isinstance(plan, list):
+        for entry in plan:
+            yield from plan_nodes(entry)
+        return
+    node = plan.get("Plan", plan)
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def check_plan(plan, tables=None):
+    # Returns a list of problems, empty if every filter uses an index.
+    # tables limits the checks to scans of those relations.
+    problems = []
+    for node in plan_nodes(plan):
+        relation = node.get("Relation Name")
+        node_filter = node.get("Filter")
+        if not node_filter or (tables is not None and relation not in tables):
+            continue
+        if node["Node Type"] in SEQ_SCAN_NODES:
+            problems.append(f"Seq Scan on {relation} with filter {node_filter}")
+        elif _CS_FUNCTION.search(node_filter):
+            problems.append(
+                f"{node['Node Type']} on {relation} filters on {node_filter} without an index"
+            )
+    return problems
+
+
+def explain_sql(cursor, sql, params=None, force_index=True):
+    if force_index:
+        cursor.execute("SET enable_seqscan = off")
+    try:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        (plan,) = cursor.fetchone()
+    finally:
+        if force_index:
+            cursor.execute("RESET enable_seqscan")
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def explain_queryset(queryset, force_index=True):
+    from django.db import connections
+
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if force_index:
+            cursor.execute("SET enable_seqscan = off")
+        try:
+            plan = queryset.explain(format="json")
+        finally:
+            if force_index:
+                cursor.execute("RESET enable_seqscan")
+    return json.loads(plan)
+
+
+def explain_statement(connection, statement, force_index=True):
+    # connection is a SQLAlchemy Connection or Session
+    from sqlalchemy import text
+
+    if force_index:
+        connection.execute(text("SET enable_seqscan = off"))
+    try:
+        plan = connection.execute(Explain(statement)).scalar()
+    finally:
+        if force_index:
+            connection.execute(text("RESET enable_seqscan"))
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def explain(query, connection=None, params=None, force_index=True):
+    # query is a Django QuerySet, a SQLAlchemy statement (with a Connection or
+    # Session), or SQL (with a DB-API cursor and params)
+    if isinstance(query, str):
+        if connection is None:
+            raise ValueError("A cursor is required to explain SQL")
+        return explain_sql(connection, query, params, force_index)
+    if hasattr(query, "query") and hasattr(query, "explain"):
+        return explain_queryset(query, force_index)
+    if connection is None:
+        raise ValueError("A connection or session is required to explain statements")
+    return explain_statement(connection, query, force_index)
+
+
+def assert_uses_index(
+    query, connection=None, params=None, tables=None, force_index=True
+):
+    plan = explain(query, connection, params, force_index)
+    problems = check_plan(plan, tables)
+    if problems:
+        raise EqlPlanError(problems, plan)
+    return plan
+
+
+class EqlPlanChecker:
+    def __init__(self, connection=None, tables=None, force_index=True):
+        self.connection = connection
+        self.tables = tables
+        self.force_index = force_index
+
+    def explain(self, query, connection=None, params=None):
+        return explain(query, connection or self.connection, params, self.force_index)
+
+    def problems(self, query, connection=None, params=None, tables=None):
+        return check_plan(
+            self.explain(query, connection, params), tables or self.tables
+        )
+
+    def assert_uses_index(self, query, connection=None, params=None, tables=None):
+        return assert_uses_index(
+            query,
+            connection or self.connection,
+            params,
+            tables or self.tables,
+            self.force_index,
+        )
@@ -0,0 +1,56 @@
+import base64
+import json
+from collections import namedtuple
+
+# Keyset ("seek") pagination over ORE-ordered encrypted columns.
+#
+# Rows are ordered by (cs_ore_64_8_v1(column), pk), and the next page starts
+# after the last row of the previous one:
+#
+#   WHERE (cs_ore_64_8_v1(column), pk) > (<last ORE term>, <last pk>)
+#   ORDER BY cs_ore_64_8_v1(column), pk
+#   LIMIT <size + 1>
+#
+# so every page costs the same as the first, unlike OFFSET. Pages select the
+# ORE term of each row (as text, as eql_keyset_term), and the cursor token
+# carries the last row's term and primary key. The term is ciphertext, so
+# tokens never contain a plaintext. As the position is in the token, the
+# next page doesn't depend on the last row still existing or having the
+# same value.
+#
+# eqldjango (keyset_page, EncryptedQuerySet.keyset_page) and eqlalchemy
+# (keyset_select, keyset_page) build these queries.
+
+KeysetPage = namedtuple("KeysetPage", ["items", "next_token"])
+
+
+def encode_token(column, pk, term):
+    data = json.dumps(
+        {"c": column, "k": pk, "t": term}, separators=(",", ":"), default=str
+    )
+    return base64.urlsafe_b64encode(data.encode()).rstrip(b"=").decode()
+
+
+def decode_token(column, token):
+    # Returns the primary key and ORE term of the last row of the previous page
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        token_column, pk, term = data["c"], data["k"], data["t"]
+        if not isinstance(term, str):
+            raise TypeError(term)
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid keyset pagination token")
+    if token_column != column:
+        raise ValueError(f"Keyset pagination token is for {token_column}, not {column}")
+    return pk, term
+
+
+def page(rows, keys, size, column):
+    # rows are up to size + 1 rows, the extra one telling whether there is
+    # a next page, and keys their (primary key, ORE term) pairs
+    items = list(rows[:size])
+    next_token = None
+    if len(rows) > size and items:
+        next_token = encode_token(column, *keys[size - 1])
+    return KeysetPage(items, next_token)
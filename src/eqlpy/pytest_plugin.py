@@ -0,0 +1,16 @@
+import pytest
+
+from eqlpy.explain import EqlPlanChecker
+
+# pytest fixtures for testing EQL queries. Enable them in the top-level
+# conftest.py with:
+#
+#   pytest_plugins = ["eqlpy.pytest_plugin"]
+#
+# This is kept out of eqlpy.explain so that importing that module never
+# imports pytest.
+
+
+@pytest.fixture
+def eql_plan():
+    return EqlPlanChecker()
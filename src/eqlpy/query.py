@@ -0,0 +1,218 @@
+import json
+from functools import lru_cache
+
+from eqlpy.eql_codec import payload, plaintext_encoders
+from eqlpy.eql_config import equality_index
+
+# A small query builder for using EQL without an ORM (eg. with psycopg):
+#
+#   name = column("customers", "name", "text")
+#   age = column("customers", "age", "int")
+#   query = select("customers", and_(match(name, "ali"), lt(age, 30)), columns=["id", name], limit=10)
+#   sql, params = query.render()
+#   cur.execute(sql, params)
+#
+# SQL only depends on the shape of a query (tables, columns, operators), not
+# on the values searched for, so it is rendered once per shape and cached.
+# Values are encoded into EQL terms and bound as %s parameters, which keeps
+# the SQL identical between calls, so drivers can reuse prepared statements
+# (eg. psycopg 3 prepares a query after it's been executed prepare_threshold
+# times).
+#
+# query.decoders maps the encrypted columns it selects to their EQL types,
+# as expected by eqlpsycopg.EqlBatch:
+#
+#   batch.add(sql, params, decoders=query.decoders)
+
+
+class Column:
+    def __init__(self, table, name, eql_type="text", indexes=None):
+        if eql_type not in plaintext_encoders:
+            raise ValueError(f"Unknown EQL type: {eql_type}")
+        self.table = table
+        self.name = name
+        self.eql_type = eql_type
+        self.indexes = tuple(indexes) if indexes else None
+
+    def term(self, value, query_type):
+        return json.dumps(
+            payload(
+                plaintext_encoders[self.eql_type](value),
+                self.table,
+                self.name,
+                query_type,
+            )
+        )
+
+    def __repr__(self):
+        return f"Column({self.table!r}, {self.name!r}, {self.eql_type!r})"
+
+
+def column(table, name, eql_type="text", indexes=None):
+    return Column(table, name, eql_type, indexes)
+
+
+class Predicate:
+    # template is formatted with the column name, and has one %s per value
+    def __init__(self, template, column, query_type, *values):
+        self.template = template
+        self.column = column
+        self.query_type = query_type
+        self.values = values
+
+    @property
+    def shape(self):
+        return ("predicate", self.template, self.column.name)
+
+    def params(self):
+        return [self.column.term(value, self.query_type) for value in self.values]
+
+
+class BooleanClause:
+    def __init__(self, operator, clauses):
+        if not clauses:
+            raise ValueError(f"{operator} needs at least one clause")
+        self.operator = operator
+        self.clauses = clauses
+
+    @property
+    def shape(self):
+        return (self.operator, tuple(clause.shape for clause in self.clauses))
+
+    def params(self):
+        return [param for clause in self.clauses for param in clause.params()]
+
+
+def and_(*clauses):
+    return BooleanClause("AND", clauses)
+
+
+def or_(*clauses):
+    return BooleanClause("OR", clauses)
+
+
+_EQUALS = {
+    "unique": "cs_unique_v1({c}) = cs_unique_v1(%s)",
+    "ore": "cs_ore_64_8_v1({c}) = cs_ore_64_8_v1(%s)",
+}
+
+
+def eq(column, value):
+    # Through the cheapest index the column has (see eql_config)
+    index = equality_index(column.eql_type, column.table, column.name, column.indexes)
+    return Predicate(_EQUALS[index], column, index, value)
+
+
+def match(column, value):
+    return Predicate("cs_match_v1({c}) @> cs_match_v1(%s)", column, "match", value)
+
+
+def contains(column, value):
+    return Predicate(
+        "cs_ste_vec_v1({c}) @> cs_ste_vec_v1(%s)", column, "ste_vec", value
+    )
+
+
+def lt(column, value):
+    return Predicate("cs_ore_64_8_v1({c}) < cs_ore_64_8_v1(%s)", column, "ore", value)
+
+
+def lte(column, value):
+    return Predicate("cs_ore_64_8_v1({c}) <= cs_ore_64_8_v1(%s)", column, "ore", value)
+
+
+def gt(column, value):
+    return Predicate("cs_ore_64_8_v1({c}) > cs_ore_64_8_v1(%s)", column, "ore", value)
+
+
+def gte(column, value):
+    return Predicate("cs_ore_64_8_v1({c}) >= cs_ore_64_8_v1(%s)", column, "ore", value)
+
+
+def between(column, low, high):
+    return Predicate(
+        "cs_ore_64_8_v1({c}) BETWEEN cs_ore_64_8_v1(%s) AND cs_ore_64_8_v1(%s)",
+        column,
+        "ore",
+        low,
+        high,
+    )
+
+
+class OrderBy:
+    # Ordering by an encrypted column goes through its ore index
+    def __init__(self, column, direction="ASC"):
+        self.column = column
+        self.direction = direction
+
+
+def asc(column):
+    return OrderBy(column, "ASC")
+
+
+def desc(column):
+    return OrderBy(column, "DESC")
+
+
+class Select:
+    def __init__(self, table, where=None, columns="*", order_by=(), limit=None):
+        self.table = table
+        self.where = where
+        self.columns = [columns] if isinstance(columns, (str, Column)) else columns
+        if isinstance(order_by, (Column, OrderBy)):
+            order_by = [order_by]
+        self.order_by = [o if isinstance(o, OrderBy) else asc(o) for o in order_by]
+        self.limit = limit
+
+    @property
+    def shape(self):
+        return (
+            "select",
+            self.table,
+            tuple(c.name if isinstance(c, Column) else c for c in self.columns),
+            None if self.where is None else self.where.shape,
+            tuple((o.column.name, o.direction) for o in self.order_by),
+            self.limit is not None,
+        )
+
+    @property
+    def decoders(self):
+        return {c.name: c.eql_type for c in self.columns if isinstance(c, Column)}
+
+    def params(self):
+        params = [] if self.where is None else self.where.params()
+        if self.limit is not None:
+            params.append(int(self.limit))
+        return params
+
+    def render(self):
+        return render(self.shape), self.params()
+
+
+def select(table, where=None, columns="*", order_by=(), limit=None):
+    return Select(table, where, columns, order_by, limit)
+
+
+@lru_cache(maxsize=512)
+def render(shape):
+    # SQL for the shape of a Select or a condition
+    kind = shape[0]
+    if kind == "predicate":
+        _, template, column_name = shape
+        return template.format(c=column_name)
+    if kind in ("AND", "OR"):
+        _, clauses = shape
+        if len(clauses) == 1:
+            return render(clauses[0])
+        return "(" + f" {kind} ".join(render(clause) for clause in clauses) + ")"
+    _, table, columns, where, order_by, has_limit = shape
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where is not None:
+        sql += f" WHERE {render(where)}"
+    if order_by:
+        sql += " ORDER BY " + ", ".join(
+            f"cs_ore_64_8_v1({name}) {direction}" for name, direction in order_by
+        )
+    if has_limit:
+        sql += " LIMIT %s"
+    return sql
@@ -0,0 +1,245 @@
+import unittest
+import json
+import os
+import sqlite3
+import tempfile
+import uuid
+from datetime import date
+from eqlpy.backfill import *
+from eqlpy.eql_codec import value_decoders
+
+
+class CountingConnection:
+    # Records the statements executed on a connection's cursors
+    def __init__(self, conn, statements):
+        self.conn = conn
+        self.statements = statements
+
+    def cursor(self):
+        return CountingCursor(self.conn.cursor(), self.statements)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class CountingCursor:
+    def __init__(self, cursor, statements):
+        self.cursor = cursor
+        self.statements = statements
+
+    def execute(self, sql, params=()):
+        self.statements.append(sql)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, params):
+        params = list(params)
+        self.statements.extend([sql] * len(params))
+        return self.cursor.executemany(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.dir.name, "backfill.db")
+        self.checkpoint = os.path.join(self.dir.name, "checkpoint.json")
+        conn = self.connect()
+        conn.execute(
+            "CREATE TABLE customers (id INTEGER PRIMARY KEY, age_plaintext INTEGER, age TEXT)"
+        )
+        conn.executemany(
+            "INSERT INTO customers (id, age_plaintext) VALUES (?, ?)",
+            [(i, None if i == 7 else i * 2) for i in range(1, 26)],
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.db)
+
+    def ages(self):
+        conn = self.connect()
+        rows = conn.execute("SELECT id, age FROM customers ORDER BY id").fetchall()
+        conn.close()
+        return {pk: value for pk, value in rows}
+
+    def backfill(self, **kwargs):
+        options = {"chunk_size": 4, "workers": 0, "paramstyle": "qmark"}
+        options.update(kwargs)
+        return backfill(
+            self.connect, "customers", "age_plaintext", "age", "int", **options
+        )
+
+    def test_encode_chunk(self):
+        self.assertEqual(
+            [
+                (
+                    json.dumps(
+                        {
+                            "k": "pt",
+                            "p": "2024-01-02",
+                            "i": {"t": "t", "c": "c"},
+                            "v": 1,
+                            "q": None,
+                        }
+                    ),
+                    1,
+                ),
+                (None, 2),
+            ],
+            encode_chunk("date", "t", "c", [(1, date(2024, 1, 2)), (2, None)]),
+        )
+
+    def test_backfill(self):
+        self.assertEqual(25, self.backfill())
+        ages = self.ages()
+        self.assertEqual(25, len(ages))
+        self.assertIsNone(ages[7])
+        self.assertEqual(
+            {pk: pk * 2 for pk in ages if pk != 7},
+            {pk: value_decoders["int"](v) for pk, v in ages.items() if pk != 7},
+        )
+        self.assertEqual("age", json.loads(ages[1])["i"]["c"])
+
+    def test_one_update_per_chunk(self):
+        statements = []
+
+        def target():
+            return CountingConnection(self.connect(), statements)
+
+        self.assertEqual(25, self.backfill(chunk_size=10, target_connect=target))
+        updates = [sql for sql in statements if sql.startswith("UPDATE")]
+        self.assertEqual(3, len(updates))
+        self.assertEqual(10, updates[0].count("(?, ?)"))
+        self.assertEqual(5, updates[2].count("(?, ?)"))
+        self.assertEqual(50, value_decoders["int"](self.ages()[25]))
+
+    def test_update_sql(self):
+        sql = Backfill(
+            self.connect, "customers", "age_plaintext", "age", "int", pk_type="uuid"
+        ).update_sql(2)
+        self.assertEqual(
+            "UPDATE customers SET age = eql_backfill.column1"
+            " FROM (VALUES (CAST(%s AS jsonb), CAST(%s AS uuid)), (%s, %s))"
+            " AS eql_backfill WHERE customers.id = eql_backfill.column2",
+            sql,
+        )
+
+    def test_uuid_primary_key(self):
+        # keys come back as UUID objects, like with psycopg 3
+        sqlite3.register_converter("UUID", lambda value: uuid.UUID(value.decode()))
+        sqlite3.register_adapter(uuid.UUID, str)
+        conn = self.connect()
+        conn.execute(
+            "CREATE TABLE orders (id UUID PRIMARY KEY, total INTEGER, enc TEXT)"
+        )
+        ids = sorted(uuid.uuid4() for _ in range(10))
+        conn.executemany(
+            "INSERT INTO orders (id, total) VALUES (?, ?)",
+            [(pk, n) for n, pk in enumerate(ids)],
+        )
+        conn.commit()
+        conn.close()
+
+        def connect():
+            return sqlite3.connect(self.db, detect_types=sqlite3.PARSE_DECLTYPES)
+
+        options = {
+            "chunk_size": 4,
+            "workers": 0,
+            "paramstyle": "qmark",
+            "checkpoint": self.checkpoint,
+        }
+        self.assertEqual(
+            10, backfill(connect, "orders", "total", "enc", "int", **options)
+        )
+        with open(self.checkpoint) as f:
+            self.assertEqual(str(ids[-1]), json.load(f)["last_pk"])
+        # resumes after the saved key
+        self.assertEqual(
+            10, backfill(connect, "orders", "total", "enc", "int", **options)
+        )
+
+    def test_resume_casts_pk_type(self):
+        self.assertIn(
+            "WHERE id > CAST(%s AS uuid)",
+            Backfill(
+                self.connect, "customers", "age_plaintext", "age", "int", pk_type="uuid"
+            ).select_next_sql,
+        )
+
+    def test_backfill_with_process_pool(self):
+        self.assertEqual(25, self.backfill(workers=2))
+        self.assertEqual(48, value_decoders["int"](self.ages()[24]))
+
+    def test_checkpoint_and_resume(self):
+        self.backfill(checkpoint=self.checkpoint, chunk_size=10)
+        with open(self.checkpoint) as f:
+            self.assertEqual(
+                {"key": "customers.age_plaintext->age", "last_pk": 25, "rows": 25},
+                json.load(f),
+            )
+
+        # rows after the checkpoint are picked up by the next run
+        conn = self.connect()
+        conn.execute("INSERT INTO customers (id, age_plaintext) VALUES (26, 52)")
+        conn.execute("UPDATE customers SET age = 'untouched' WHERE id = 1")
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(26, self.backfill(checkpoint=self.checkpoint))
+        ages = self.ages()
+        self.assertEqual("untouched", ages[1])
+        self.assertEqual(52, value_decoders["int"](ages[26]))
+
+    def test_resume_after_failure(self):
+        calls = []
+
+        def failing_log(message):
+            calls.append(message)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.backfill(checkpoint=self.checkpoint, log=failing_log)
+        self.assertEqual(
+            8, Checkpoint(self.checkpoint, "customers.age_plaintext->age").load().rows
+        )
+        self.assertIsNone(self.ages()[9])
+
+        self.assertEqual(25, self.backfill(checkpoint=self.checkpoint))
+        self.assertEqual(18, value_decoders["int"](self.ages()[9]))
+
+    def test_checkpoint_for_other_column(self):
+        with open(self.checkpoint, "w") as f:
+            json.dump({"key": "customers.other->age", "last_pk": 3, "rows": 3}, f)
+        with self.assertRaises(ValueError):
+            self.backfill(checkpoint=self.checkpoint)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            Backfill(self.connect, "customers", "age_plaintext", "age", "integer")
+        with self.assertRaises(ValueError):
+            Backfill(self.connect, "customers", "a", "b", "int", paramstyle="named")
+
+
+class ThrottleTest(unittest.TestCase):
+    def test_throttle(self):
+        now = [0.0]
+        sleeps = []
+        throttle = Throttle(100, clock=lambda: now[0], sleep=sleeps.append)
+        throttle.wait(50)
+        self.assertEqual([0.5], sleeps)
+        now[0] = 2.0
+        throttle.wait(50)
+        self.assertEqual([0.5], sleeps)
+
+    def test_no_throttle(self):
+        sleeps = []
+        Throttle(None, sleep=sleeps.append).wait(1000)
+        self.assertEqual([], sleeps)
@@ -0,0 +1,97 @@
+import unittest
+from eqlpy.cache import *
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class EqlResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = EqlResultCache(maxsize=2, ttl=10, max_rows=3, clock=self.clock)
+        self.loads = []
+
+    def load(self, rows):
+        def load():
+            self.loads.append(rows)
+            return rows
+
+        return load
+
+    def test_read_through(self):
+        key = make_key("default", "SELECT 1", ["term"])
+        self.assertEqual([1], self.cache.get_or_load(key, ["t"], self.load([1])))
+        self.assertEqual([1], self.cache.get_or_load(key, ["t"], self.load([2])))
+        self.assertEqual([[1]], self.loads)
+        self.assertEqual(CacheInfo(1, 1, 1, 2), self.cache.info())
+
+    def test_keys(self):
+        self.assertEqual(make_key("a", "sql", [1, "x"]), make_key("a", "sql", (1, "x")))
+        self.assertNotEqual(make_key("a", "sql", [1]), make_key("a", "sql", ["1"]))
+        self.assertNotEqual(make_key("a", "sql", [1]), make_key("b", "sql", [1]))
+
+    def test_ttl(self):
+        self.cache.get_or_load("k", ["t"], self.load([1]))
+        self.clock.now = 9.9
+        self.cache.get_or_load("k", ["t"], self.load([2]))
+        self.clock.now = 10
+        self.assertEqual([3], self.cache.get_or_load("k", ["t"], self.load([3])))
+
+    def test_lru_eviction(self):
+        self.cache.get_or_load("a", ["t"], self.load(["a"]))
+        self.cache.get_or_load("b", ["t"], self.load(["b"]))
+        self.cache.get_or_load("a", ["t"], self.load(["a2"]))
+        self.cache.get_or_load("c", ["t"], self.load(["c"]))
+        self.assertEqual(["a"], self.cache.get_or_load("a", ["t"], self.load(["a3"])))
+        self.assertEqual(["b2"], self.cache.get_or_load("b", ["t"], self.load(["b2"])))
+        self.assertEqual(2, self.cache.info().size)
+
+    def test_max_rows(self):
+        self.cache.get_or_load("k", ["t"], self.load([1, 2, 3, 4]))
+        self.cache.get_or_load("k", ["t"], self.load([1, 2, 3, 4]))
+        self.assertEqual(2, len(self.loads))
+
+    def test_invalidate(self):
+        self.cache.get_or_load("a", ["countries"], self.load(["a"]))
+        self.cache.get_or_load("b", ["plans", "countries"], self.load(["b"]))
+        self.cache.invalidate("plans")
+        self.assertEqual(
+            ["a"], self.cache.get_or_load("a", ["countries"], self.load([]))
+        )
+        self.assertEqual(
+            ["b2"],
+            self.cache.get_or_load("b", ["plans", "countries"], self.load(["b2"])),
+        )
+        self.cache.invalidate("countries")
+        self.assertEqual(0, self.cache.info().size)
+
+    def test_invalidated_while_loading(self):
+        def load():
+            self.cache.invalidate("countries")
+            return ["stale"]
+
+        self.assertEqual(["stale"], self.cache.get_or_load("a", ["countries"], load))
+        self.assertEqual(
+            ["new"], self.cache.get_or_load("a", ["countries"], self.load(["new"]))
+        )
+
+    def test_clear(self):
+        def load():
+            self.cache.clear()
+            return ["stale"]
+
+        self.cache.get_or_load("a", ["t"], self.load(["a"]))
+        self.cache.clear()
+        self.assertEqual(0, self.cache.info().size)
+        self.cache.get_or_load("b", ["t"], load)
+        self.assertEqual(0, self.cache.info().size)
+
+    def test_results_are_copies(self):
+        rows = self.cache.get_or_load("a", ["t"], self.load([1]))
+        rows.append(2)
+        self.assertEqual([1], self.cache.get_or_load("a", ["t"], self.load([])))
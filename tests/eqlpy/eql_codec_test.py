@@ -0,0 +1,182 @@
+import unittest
+import json
+from datetime import date
+from eqlpy.eql_codec import *
+from eqlpy import eql_types, eqlalchemy, eqldjango
+from eqlpy.eql_types import EqlJsonb, EqlText
+
+
+class EqlCodecTest(unittest.TestCase):
+    def test_payload(self):
+        self.assertEqual(
+            {
+                "k": "pt",
+                "p": "1",
+                "i": {"t": "table", "c": "column"},
+                "v": 1,
+                "q": None,
+            },
+            payload("1", "table", "column"),
+        )
+
+    def test_encoder(self):
+        encode = encoder("boolean", "table", "column", "ore")
+        self.assertEqual("true", encode(True)["p"])
+        self.assertEqual("ore", encode(False)["q"])
+        self.assertIsNone(encode(None))
+
+    def test_value_decoders(self):
+        encoded = payload("2024-11-01", "table", "column")
+        self.assertEqual(date(2024, 11, 1), value_decoders["date"](encoded))
+        self.assertEqual(date(2024, 11, 1), value_decoders["date"](json.dumps(encoded)))
+        self.assertIsNone(value_decoders["date"](None))
+
+    def test_batch_decoders(self):
+        values = [payload("1.5", "t", "c"), None, json.dumps(payload("-2", "t", "c"))]
+        self.assertEqual([1.5, None, -2.0], batch_decoders["double"](values))
+
+    def test_boolean(self):
+        self.assertEqual("true", plaintext_encoders["boolean"](True))
+        self.assertEqual("false", plaintext_encoders["boolean"](False))
+        self.assertTrue(plaintext_decoders["boolean"]("true"))
+        self.assertTrue(plaintext_decoders["boolean"]("TRUE"))
+        self.assertFalse(plaintext_decoders["boolean"]("false"))
+
+    def test_boolean_strings(self):
+        self.assertEqual("true", plaintext_encoders["boolean"]("True"))
+        self.assertEqual("true", plaintext_encoders["boolean"]("true"))
+        self.assertEqual("false", plaintext_encoders["boolean"]("FALSE"))
+        bound = eqlalchemy.EncryptedBoolean("t", "c").process_bind_param("True", None)
+        self.assertEqual("true", json.loads(bound)["p"])
+        self.assertEqual(
+            "true", json.loads(eql_types.EqlBool("true", "t", "c").to_db_format())["p"]
+        )
+        with self.assertRaises(ValueError):
+            plaintext_encoders["boolean"]("yes")
+
+    def test_boolean_other_types(self):
+        for value in (1, 0, 1.0, None, [True]):
+            with self.assertRaises(TypeError):
+                plaintext_encoders["boolean"](value)
+
+    def test_unique_key(self):
+        downcase = [{"kind": "downcase"}]
+        self.assertEqual("Alice", unique_key("text", "Alice"))
+        self.assertEqual("alice", unique_key("text", "Alice", downcase))
+        self.assertEqual("ALICE", unique_key("text", "Alice", [{"kind": "upcase"}]))
+        self.assertEqual("1", unique_key("int", 1, downcase))
+        self.assertIsNone(unique_key("text", None, downcase))
+        with self.assertRaises(ValueError):
+            unique_key("text", "Alice", [{"kind": "stem"}])
+
+    def test_selector_term(self):
+        term = selector_term("$.a.b", "customers", "extra_info")
+        self.assertEqual(
+            EqlJsonb("$.a.b", "customers", "extra_info").to_db_format("ejson_path"),
+            term,
+        )
+        self.assertIs(term, selector_term("$.a.b", "customers", "extra_info"))
+
+    def test_match_terms(self):
+        self.assertEqual(
+            [
+                EqlText(term, "customers", "name").to_db_format("match")
+                for term in ["ali", "dev"]
+            ],
+            match_terms("customers", "name", ["ali", "dev"]),
+        )
+
+    def test_decode_extracted(self):
+        rows = [
+            (1, payload("1", "t", "c"), json.dumps(payload('"a"', "t", "c"))),
+            (2, None, payload('{"x": [1]}', "t", "c")),
+        ]
+        self.assertEqual(
+            [
+                {"id": 1, "$.num": 1, "$.cat": "a"},
+                {"id": 2, "$.num": None, "$.cat": {"x": [1]}},
+            ],
+            decode_extracted(rows, ["$.num", "$.cat"], ["id"]),
+        )
+        self.assertEqual([], decode_extracted([], ["$.num"]))
+
+
+# The same value must have the same payload and decode to the same value
+# whichever integration is used.
+class CrossIntegrationEquivalenceTest(unittest.TestCase):
+    cases = [
+        ("int", -2, eql_types.EqlInt, eqlalchemy.EncryptedInt, eqldjango.EncryptedInt),
+        (
+            "boolean",
+            True,
+            eql_types.EqlBool,
+            eqlalchemy.EncryptedBoolean,
+            eqldjango.EncryptedBoolean,
+        ),
+        (
+            "boolean",
+            False,
+            eql_types.EqlBool,
+            eqlalchemy.EncryptedBoolean,
+            eqldjango.EncryptedBoolean,
+        ),
+        (
+            "date",
+            date(2024, 11, 17),
+            eql_types.EqlDate,
+            eqlalchemy.EncryptedDate,
+            eqldjango.EncryptedDate,
+        ),
+        (
+            "double",
+            -0.01,
+            eql_types.EqlFloat,
+            eqlalchemy.EncryptedFloat,
+            eqldjango.EncryptedFloat,
+        ),
+        (
+            "text",
+            "test string",
+            eql_types.EqlText,
+            eqlalchemy.EncryptedUtf8Str,
+            eqldjango.EncryptedText,
+        ),
+        (
+            "jsonb",
+            {"key": ["value"], "num": 1},
+            eql_types.EqlJsonb,
+            eqlalchemy.EncryptedJsonb,
+            eqldjango.EncryptedJsonb,
+        ),
+    ]
+
+    def test_encode(self):
+        for eql_type, value, eql_class, alchemy_class, django_class in self.cases:
+            with self.subTest(eql_type=eql_type, value=value):
+                expected = json.dumps(encoder(eql_type, "table", "column")(value))
+                django_field = django_class(eql_table="table", eql_column="column")
+                self.assertEqual(
+                    expected, eql_class(value, "table", "column").to_db_format()
+                )
+                self.assertEqual(
+                    expected,
+                    alchemy_class("table", "column").process_bind_param(value, None),
+                )
+                self.assertEqual(
+                    expected, json.dumps(django_field.get_prep_value(value))
+                )
+
+    def test_decode(self):
+        for eql_type, value, eql_class, alchemy_class, django_class in self.cases:
+            with self.subTest(eql_type=eql_type, value=value):
+                parsed = encoder(eql_type, "table", "column")(value)
+                self.assertEqual(value, value_decoders[eql_type](parsed))
+                self.assertEqual(value, eql_class.from_parsed_json(parsed))
+                self.assertEqual(
+                    value,
+                    alchemy_class("table", "column").process_result_value(parsed, None),
+                )
+                self.assertEqual(
+                    value, django_class().from_db_value(parsed, None, None)
+                )
+                self.assertEqual([value], django_class().from_db_values([parsed]))
@@ -0,0 +1,105 @@
+import unittest
+import json
+from eqlpy.eql_config import *
+
+CONFIG_DATA = {
+    "v": 1,
+    "tables": {
+        "customers": {
+            "name": {"cast_as": "text", "indexes": {"unique": {}, "match": {}}},
+            "email": {
+                "cast_as": "text",
+                "indexes": {"unique": {"token_filters": [{"kind": "downcase"}]}},
+            },
+            "age": {"cast_as": "int", "indexes": {"ore": {}, "unique": {}}},
+            "weight": {"cast_as": "double", "indexes": {"ore": {}}},
+            "notes": {"cast_as": "text", "indexes": {"match": {}}},
+        }
+    },
+}
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.row
+
+
+class EqlConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = get_config()
+
+    def tearDown(self):
+        set_config(self.previous)
+
+    def test_from_data(self):
+        config = EqlConfig.from_data(CONFIG_DATA)
+        self.assertEqual({"unique", "match"}, config.indexes("customers", "name"))
+        self.assertEqual({"ore"}, config.indexes("customers", "weight"))
+        self.assertIsNone(config.indexes("customers", "missing"))
+        self.assertIsNone(config.indexes("missing", "name"))
+
+    def test_index_options(self):
+        config = EqlConfig.from_data(CONFIG_DATA)
+        self.assertEqual(
+            {"token_filters": [{"kind": "downcase"}]},
+            config.index_options("customers", "email", "unique"),
+        )
+        self.assertEqual({}, config.index_options("customers", "name", "unique"))
+        set_config(config)
+        self.assertEqual([{"kind": "downcase"}], token_filters("customers", "email"))
+        self.assertEqual((), token_filters("customers", "name"))
+
+    def test_from_json_string(self):
+        config = EqlConfig.from_data(json.dumps(CONFIG_DATA))
+        self.assertEqual({"ore", "unique"}, config.indexes("customers", "age"))
+
+    def test_from_empty_data(self):
+        self.assertEqual({}, EqlConfig.from_data(None).tables)
+        self.assertEqual({}, EqlConfig.from_data({"v": 1}).tables)
+
+    def test_load(self):
+        cursor = FakeCursor((CONFIG_DATA,))
+        config = EqlConfig.load(cursor)
+        self.assertEqual(("active",), cursor.executed[0][1])
+        self.assertIn("cs_configuration_v1", cursor.executed[0][0])
+        self.assertEqual({"ore"}, config.indexes("customers", "weight"))
+
+    def test_load_without_config(self):
+        self.assertEqual({}, EqlConfig.load(FakeCursor(None)).tables)
+
+    def test_load_config_sets_config(self):
+        config = load_config(FakeCursor((CONFIG_DATA,)))
+        self.assertIs(config, get_config())
+
+    def test_declare(self):
+        config = EqlConfig()
+        config.declare("customers", "age", ["ore"])
+        self.assertEqual({"ore"}, config.indexes("customers", "age"))
+        config.declare("customers", "email", {"unique": {"token_filters": []}})
+        self.assertEqual({"unique"}, config.indexes("customers", "email"))
+
+    def test_equality_index_defaults(self):
+        set_config(EqlConfig())
+        self.assertEqual("unique", equality_index("text", "customers", "name"))
+        self.assertEqual("ore", equality_index("int", "customers", "age"))
+
+    def test_equality_index_from_config(self):
+        set_config(EqlConfig.from_data(CONFIG_DATA))
+        self.assertEqual("unique", equality_index("int", "customers", "age"))
+        self.assertEqual("ore", equality_index("double", "customers", "weight"))
+        # no equality index in the config
+        self.assertEqual("unique", equality_index("text", "customers", "notes"))
+
+    def test_declared_indexes_take_precedence(self):
+        set_config(EqlConfig.from_data(CONFIG_DATA))
+        self.assertEqual("ore", equality_index("int", "customers", "age", ["ore"]))
+        self.assertEqual(
+            "unique", equality_index("double", "customers", "weight", ["unique"])
+        )
@@ -0,0 +1,49 @@
+import unittest
+import re
+from eqlpy.eql_standin import STANDIN_SQL, install
+from eqlpy import eqlalchemy, eqldjango
+
+
+class EqlStandinTest(unittest.TestCase):
+    def defined_functions(self):
+        return set(
+            re.findall(
+                r"CREATE OR REPLACE (?:FUNCTION|AGGREGATE) (cs_\w+)\(", STANDIN_SQL
+            )
+        )
+
+    def test_defines_query_functions(self):
+        defined = self.defined_functions()
+        for function in [
+            eqlalchemy.cs_unique_v1.name,
+            eqlalchemy.cs_match_v1.name,
+            eqlalchemy.cs_ore_64_8_v1.name,
+            eqlalchemy.cs_ste_vec_v1.name,
+            eqlalchemy.cs_ste_vec_value_v1.name,
+            eqlalchemy.cs_ste_vec_term_v1.name,
+            eqlalchemy.cs_grouped_value_v1.name,
+        ]:
+            self.assertIn(function, defined)
+
+    def test_defines_index_functions(self):
+        defined = self.defined_functions()
+        for function, _, _ in eqldjango.EqlIndex.index_functions.values():
+            self.assertIn(function, defined)
+
+    def test_defines_config_functions(self):
+        defined = self.defined_functions()
+        for function in [
+            "cs_add_column_v1",
+            "cs_add_index_v1",
+            "cs_remove_index_v1",
+            "cs_encrypt_v1",
+            "cs_activate_v1",
+            "cs_refresh_encrypt_config",
+        ]:
+            self.assertIn(function, defined)
+
+    def test_install(self):
+        executed = []
+        cursor = type("Cursor", (), {"execute": lambda self, sql: executed.append(sql)})
+        install(cursor())
+        self.assertEqual([STANDIN_SQL], executed)
@@ -1,5 +1,8 @@
 import unittest
 import json
+import asyncio
+import threading
+from contextlib import contextmanager, nullcontext
 from datetime import date
 from eqlpy.eql_types import *
 
@@ -143,5 +146,122 @@ class EqlTest(unittest.TestCase):
         )
 
 
+class CodecHookTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    @contextmanager
+    def record(self, operation, attributes):
+        self.calls.append(("enter", operation, attributes))
+        yield
+        self.calls.append(("exit", operation))
+
+    def test_encode_and_decode(self):
+        with codec_hook(self.record):
+            encoded = EqlInt(1, "customers", "age").to_db_format("ore")
+            decoded = EqlInt.from_parsed_json(json.loads(encoded))
+        self.assertEqual(1, decoded)
+        attributes = {
+            "eql.type": "int",
+            "eql.table": "customers",
+            "eql.column": "age",
+            "eql.query_type": "ore",
+        }
+        self.assertEqual(
+            [
+                ("enter", "encode", attributes),
+                ("exit", "encode"),
+                ("enter", "decode", attributes),
+                ("exit", "decode"),
+            ],
+            self.calls,
+        )
+
+    def test_rows(self):
+        parsed = json.loads(EqlText("a", "customers", "name").to_db_format())
+        with codec_hook(self.record):
+            row = EqlRow({"name": EqlText.from_parsed_json}, {"id": 1, "name": parsed})
+        self.assertEqual({"id": 1, "name": "a"}, row.row)
+        self.assertEqual(
+            ["decode_row", "decode", "decode", "decode_row"],
+            [call[1] for call in self.calls],
+        )
+        self.assertEqual({"eql.columns": 1}, self.calls[0][2])
+
+    def test_several_hooks(self):
+        other = []
+        with codec_hook(self.record), codec_hook(
+            lambda operation, attributes: nullcontext(other.append(operation))
+        ):
+            EqlText("a", "customers", "name").to_db_format()
+        self.assertEqual(["encode"], other)
+        self.assertEqual(2, len(self.calls))
+
+    def test_removed(self):
+        add_codec_hook(self.record)
+        remove_codec_hook(self.record)
+        EqlText("a", "customers", "name").to_db_format()
+        self.assertEqual([], self.calls)
+
+    def test_nested_same_hook(self):
+        with codec_hook(self.record):
+            with codec_hook(self.record):
+                pass
+            EqlText("a", "customers", "name").to_db_format()
+        self.assertEqual(["encode", "encode"], [call[1] for call in self.calls])
+
+    def encode_in_thread(self):
+        thread = threading.Thread(target=EqlText("a", "customers", "name").to_db_format)
+        thread.start()
+        thread.join()
+
+    def test_added_hook_in_other_threads(self):
+        # Hooks added at startup trace every thread, eg. WSGI workers
+        add_codec_hook(self.record)
+        try:
+            self.encode_in_thread()
+        finally:
+            remove_codec_hook(self.record)
+        self.assertEqual(["encode", "encode"], [call[1] for call in self.calls])
+
+    def test_added_hook_in_running_task(self):
+        async def encode_later(started, added):
+            started.set()
+            await added.wait()
+            EqlText("a", "customers", "name").to_db_format()
+
+        async def main():
+            started, added = asyncio.Event(), asyncio.Event()
+            task = asyncio.create_task(encode_later(started, added))
+            await started.wait()
+            add_codec_hook(self.record)
+            added.set()
+            await task
+
+        try:
+            asyncio.run(main())
+        finally:
+            remove_codec_hook(self.record)
+        self.assertEqual(2, len(self.calls))
+
+    def test_remove_one_copy(self):
+        add_codec_hook(self.record)
+        add_codec_hook(self.record)
+        try:
+            remove_codec_hook(self.record)
+            EqlText("a", "customers", "name").to_db_format()
+        finally:
+            remove_codec_hook(self.record)
+        self.assertEqual(2, len(self.calls))
+
+    def test_scoped_hook_not_in_other_threads(self):
+        # codec_hook() only traces the thread or task that entered it
+        with codec_hook(self.record):
+            self.encode_in_thread()
+            self.assertEqual([], self.calls)
+            EqlText("a", "customers", "name").to_db_format()
+        self.assertEqual(2, len(self.calls))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,30 @@
 import unittest
+from types import SimpleNamespace
 from datetime import date
 
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    column,
+    create_engine,
+    func,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.types import NullType
+from sqlalchemy.dialects import postgresql
 from eqlpy.eqlalchemy import *
+from eqlpy.eqlalchemy import _eql_binds, _eql_execution
+from eqlpy.cache import EqlResultCache
+from eqlpy.eql_codec import selector_term
+from eqlpy.eql_config import EqlConfig, get_config, set_config
+from eqlpy.keyset import encode_token
 
 
 class EqlAlchemyTest(unittest.TestCase):
@@ -94,3 +117,666 @@ class EqlAlchemyTest(unittest.TestCase):
         for col_type in col_types:
             bound = col_type("table", "column").process_bind_param(None, None)
             self.assertIsNone(bound)
+
+
+class EqlAlchemyEqualityTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = get_config()
+        set_config(EqlConfig())
+
+    def tearDown(self):
+        set_config(self.previous)
+
+    def compile(self, expression):
+        compiled = expression.compile(dialect=postgresql.dialect())
+        return str(compiled), list(compiled.params.values())
+
+    def test_eql_eq_default_index(self):
+        sql, params = self.compile(
+            eql_eq(Column("age", EncryptedInt("customers", "age")), 31)
+        )
+        self.assertEqual(
+            "cs_ore_64_8_v1(age) = cs_ore_64_8_v1(%(cs_ore_64_8_v1_1)s)", sql
+        )
+        self.assertEqual("31", json.loads(params[0])["p"])
+        self.assertEqual("ore", json.loads(params[0])["q"])
+
+        sql, params = self.compile(
+            eql_eq(Column("name", EncryptedUtf8Str("customers", "name")), "Alice")
+        )
+        self.assertEqual("cs_unique_v1(name) = cs_unique_v1(%(cs_unique_v1_1)s)", sql)
+        self.assertEqual("unique", json.loads(params[0])["q"])
+
+    def test_eql_eq_declared_index(self):
+        column = Column("age", EncryptedInt("customers", "age", indexes=["unique"]))
+        sql, params = self.compile(eql_eq(column, 31))
+        self.assertEqual("cs_unique_v1(age) = cs_unique_v1(%(cs_unique_v1_1)s)", sql)
+
+    def test_eql_eq_index_from_config(self):
+        config = EqlConfig()
+        config.declare("customers", "weight", ["unique", "ore"])
+        set_config(config)
+        column = Column("weight", EncryptedFloat("customers", "weight"))
+        self.assertEqual("unique", column.type.equality_index())
+
+
+class EqlAlchemyRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.age = Column("age", EncryptedInt("customers", "age"))
+
+    def compile(self, expression):
+        compiled = expression.compile(dialect=postgresql.dialect())
+        return str(compiled), [json.loads(p) for p in compiled.params.values()]
+
+    def test_comparisons(self):
+        for condition, operator in [
+            (eql_lt, "<"),
+            (eql_lte, "<="),
+            (eql_gt, ">"),
+            (eql_gte, ">="),
+        ]:
+            sql, params = self.compile(condition(self.age, 30))
+            self.assertEqual(
+                f"cs_ore_64_8_v1(age) {operator} cs_ore_64_8_v1(%(cs_ore_64_8_v1_1)s)",
+                sql,
+            )
+            self.assertEqual([("30", "ore")], [(p["p"], p["q"]) for p in params])
+
+    def test_between(self):
+        sql, params = self.compile(eql_between(self.age, 18, 30))
+        self.assertEqual(
+            "cs_ore_64_8_v1(age) BETWEEN cs_ore_64_8_v1(%(cs_ore_64_8_v1_1)s) "
+            "AND cs_ore_64_8_v1(%(cs_ore_64_8_v1_2)s)",
+            sql,
+        )
+        self.assertEqual(["18", "30"], [p["p"] for p in params])
+
+    def test_range(self):
+        sql, _ = self.compile(eql_range(self.age, 18, 30))
+        self.assertEqual(
+            "cs_ore_64_8_v1(age) >= cs_ore_64_8_v1(%(cs_ore_64_8_v1_1)s) "
+            "AND cs_ore_64_8_v1(age) < cs_ore_64_8_v1(%(cs_ore_64_8_v1_2)s)",
+            sql,
+        )
+        sql, _ = self.compile(eql_range(self.age, 18, 30, bounds="[]"))
+        self.assertIn("BETWEEN", sql)
+        sql, params = self.compile(eql_range(self.age, high=30, bounds="(]"))
+        self.assertEqual(
+            "cs_ore_64_8_v1(age) <= cs_ore_64_8_v1(%(cs_ore_64_8_v1_1)s)", sql
+        )
+
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            eql_range(self.age, 18, 30, bounds="[[")
+        with self.assertRaises(ValueError):
+            eql_range(self.age)
+
+
+class CsFunctionTest(unittest.TestCase):
+    def compile(self, expression):
+        return str(expression.compile(dialect=postgresql.dialect()))
+
+    def test_arity(self):
+        @create_cs_function("cs_test_v1")
+        def cs_test_v1():
+            pass
+
+        self.assertEqual("cs_test_v1()", self.compile(cs_test_v1()))
+        self.assertEqual(
+            "cs_test_v1(a, b, c)",
+            self.compile(cs_test_v1(column("a"), column("b"), column("c"))),
+        )
+        with self.assertRaises(ValueError):
+            cs_ste_vec_value_v1(column("a"))
+        with self.assertRaises(ValueError):
+            cs_unique_v1(column("a"), column("b"))
+
+    def test_type(self):
+        self.assertIsInstance(cs_ste_vec_term_v1(column("a")).type, NullType)
+        value = cs_ste_vec_value_v1(
+            column("a"), "b", type_=EncryptedJsonb("customers", "extra_info")
+        )
+        self.assertIsInstance(value.type, EncryptedJsonb)
+        processor = value.type.result_processor(postgresql.dialect(), None)
+        self.assertEqual(
+            {"x": 1}, processor({"k": "pt", "p": '{"x": 1}', "i": {}, "v": 1})
+        )
+        self.assertIsNone(processor(None))
+
+    def test_type_in_cache_key(self):
+        def value(type_=None):
+            return cs_ste_vec_value_v1(column("a"), "b", type_=type_)
+
+        self.assertEqual(value()._generate_cache_key(), value()._generate_cache_key())
+        self.assertNotEqual(
+            value(EncryptedJsonb("customers", "extra_info"))._generate_cache_key(),
+            value(EncryptedFloat("customers", "extra_info"))._generate_cache_key(),
+        )
+
+
+class JoinTest(unittest.TestCase):
+    def setUp(self):
+        metadata = MetaData()
+        self.customers = Table(
+            "customers",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("email", EncryptedUtf8Str("customers", "email")),
+        )
+        self.orders = Table(
+            "orders",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("customer_email", EncryptedUtf8Str("orders", "customer_email")),
+        )
+
+    def compile(self, element):
+        return str(element.compile(dialect=postgresql.dialect()))
+
+    def test_eql_on(self):
+        self.assertEqual(
+            "cs_unique_v1(orders.customer_email) = cs_unique_v1(customers.email)",
+            self.compile(eql_on(self.orders.c.customer_email, self.customers.c.email)),
+        )
+
+    def test_eql_join(self):
+        o, c = self.orders, self.customers
+        statement = select(o.c.id, c.c.id).select_from(
+            eql_join(o, c, o.c.customer_email, c.c.email, isouter=True)
+        )
+        self.assertIn(
+            "FROM orders LEFT OUTER JOIN customers ON "
+            "cs_unique_v1(orders.customer_email) = cs_unique_v1(customers.email)",
+            self.compile(statement),
+        )
+
+    def test_eql_index(self):
+        index = eql_index(self.orders.c.customer_email)
+        self.assertIn(index, self.orders.indexes)
+        self.assertEqual(
+            "CREATE INDEX orders_customer_email_unq ON orders (cs_unique_v1(customer_email))",
+            self.compile(CreateIndex(index)),
+        )
+        index = eql_index(self.customers.c.email, "match", name="email_match")
+        self.assertEqual(
+            "CREATE INDEX email_match ON customers USING gin (cs_match_v1(email))",
+            self.compile(CreateIndex(index)),
+        )
+        with self.assertRaises(ValueError):
+            eql_index(self.customers.c.email, "hash")
+
+    def test_eql_index_unique(self):
+        index = eql_index(self.customers.c.email, unique=True)
+        self.assertEqual(
+            "CREATE UNIQUE INDEX customers_email_unq ON customers (cs_unique_v1(email))",
+            self.compile(CreateIndex(index)),
+        )
+
+    def test_upsert_statement(self):
+        statement = upsert_statement(
+            self.orders,
+            [{"customer_email": "a@example.com"}, {"customer_email": "b@example.com"}],
+            self.orders.c.customer_email,
+        )
+        self.assertEqual(
+            "INSERT INTO orders (customer_email) VALUES"
+            " (%(customer_email_m0)s), (%(customer_email_m1)s)"
+            " ON CONFLICT (cs_unique_v1(customer_email))"
+            " DO UPDATE SET customer_email = excluded.customer_email",
+            self.compile(statement),
+        )
+        statement = upsert_statement(
+            self.orders,
+            [{"id": 1, "customer_email": "a@example.com"}],
+            self.orders.c.customer_email,
+        )
+        self.assertTrue(
+            self.compile(statement).endswith("DO UPDATE SET id = excluded.id")
+        )
+
+    def test_upsert_token_filters(self):
+        executed = []
+        session = SimpleNamespace(execute=executed.append)
+        rows = [
+            {"customer_email": "Alice@example.com"},
+            {"customer_email": "alice@example.com"},
+            {"customer_email": None},
+            {"customer_email": None},
+        ]
+        previous = get_config()
+        try:
+            config = EqlConfig()
+            config.declare(
+                "orders",
+                "customer_email",
+                {"unique": {"token_filters": [{"kind": "downcase"}]}},
+            )
+            set_config(config)
+            self.assertEqual(
+                3, upsert(session, self.orders, rows, self.orders.c.customer_email)
+            )
+            set_config(EqlConfig())
+            self.assertEqual(
+                4, upsert(session, self.orders, rows, self.orders.c.customer_email)
+            )
+        finally:
+            set_config(previous)
+        params = executed[0].compile(dialect=postgresql.dialect()).params
+        self.assertEqual(["alice@example.com", None, None], list(params.values()))
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.customers = Table(
+            "customers",
+            MetaData(),
+            Column("id", Integer, primary_key=True),
+            Column("name", EncryptedUtf8Str("customers", "name")),
+            Column("email", EncryptedUtf8Str("customers", "email")),
+        )
+
+    def test_search(self):
+        c = self.customers.c
+        search = EqlSearch([c.name, c.email], ["ali", "dev"])
+        compiled = (
+            select(c.id, search.rank.label("rank"))
+            .where(search.condition)
+            .compile(dialect=postgresql.dialect())
+        )
+        sql = " ".join(str(compiled).split())
+        self.assertIn(
+            "WHERE (cs_match_v1(customers.name) @> cs_match_v1(%(param_1)s)) "
+            "OR (cs_match_v1(customers.email) @> cs_match_v1(%(param_2)s)) "
+            "OR (cs_match_v1(customers.name) @> cs_match_v1(%(param_3)s)) "
+            "OR (cs_match_v1(customers.email) @> cs_match_v1(%(param_4)s))",
+            sql,
+        )
+        self.assertIn(
+            "SELECT customers.id, CAST((cs_match_v1(customers.name) @> cs_match_v1(%(param_1)s)) "
+            "OR (cs_match_v1(customers.email) @> cs_match_v1(%(param_2)s)) AS INTEGER) + ",
+            sql,
+        )
+        # terms are bound once, and shared by the condition and the rank
+        self.assertEqual(
+            [("ali", "name"), ("ali", "email"), ("dev", "name"), ("dev", "email")],
+            [
+                (json.loads(p)["p"], json.loads(p)["i"]["c"])
+                for p in compiled.params.values()
+            ],
+        )
+
+    def test_search_select(self):
+        c = self.customers.c
+        statement = search_select(select(c.id), [c.name], "ali", rank=True)
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("ORDER BY CAST(", sql)
+        self.assertIn("AS INTEGER) DESC", sql)
+
+
+class ExtractTest(unittest.TestCase):
+    def test_extract_columns(self):
+        column = Column("extra_info", EncryptedJsonb("customers", "extra_info"))
+        columns = extract_columns(column, ["$.num", "$.cat"])
+        compiled = select(*columns).compile(dialect=postgresql.dialect())
+        self.assertEqual(
+            "SELECT cs_ste_vec_value_v1(extra_info, %(cs_ste_vec_value_v1_1)s) AS eql_extract_0, "
+            "cs_ste_vec_value_v1(extra_info, %(cs_ste_vec_value_v1_2)s) AS eql_extract_1",
+            str(compiled),
+        )
+        self.assertEqual(
+            ["$.num", "$.cat"],
+            [json.loads(p)["p"] for p in compiled.params.values()],
+        )
+
+
+class GroupByTest(unittest.TestCase):
+    def test_group_by_select(self):
+        customers = Table(
+            "customers",
+            MetaData(),
+            Column("extra_info", EncryptedJsonb("customers", "extra_info")),
+        )
+        compiled = group_by_select(customers.c.extra_info, "$.cat").compile(
+            dialect=postgresql.dialect()
+        )
+        sql = " ".join(str(compiled).split())
+        self.assertIn(
+            "SELECT count(*) AS count, cs_grouped_value_v1(cs_ste_vec_value_v1(customers.extra_info, ",
+            sql,
+        )
+        self.assertIn("GROUP BY cs_ste_vec_term_v1(customers.extra_info, ", sql)
+        self.assertIn("ORDER BY cs_ste_vec_term_v1(customers.extra_info, ", sql)
+        terms = set(compiled.params.values())
+        self.assertEqual({selector_term("$.cat", "customers", "extra_info")}, terms)
+
+
+class KeysetTest(unittest.TestCase):
+    def setUp(self):
+        class Base(DeclarativeBase):
+            pass
+
+        class Customer(Base):
+            __tablename__ = "customers"
+            id = Column(Integer, primary_key=True)
+            start_date = Column(EncryptedDate("customers", "start_date"))
+
+        self.Customer = Customer
+
+    def compile(self, statement):
+        return str(statement.compile(dialect=postgresql.dialect()))
+
+    def test_first_page(self):
+        sql = self.compile(
+            keyset_select(select(self.Customer), self.Customer.start_date, size=10)
+        )
+        self.assertIn(
+            "ORDER BY cs_ore_64_8_v1(customers.start_date) ASC, customers.id ASC", sql
+        )
+        self.assertIn("LIMIT %(param_1)s", sql)
+        self.assertNotIn("WHERE", sql)
+
+    def test_term_column(self):
+        sql = self.compile(
+            keyset_select(select(self.Customer.id), self.Customer.start_date)
+        )
+        self.assertIn(
+            "SELECT customers.id, CAST(cs_ore_64_8_v1(customers.start_date) AS VARCHAR)"
+            " AS eql_keyset_term",
+            sql,
+        )
+
+    def test_next_page(self):
+        token = encode_token("start_date", 42, "(term)")
+        statement = keyset_select(
+            select(self.Customer), self.Customer.start_date, after=token
+        )
+        sql = self.compile(statement)
+        self.assertIn(
+            "WHERE (cs_ore_64_8_v1(customers.start_date), customers.id) > "
+            "(%(param_1)s, %(param_2)s)",
+            sql,
+        )
+        self.assertNotIn("eql_keyset.", sql)
+        self.assertEqual(
+            ["(term)", 42],
+            list(statement.compile(dialect=postgresql.dialect()).params.values())[:2],
+        )
+
+    def test_descending(self):
+        token = encode_token("start_date", 42, "(term)")
+        sql = self.compile(
+            keyset_select(
+                select(self.Customer),
+                self.Customer.start_date,
+                after=token,
+                descending=True,
+            )
+        )
+        self.assertIn("customers.id) < (%(param_1)s, %(param_2)s)", sql)
+        self.assertIn(
+            "ORDER BY cs_ore_64_8_v1(customers.start_date) DESC, customers.id DESC",
+            sql,
+        )
+
+    def test_token_for_other_column(self):
+        with self.assertRaises(ValueError):
+            keyset_select(
+                select(self.Customer),
+                self.Customer.start_date,
+                after=encode_token("age", 1, "(term)"),
+            )
+
+
+class InstrumentTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.customers = Table(
+            "customers",
+            MetaData(),
+            Column("id", Integer, primary_key=True),
+            Column("name", EncryptedUtf8Str("customers", "name")),
+        )
+        self.customers.metadata.create_all(self.engine)
+        self.stats = instrument(self.engine)
+
+    def tearDown(self):
+        uninstrument(self.stats)
+
+    def test_records_statements(self):
+        with self.engine.begin() as conn:
+            conn.execute(self.customers.insert(), [{"name": "Alice"}, {"name": "Bob"}])
+            names = conn.execute(select(self.customers.c.name)).scalars().all()
+        self.assertEqual(["Alice", "Bob"], names)
+        snapshot = self.stats.snapshot()
+        insert = next(v for k, v in snapshot.items() if k.startswith("INSERT"))
+        self.assertEqual(2, insert["encodes"])
+        self.assertEqual(2, insert["encrypted_binds"])
+        self.assertEqual(
+            sum(len(self.customers.c.name.type.term(n)) for n in ["Alice", "Bob"]),
+            insert["bytes_sent"],
+        )
+        query = snapshot["SELECT customers.name \nFROM customers"]
+        self.assertEqual(1, query["executions"])
+        self.assertEqual(2, query["decodes"])
+        self.assertEqual([], query["functions"])
+        self.assertGreater(query["latency"], 0)
+
+    def test_snapshot_reset(self):
+        with self.engine.connect() as conn:
+            conn.execute(select(self.customers.c.id))
+        self.assertEqual(1, len(self.stats.snapshot(reset=True)))
+        self.assertEqual({}, self.stats.snapshot())
+
+    def test_uninstrument(self):
+        uninstrument(self.stats)
+        with self.engine.connect() as conn:
+            conn.execute(select(self.customers.c.id))
+        self.assertEqual({}, self.stats.snapshot())
+
+    def test_other_engines(self):
+        other = create_engine("sqlite://")
+        self.customers.metadata.create_all(other)
+        with self.engine.begin() as conn:
+            conn.execute(self.customers.insert(), [{"name": "Alice"}])
+            conn.execute(select(self.customers.c.name)).all()
+        with other.begin() as conn:
+            conn.execute(self.customers.insert(), [{"name": "Bob"}, {"name": "Eve"}])
+            conn.execute(select(self.customers.c.name)).all()
+        uninstrument(self.stats)
+        with self.engine.connect() as conn:
+            conn.execute(select(self.customers.c.name)).all()
+        snapshot = self.stats.snapshot()
+        insert = next(v for k, v in snapshot.items() if k.startswith("INSERT"))
+        self.assertEqual((1, 1), (insert["executions"], insert["encodes"]))
+        query = snapshot["SELECT customers.name \nFROM customers"]
+        self.assertEqual((1, 1), (query["executions"], query["decodes"]))
+
+    def test_errors(self):
+        with self.engine.connect() as conn:
+            with self.assertRaises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.execute(select(self.customers.c.name)).all()
+        self.assertIsNone(_eql_execution.get())
+
+    def test_export(self):
+        snapshots = []
+        exporter = self.stats.export(snapshots.append, interval=60)
+        with self.engine.connect() as conn:
+            conn.execute(select(self.customers.c.id))
+        exporter.stop()
+        exporter.export()
+        self.assertEqual(1, len(snapshots))
+        self.assertEqual({}, self.stats.snapshot())
+
+    def test_functions_and_binds(self):
+        stats = EqlStatementStats(
+            "SELECT * FROM customers WHERE cs_match_v1(name) @> cs_match_v1(%s)"
+            " AND cs_ore_64_8_v1(age) < cs_ore_64_8_v1(%s)"
+        )
+        self.assertEqual(["cs_match_v1", "cs_ore_64_8_v1"], stats.functions)
+        term = EncryptedInt("customers", "age").term(3, "ore")
+        self.assertEqual((1, len(term)), _eql_binds({"a": term, "b": "x", "c": 3}))
+        self.assertEqual((2, 2 * len(term)), _eql_binds([(term,), (term, 1)], True))
+
+
+class CacheBase(DeclarativeBase):
+    pass
+
+
+class Country(CacheBase):
+    __tablename__ = "countries"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(EncryptedUtf8Str("countries", "name"))
+
+
+class Plan(CacheBase):
+    __tablename__ = "plans"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class CachedExecuteTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        CacheBase.metadata.create_all(engine)
+        self.session = Session(engine)
+        self.session.add_all([Country(id=1, name="New Zealand"), Country(id=2)])
+        self.session.commit()
+        self.cache = EqlResultCache()
+        self.remove = invalidate_on_flush(self.cache, self.session)
+
+    def tearDown(self):
+        self.remove()
+        self.session.close()
+
+    def test_cached_rows(self):
+        statement = select(Country.id, Country.name).where(Country.id == 1)
+        self.assertEqual(
+            [(1, "New Zealand")],
+            cached_execute(self.session, statement, self.cache),
+        )
+        self.assertEqual(
+            [(1, "New Zealand")],
+            cached_execute(self.session, statement, self.cache),
+        )
+        other = select(Country.id, Country.name).where(Country.id == 2)
+        self.assertEqual([(2, None)], cached_execute(self.session, other, self.cache))
+        self.assertEqual((1, 2, 2), self.cache.info()[:3])
+
+    def test_cached_entities(self):
+        statement = select(Country).order_by(Country.id)
+        countries = cached_execute(self.session, statement, self.cache)
+        self.assertEqual(["New Zealand", None], [c.name for c in countries])
+        self.assertNotIn(countries[0], self.session)
+        self.assertEqual(countries, cached_execute(self.session, statement, self.cache))
+
+    def test_invalidated_by_flush(self):
+        statement = select(Country.name).where(Country.id == 1)
+        cached_execute(self.session, statement, self.cache)
+        country = self.session.get(Country, 1)
+        country.name = "Aotearoa"
+        self.session.flush()
+        self.assertEqual(
+            [("Aotearoa",)], cached_execute(self.session, statement, self.cache)
+        )
+
+    def test_invalidated_by_orm_update(self):
+        statement = select(Country.name).where(Country.id == 2)
+        cached_execute(self.session, statement, self.cache)
+        self.session.execute(
+            update(Country).where(Country.id == 2).values(name="Australia")
+        )
+        self.assertEqual(
+            [("Australia",)], cached_execute(self.session, statement, self.cache)
+        )
+
+    def test_uncommitted_writes_not_cached(self):
+        statement = select(Country.name).where(Country.id == 1)
+        self.session.get(Country, 1).name = "Aotearoa"
+        self.session.flush()
+        self.assertEqual(
+            [("Aotearoa",)], cached_execute(self.session, statement, self.cache)
+        )
+        self.assertEqual(0, self.cache.info().size)
+        self.session.rollback()
+        self.assertEqual(
+            [("New Zealand",)], cached_execute(self.session, statement, self.cache)
+        )
+        self.assertEqual(1, self.cache.info().size)
+
+    def test_invalidated_on_commit(self):
+        self.session.get(Country, 1).name = "Aotearoa"
+        self.session.flush()
+        # read by another connection before the commit
+        self.cache.get_or_load("stale", ["countries"], lambda: ["New Zealand"])
+        self.session.commit()
+        self.assertEqual(0, self.cache.info().size)
+        self.assertEqual(
+            [("Aotearoa",)],
+            cached_execute(
+                self.session, select(Country.name).where(Country.id == 1), self.cache
+            ),
+        )
+
+
+class EqlRoutingSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.proxy = create_engine("sqlite://")
+        self.direct = create_engine("sqlite://")
+        for engine in (self.proxy, self.direct):
+            CacheBase.metadata.create_all(engine)
+        self.session = EqlRoutingSession(bind=self.proxy, direct_bind=self.direct)
+
+    def tearDown(self):
+        self.session.close()
+
+    def count(self, engine, model):
+        with engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(model)).scalar()
+
+    def test_binds(self):
+        self.assertIs(self.direct, self.session.get_bind(Plan))
+        self.assertIs(self.proxy, self.session.get_bind(Country))
+        self.assertIs(self.direct, self.session.get_bind(clause=select(Plan.name)))
+        self.assertIs(
+            self.proxy,
+            self.session.get_bind(
+                clause=select(Plan.name).join(Country, Country.id == Plan.id)
+            ),
+        )
+        self.assertIs(
+            self.proxy,
+            self.session.get_bind(
+                clause=select(Plan.name).where(
+                    Plan.id.in_(select(Country.id).scalar_subquery())
+                )
+            ),
+        )
+        self.assertIs(self.proxy, self.session.get_bind(clause=text("SELECT 1")))
+
+    def test_flush(self):
+        self.session.add_all([Plan(id=1, name="basic"), Country(id=1, name="NZ")])
+        self.session.commit()
+        self.assertEqual(
+            (1, 0), (self.count(self.direct, Plan), self.count(self.proxy, Plan))
+        )
+        self.assertEqual(
+            (0, 1), (self.count(self.direct, Country), self.count(self.proxy, Country))
+        )
+
+    def test_proxy_only(self):
+        with self.session.proxy_only():
+            self.assertIs(self.proxy, self.session.get_bind(Plan))
+            self.session.add(Plan(id=1, name="basic"))
+            self.session.flush()
+        self.session.commit()
+        self.assertEqual(
+            (0, 1), (self.count(self.direct, Plan), self.count(self.proxy, Plan))
+        )
+        self.assertIs(self.direct, self.session.get_bind(Plan))
+
+    def test_without_direct_bind(self):
+        session = EqlRoutingSession(bind=self.proxy)
+        self.assertIs(self.proxy, session.get_bind(Plan))
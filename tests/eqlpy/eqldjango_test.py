@@ -1,6 +1,10 @@
 import unittest
 import os
+import json
+from types import SimpleNamespace
 from eqlpy.eqldjango import *
+from eqlpy.eqldjango import _decode_chunk, _unique_token_filters, _upsert_sql
+from eqlpy.eql_config import EqlConfig, get_config, set_config
 from datetime import date
 
 
@@ -80,3 +84,336 @@ class EqlDjangoTest(unittest.TestCase):
         prep_value = col_type.get_prep_value(0)
         self.assertEqual("some_table", prep_value["i"]["t"])
         self.assertEqual("some_column", prep_value["i"]["c"])
+
+    def test_from_db_values(self):
+        col_type = EncryptedInt()
+        values = [
+            col_type.get_prep_value(1),
+            None,
+            json.dumps(col_type.get_prep_value(3)),
+        ]
+        self.assertEqual([1, None, 3], col_type.from_db_values(values))
+
+    def test_decode_chunk(self):
+        age, name = EncryptedInt(), EncryptedText()
+        chunk = [
+            (1, age.get_prep_value(31), name.get_prep_value("Alice")),
+            (2, None, name.get_prep_value("Bob")),
+        ]
+        decoders = [(1, age.from_db_values), (2, name.from_db_values)]
+        self.assertEqual(
+            [(1, 31, "Alice"), (2, None, "Bob")],
+            list(_decode_chunk(chunk, decoders)),
+        )
+
+    def test_decode_empty_chunk(self):
+        self.assertEqual([], list(_decode_chunk([], [])))
+
+
+class EqlIndexTest(unittest.TestCase):
+    def setUp(self):
+        field = EncryptedText(eql_table="customers", eql_column="name")
+        field.set_attributes_from_name("name")
+        self.model = SimpleNamespace(
+            _meta=SimpleNamespace(
+                db_table="customers",
+                get_field=lambda name: field,
+                pk=SimpleNamespace(column="id"),
+            )
+        )
+        self.schema_editor = SimpleNamespace(
+            quote_name=lambda name: f'"{name}"', quote_value=lambda value: f"'{value}'"
+        )
+
+    def test_create_statements(self):
+        index = EqlIndex(field="name", index_type="match", name="customers_name_mch")
+        self.assertEqual(
+            [
+                "SELECT cs_add_index_v1('customers', 'name', 'match', 'text', '{}')",
+                'CREATE INDEX "customers_name_mch" ON "customers" USING GIN (cs_match_v1("name"))',
+            ],
+            index.create_statements(self.model, self.schema_editor),
+        )
+
+    def test_create_statements_keyset(self):
+        index = EqlIndex(
+            field="name", index_type="ore", keyset=True, name="customers_name_ore"
+        )
+        self.assertEqual(
+            'CREATE INDEX "customers_name_ore" ON "customers" (cs_ore_64_8_v1("name"), "id")',
+            index.create_statements(self.model, self.schema_editor)[1],
+        )
+        self.assertTrue(index.deconstruct()[2]["keyset"])
+        with self.assertRaises(ValueError):
+            EqlIndex(field="name", index_type="unique", keyset=True)
+
+    def test_create_statements_concurrently(self):
+        index = EqlIndex(
+            field="name", index_type="unique", unique=True, name="customers_name_unq"
+        )
+        self.assertEqual(
+            'CREATE UNIQUE INDEX CONCURRENTLY "customers_name_unq" ON "customers" (cs_unique_v1("name"))',
+            index.create_statements(self.model, self.schema_editor, concurrently=True)[
+                1
+            ],
+        )
+
+    def test_create_statements_ste_vec_prefix(self):
+        index = EqlIndex(field="name", index_type="ste_vec", name="customers_name_stv")
+        self.assertEqual(
+            "SELECT cs_add_index_v1('customers', 'name', 'ste_vec', 'text', "
+            '\'{"prefix": "customers/name"}\')',
+            index.create_statements(self.model, self.schema_editor)[0],
+        )
+
+    def test_remove_statements(self):
+        index = EqlIndex(field="name", index_type="ore", name="customers_name_ore")
+        self.assertEqual(
+            [
+                'DROP INDEX IF EXISTS "customers_name_ore"',
+                "SELECT cs_remove_index_v1('customers', 'name', 'ore')",
+            ],
+            index.remove_statements(self.model, self.schema_editor),
+        )
+
+    def test_set_name_with_model(self):
+        unique = EqlIndex(field="name", index_type="unique")
+        match = EqlIndex(field="name", index_type="match")
+        unique.set_name_with_model(self.model)
+        match.set_name_with_model(self.model)
+        self.assertTrue(unique.name.endswith("_unq"))
+        self.assertTrue(match.name.endswith("_mch"))
+        self.assertNotEqual(unique.name, match.name)
+
+    def test_deconstruct(self):
+        index = EqlIndex(field="name", index_type="ore", cast_as="int", name="idx")
+        self.assertEqual(index, index.clone())
+        self.assertEqual(
+            (
+                "eqlpy.eqldjango.EqlIndex",
+                (),
+                {"name": "idx", "field": "name", "index_type": "ore", "cast_as": "int"},
+            ),
+            index.deconstruct(),
+        )
+
+    def test_invalid_index_type(self):
+        with self.assertRaises(ValueError):
+            EqlIndex(field="name", index_type="fuzzy")
+
+    def test_field_deconstruct_eql_indexes(self):
+        _, _, _, kwargs = EncryptedText(eql_indexes=["unique", "match"]).deconstruct()
+        self.assertEqual(["unique", "match"], kwargs["eql_indexes"])
+        _, _, _, kwargs = EncryptedText().deconstruct()
+        self.assertNotIn("eql_indexes", kwargs)
+
+
+class EqlUpsertTest(unittest.TestCase):
+    def test_upsert_sql(self):
+        fields = []
+        for name in ["email", "balance"]:
+            field = EncryptedInt() if name == "balance" else EncryptedText()
+            field.set_attributes_from_name(name)
+            fields.append(field)
+        model = SimpleNamespace(
+            _meta=SimpleNamespace(db_table="accounts", pk=SimpleNamespace(column="id"))
+        )
+        connection = SimpleNamespace(
+            ops=SimpleNamespace(quote_name=lambda name: f'"{name}"')
+        )
+        email, balance = fields
+        self.assertEqual(
+            'INSERT INTO "accounts" ("email", "balance") VALUES (%s, %s), (%s, %s)'
+            ' ON CONFLICT (cs_unique_v1("email"))'
+            ' DO UPDATE SET "balance" = EXCLUDED."balance"'
+            ' RETURNING "id", (xmax = 0)',
+            _upsert_sql(model, fields, email, [balance], 2, connection),
+        )
+        self.assertIn(
+            'DO UPDATE SET "email" = EXCLUDED."email"',
+            _upsert_sql(model, fields, email, [], 1, connection),
+        )
+
+    def test_unique_token_filters(self):
+        downcase = [{"kind": "downcase"}]
+        email = EncryptedText()
+        email.set_attributes_from_name("email")
+        email.eql_table, email.eql_column = "accounts", "email"
+        index = EqlIndex(
+            field="email", index_type="unique", opts={"token_filters": downcase}
+        )
+        model = SimpleNamespace(_meta=SimpleNamespace(indexes=[index]))
+        self.assertEqual(downcase, _unique_token_filters(model, email))
+
+        previous = get_config()
+        try:
+            model = SimpleNamespace(_meta=SimpleNamespace(indexes=[]))
+            set_config(EqlConfig())
+            self.assertEqual((), _unique_token_filters(model, email))
+            config = EqlConfig()
+            config.declare("accounts", "email", {"unique": {"token_filters": downcase}})
+            set_config(config)
+            self.assertEqual(downcase, _unique_token_filters(model, email))
+        finally:
+            set_config(previous)
+
+
+class EncryptedModelRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = EncryptedModelRouter("proxy", "direct", ["billing.Invoice"])
+        self.customer = self.model("shop.Customer", EncryptedText())
+        self.plan = self.model("billing.Plan")
+        self.invoice = self.model("billing.Invoice")
+
+    def model(self, label, *fields):
+        meta = SimpleNamespace(label=label, concrete_fields=[object(), *fields])
+        return type(label.split(".")[1], (), {"_meta": meta})
+
+    def instance(self, db):
+        return SimpleNamespace(_state=SimpleNamespace(db=db))
+
+    def test_routes_models(self):
+        self.assertEqual("proxy", self.router.db_for_read(self.customer))
+        self.assertEqual("proxy", self.router.db_for_write(self.customer))
+        self.assertEqual("direct", self.router.db_for_read(self.plan))
+        self.assertEqual("direct", self.router.db_for_write(self.plan))
+        self.assertEqual("proxy", self.router.db_for_read(self.invoice))
+
+    def test_allow_relation(self):
+        proxy, direct = self.instance("proxy"), self.instance("direct")
+        self.assertTrue(self.router.allow_relation(proxy, direct))
+        self.assertIsNone(self.router.allow_relation(proxy, self.instance("other")))
+
+    def test_allow_migrate(self):
+        self.assertTrue(self.router.allow_migrate("proxy", "shop"))
+        self.assertFalse(self.router.allow_migrate("direct", "shop"))
+        self.assertIsNone(self.router.allow_migrate("other", "shop"))
+        same = EncryptedModelRouter("default", "default", [])
+        self.assertIsNone(same.allow_migrate("default", "shop"))
+        self.assertEqual("default", same.db_for_read(self.plan))
+
+
+class EqlEqualityTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = get_config()
+        set_config(EqlConfig())
+
+    def tearDown(self):
+        set_config(self.previous)
+
+    def test_eq_lookup(self):
+        for field in [
+            EncryptedText,
+            EncryptedInt,
+            EncryptedFloat,
+            EncryptedDate,
+            EncryptedBoolean,
+        ]:
+            self.assertIs(EncryptedEquals, field().get_lookup("eq"))
+
+    def test_default_equality_index(self):
+        self.assertEqual("unique", EncryptedText().equality_index())
+        self.assertEqual("ore", EncryptedInt().equality_index())
+
+    def test_declared_equality_index(self):
+        self.assertEqual(
+            "unique", EncryptedInt(eql_indexes=["ore", "unique"]).equality_index()
+        )
+        self.assertEqual("ore", EncryptedText(eql_indexes=["ore"]).equality_index())
+
+    def test_equality_index_from_config(self):
+        config = EqlConfig()
+        config.declare("customers", "age", ["unique"])
+        set_config(config)
+        field = EncryptedInt(eql_table="customers", eql_column="age")
+        self.assertEqual("unique", field.equality_index())
+
+    def test_template(self):
+        lookup = EncryptedEquals.__new__(EncryptedEquals)
+        lookup.lhs = SimpleNamespace(output_field=EncryptedInt(eql_indexes=["unique"]))
+        self.assertEqual("unique", lookup.query_type)
+        self.assertEqual("cs_unique_v1(%s) = cs_unique_v1(%s)", lookup.template)
+        lookup.lhs = SimpleNamespace(output_field=EncryptedInt())
+        self.assertEqual("ore", lookup.query_type)
+        self.assertEqual("cs_ore_64_8_v1(%s) = cs_ore_64_8_v1(%s)", lookup.template)
+
+
+class EqlRangeTest(unittest.TestCase):
+    def test_ore_lookups(self):
+        for field in [EncryptedInt, EncryptedFloat, EncryptedDate]:
+            self.assertIs(EncryptedOreLt, field().get_lookup("lt"))
+            self.assertIs(EncryptedOreLte, field().get_lookup("lte"))
+            self.assertIs(EncryptedOreGt, field().get_lookup("gt"))
+            self.assertIs(EncryptedOreGte, field().get_lookup("gte"))
+            self.assertIs(EncryptedOreRange, field().get_lookup("range"))
+
+    def test_range_encodes_bounds(self):
+        field = EncryptedDate(eql_table="customers", eql_column="start_date")
+        lookup = EncryptedOreRange(
+            SimpleNamespace(output_field=field), (date(2024, 1, 1), date(2024, 1, 31))
+        )
+        self.assertEqual(["2024-01-01", "2024-01-31"], [b["p"] for b in lookup.rhs])
+        self.assertEqual({"t": "customers", "c": "start_date"}, lookup.rhs[0]["i"])
+
+    def test_range_with_none(self):
+        with self.assertRaises(ValueError):
+            EncryptedOreRange(SimpleNamespace(output_field=EncryptedInt()), (None, 30))
+
+
+class EqlInstrumentationTest(unittest.TestCase):
+    def test_records_encodes_and_decodes(self):
+        sink = []
+        col_type = EncryptedInt()
+        with eql_instrumentation(sink.append) as stats:
+            prep_value = col_type.get_prep_value(-2)
+            col_type.from_db_value(prep_value, None, None)
+            col_type.from_db_values([prep_value, None, json.dumps(prep_value)])
+            EncryptedText().get_prep_value(None)
+
+        summary = stats.summary()
+        self.assertEqual([summary], sink)
+        self.assertEqual(1, summary["encodes"]["EncryptedInt"]["count"])
+        self.assertEqual(1, summary["encodes"]["EncryptedText"]["count"])
+        self.assertEqual(3, summary["decodes"]["EncryptedInt"]["count"])
+        self.assertGreaterEqual(summary["decodes"]["EncryptedInt"]["time"], 0)
+        self.assertEqual(len(json.dumps(prep_value)), summary["bytes_sent"])
+        self.assertEqual(3 * len(json.dumps(prep_value)), summary["bytes_received"])
+
+    def test_records_lookups(self):
+        with eql_instrumentation() as stats:
+            stats.looked_up("unique")
+            stats.looked_up("ore")
+            stats.looked_up("ore")
+        self.assertEqual({"unique": 1, "ore": 2}, stats.summary()["lookups"])
+
+    def test_nothing_recorded_outside_context(self):
+        with eql_instrumentation() as stats:
+            pass
+        EncryptedInt().get_prep_value(1)
+        self.assertEqual({}, stats.summary()["encodes"])
+
+    def test_nested_contexts(self):
+        with eql_instrumentation() as outer:
+            with eql_instrumentation() as inner:
+                EncryptedInt().get_prep_value(1)
+            EncryptedInt().get_prep_value(2)
+        self.assertEqual(1, inner.encodes["EncryptedInt"])
+        self.assertEqual(1, outer.encodes["EncryptedInt"])
+
+
+class EqlDjangoAsyncTest(unittest.IsolatedAsyncioTestCase):
+    async def test_adecode(self):
+        col_type = EncryptedJsonb()
+        values = [col_type.get_prep_value({"num": n}) for n in range(3)]
+        decoded = await adecode(col_type, values)
+        self.assertEqual([{"num": 0}, {"num": 1}, {"num": 2}], decoded)
+
+    async def test_adecoded(self):
+        col_type = EncryptedInt()
+
+        async def fetched():
+            for n in range(5):
+                yield col_type.get_prep_value(n)
+
+        decoded = [v async for v in adecoded(fetched(), col_type, chunk_size=2)]
+        self.assertEqual([0, 1, 2, 3, 4], decoded)
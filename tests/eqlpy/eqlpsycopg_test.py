@@ -0,0 +1,259 @@
+import unittest
+import json
+from contextlib import contextmanager
+from eqlpy.eqlpsycopg import *
+from eqlpy.eql_types import EqlInt, EqlText, EqlJsonb
+from eqlpy.eql_config import EqlConfig, get_config, set_config
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rows = []
+
+    def execute(self, sql, params):
+        self.conn.executed.append((sql, params))
+        self.description, self.rows = self.conn.results.pop(0)
+
+    def fetchall(self):
+        if self.conn.in_pipeline:
+            raise RuntimeError("results are only available after the pipeline")
+        return self.rows
+
+    def close(self):
+        self.conn.closed_cursors += 1
+
+
+class FakeConnection:
+    # psycopg2-like connection without pipeline mode
+    in_pipeline = False
+
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+        self.closed_cursors = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakePipelineConnection(FakeConnection):
+    # psycopg 3-like connection, whose pipeline() sends queries on exit
+    pipelines = 0
+
+    @contextmanager
+    def pipeline(self):
+        self.pipelines += 1
+        self.in_pipeline = True
+        try:
+            yield
+        finally:
+            self.in_pipeline = False
+
+
+def payload_json(plaintext):
+    return json.dumps({"k": "pt", "p": plaintext, "i": {"t": "t", "c": "c"}, "v": 1})
+
+
+class EqlBatchTest(unittest.TestCase):
+    def test_unique(self):
+        batch = EqlBatch(FakeConnection([]))
+        self.assertEqual(0, batch.unique(EqlText("Alice", "customers", "name")))
+        query = batch.queries[0]
+        self.assertEqual(
+            "SELECT * FROM customers WHERE cs_unique_v1(name) = cs_unique_v1(%s)",
+            query.sql,
+        )
+        self.assertEqual("unique", json.loads(query.params[0])["q"])
+        self.assertEqual(["name"], list(query.decoders))
+
+    def test_match_with_columns_and_limit(self):
+        batch = EqlBatch(FakeConnection([]))
+        batch.match(EqlText("ali", "customers", "name"), columns="id, name", limit=5)
+        query = batch.queries[0]
+        self.assertEqual(
+            "SELECT id, name FROM customers WHERE cs_match_v1(name) @> cs_match_v1(%s) LIMIT 5",
+            query.sql,
+        )
+        self.assertEqual("match", json.loads(query.params[0])["q"])
+
+    def test_contains(self):
+        batch = EqlBatch(FakeConnection([]))
+        batch.contains(EqlJsonb({"a": 1}, "customers", "extra_info"))
+        query = batch.queries[0]
+        self.assertEqual(
+            "SELECT * FROM customers WHERE cs_ste_vec_v1(extra_info) @> cs_ste_vec_v1(%s)",
+            query.sql,
+        )
+        self.assertEqual("ste_vec", json.loads(query.params[0])["q"])
+
+    def test_execute_without_pipeline(self):
+        conn = FakeConnection(
+            [
+                ([("id",), ("name",)], [(1, payload_json("Alice"))]),
+                ([("n",)], [(3,)]),
+                (None, []),
+            ]
+        )
+        batch = EqlBatch(conn)
+        alice = batch.unique(EqlText("Alice", "customers", "name"))
+        count = batch.add("SELECT count(*) AS n FROM customers")
+        batch.add("SET statement_timeout = 1000")
+        self.assertEqual(3, len(batch))
+
+        results = batch.execute()
+        self.assertEqual([{"id": 1, "name": "Alice"}], results[alice])
+        self.assertEqual([{"n": 3}], results[count])
+        self.assertEqual([], results[2])
+        self.assertEqual(3, len(conn.executed))
+        self.assertEqual(0, len(batch))
+
+    def test_execute_with_pipeline(self):
+        conn = FakePipelineConnection(
+            [
+                ([("id",), ("name",)], [(1, payload_json("Alice"))]),
+                ([("n",)], [(3,)]),
+                (None, []),
+            ]
+        )
+        batch = EqlBatch(conn)
+        alice = batch.unique(EqlText("Alice", "customers", "name"))
+        count = batch.add("SELECT count(*) AS n FROM customers")
+        batch.add("SET statement_timeout = 1000")
+
+        results = batch.execute()
+        self.assertEqual(1, conn.pipelines)
+        self.assertEqual([{"id": 1, "name": "Alice"}], results[alice])
+        self.assertEqual([{"n": 3}], results[count])
+        self.assertEqual([], results[2])
+        self.assertEqual(3, len(conn.executed))
+        self.assertEqual(3, conn.closed_cursors)
+
+    def test_decoders(self):
+        conn = FakeConnection(
+            [([("age",), ("visits",)], [({"p": "31"}, 2), (None, 3)])]
+        )
+        batch = EqlBatch(conn)
+        batch.add(
+            "SELECT age, visits FROM customers", decoders={"age": "int", "visits": str}
+        )
+        self.assertEqual(
+            [[{"age": 31, "visits": "2"}, {"age": None, "visits": "3"}]],
+            batch.execute(),
+        )
+
+    def test_eq(self):
+        previous = get_config()
+        set_config(EqlConfig())
+        try:
+            batch = EqlBatch(FakeConnection([]))
+            batch.eq(EqlInt(31, "customers", "age"))
+            batch.eq(EqlInt(31, "customers", "age"), indexes=["unique", "ore"])
+            batch.eq(EqlText("Alice", "customers", "name"))
+        finally:
+            set_config(previous)
+        self.assertEqual(
+            [
+                "SELECT * FROM customers WHERE cs_ore_64_8_v1(age) = cs_ore_64_8_v1(%s)",
+                "SELECT * FROM customers WHERE cs_unique_v1(age) = cs_unique_v1(%s)",
+                "SELECT * FROM customers WHERE cs_unique_v1(name) = cs_unique_v1(%s)",
+            ],
+            [query.sql for query in batch.queries],
+        )
+        self.assertEqual(
+            ["ore", "unique", "unique"],
+            [json.loads(query.params[0])["q"] for query in batch.queries],
+        )
+
+    def test_execute_empty(self):
+        self.assertEqual([], EqlBatch(FakeConnection([])).execute())
+
+
+class ExtractTest(unittest.TestCase):
+    def test_eql_extract(self):
+        sql, params = eql_extract("customers", "extra_info", ["$.num", "$.cat"])
+        self.assertEqual(
+            "cs_ste_vec_value_v1(extra_info, %s), cs_ste_vec_value_v1(extra_info, %s)",
+            sql,
+        )
+        self.assertEqual(
+            [
+                EqlJsonb(path, "customers", "extra_info").to_db_format("ejson_path")
+                for path in ["$.num", "$.cat"]
+            ],
+            params,
+        )
+
+    def test_extract(self):
+        conn = FakeConnection(
+            [(None, [(1, payload_json("1"), payload_json('"a"')), (2, None, None)])]
+        )
+        found = extract(
+            conn.cursor(),
+            "customers",
+            "extra_info",
+            ["$.num", "$.cat"],
+            columns=["id"],
+            where="id < %s",
+            params=[3],
+        )
+        self.assertEqual(
+            [
+                {"id": 1, "$.num": 1, "$.cat": "a"},
+                {"id": 2, "$.num": None, "$.cat": None},
+            ],
+            found,
+        )
+        sql, params = conn.executed[0]
+        self.assertEqual(
+            "SELECT id, cs_ste_vec_value_v1(extra_info, %s), "
+            "cs_ste_vec_value_v1(extra_info, %s) FROM customers WHERE id < %s",
+            sql,
+        )
+        self.assertEqual(3, params[-1])
+
+
+class SearchTest(unittest.TestCase):
+    def test_eql_search(self):
+        condition, rank, params = eql_search(
+            "customers", ["name", "email"], ["ali", "dev"]
+        )
+        name, email = (
+            f"cs_match_v1({c}) @> cs_match_v1(%s)" for c in ["name", "email"]
+        )
+        self.assertEqual(f"({name} OR {email} OR {name} OR {email})", condition)
+        self.assertEqual(f"({name} OR {email})::int + ({name} OR {email})::int", rank)
+        self.assertEqual(
+            [
+                EqlText("ali", "customers", "name").to_db_format("match"),
+                EqlText("ali", "customers", "email").to_db_format("match"),
+                EqlText("dev", "customers", "name").to_db_format("match"),
+                EqlText("dev", "customers", "email").to_db_format("match"),
+            ],
+            params,
+        )
+
+    def test_single_term(self):
+        condition, rank, params = eql_search("customers", ["name"], "ali")
+        self.assertEqual("(cs_match_v1(name) @> cs_match_v1(%s))", condition)
+        self.assertEqual(1, len(params))
+
+    def test_batch_search(self):
+        conn = FakeConnection(
+            [((("name",), ("eql_rank",)), [(payload_json("Ali"), 2)])]
+        )
+        batch = EqlBatch(conn)
+        batch.search(
+            "customers", ["name"], ["ali", "dev"], select="name", rank=True, limit=5
+        )
+        self.assertEqual([[{"name": "Ali", "eql_rank": 2}]], batch.execute())
+        sql, params = conn.executed[0]
+        self.assertEqual(
+            "SELECT name, (cs_match_v1(name) @> cs_match_v1(%s))::int"
+            " + (cs_match_v1(name) @> cs_match_v1(%s))::int AS eql_rank FROM customers"
+            " WHERE (cs_match_v1(name) @> cs_match_v1(%s) OR cs_match_v1(name) @> cs_match_v1(%s))"
+            " ORDER BY eql_rank DESC LIMIT 5",
+            sql,
+        )
+        self.assertEqual(params[:2], params[2:])
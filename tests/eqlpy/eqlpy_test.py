@@ -0,0 +1,65 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+import eqlpy
+
+ORM_PACKAGES = ("django", "sqlalchemy", "psycopg", "psycopg2")
+
+# Runs the given statements in a fresh interpreter, and reports which ORM or
+# driver packages got imported
+IMPORT_SCRIPT = """
+import json, sys
+%s
+loaded = sorted({m.split(".")[0] for m in sys.modules} & set(%r))
+print(json.dumps({"loaded": loaded}))
+"""
+
+
+def run_fresh(script):
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(os.path.abspath(eqlpy.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+class EqlpyPackageTest(unittest.TestCase):
+    def test_value_types(self):
+        from eqlpy import EqlInt
+        from eqlpy.eql_types import EqlInt as eql_types_int
+
+        self.assertIs(eql_types_int, EqlInt)
+        self.assertEqual(
+            '{"k": "pt", "p": "1", "i": {"t": "t", "c": "c"}, "v": 1, "q": null}',
+            EqlInt(1, "t", "c").to_db_format(),
+        )
+
+    def test_submodules(self):
+        import eqlpy.query
+
+        self.assertIs(eqlpy.query, eqlpy.__getattr__("query"))
+        self.assertIn("eqlalchemy", dir(eqlpy))
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            eqlpy.not_an_attribute
+
+    def test_lazy_submodules(self):
+        # Encoding payloads never imports an ORM or driver
+        script = 'import eqlpy\neqlpy.EqlText("Alice", "t", "c").to_db_format("unique")'
+        result = run_fresh(IMPORT_SCRIPT % (script, ORM_PACKAGES))
+        self.assertEqual([], result["loaded"])
+
+    def test_star_import(self):
+        result = run_fresh(IMPORT_SCRIPT % ("from eqlpy import *", ORM_PACKAGES))
+        self.assertEqual([], result["loaded"])
+        self.assertNotIn("eqldjango", eqlpy.__all__)
+        self.assertIn("EqlResultCache", eqlpy.__all__)
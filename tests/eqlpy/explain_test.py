@@ -0,0 +1,144 @@
+import unittest
+import json
+from eqlpy.explain import *
+from eqlpy import explain as explain_module
+
+INDEX_SCAN_PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Index Scan",
+            "Index Name": "customers_cs_unique_v1_idx",
+            "Relation Name": "customers",
+            "Index Cond": "(cs_unique_v1(name) = cs_unique_v1('{}'::jsonb))",
+        }
+    }
+]
+
+SEQ_SCAN_PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Limit",
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "customers",
+                    "Filter": "(cs_ore_64_8_v1(age) > cs_ore_64_8_v1('{}'::jsonb))",
+                }
+            ],
+        }
+    }
+]
+
+FILTER_AFTER_INDEX_PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Index Scan",
+            "Relation Name": "customers",
+            "Index Cond": "(id = 1)",
+            "Filter": "(cs_match_v1(name) @> cs_match_v1('{}'::jsonb))",
+        }
+    }
+]
+
+
+class FakeCursor:
+    def __init__(self, plan):
+        self.plan = plan
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (json.dumps(self.plan),)
+
+
+class CheckPlanTest(unittest.TestCase):
+    def test_plan_nodes(self):
+        self.assertEqual(
+            ["Limit", "Seq Scan"],
+            [node["Node Type"] for node in plan_nodes(SEQ_SCAN_PLAN)],
+        )
+        self.assertEqual(
+            ["Index Scan"],
+            [node["Node Type"] for node in plan_nodes(json.dumps(INDEX_SCAN_PLAN))],
+        )
+
+    def test_index_scan(self):
+        self.assertEqual([], check_plan(INDEX_SCAN_PLAN))
+
+    def test_seq_scan(self):
+        problems = check_plan(SEQ_SCAN_PLAN)
+        self.assertEqual(1, len(problems))
+        self.assertIn("Seq Scan on customers", problems[0])
+
+    def test_seq_scan_on_other_tables(self):
+        self.assertEqual([], check_plan(SEQ_SCAN_PLAN, tables=["orders"]))
+        self.assertEqual(1, len(check_plan(SEQ_SCAN_PLAN, tables=["customers"])))
+
+    def test_seq_scan_without_filter(self):
+        plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "customers"}}]
+        self.assertEqual([], check_plan(plan))
+
+    def test_cs_filter_after_index(self):
+        problems = check_plan(FILTER_AFTER_INDEX_PLAN)
+        self.assertEqual(1, len(problems))
+        self.assertIn("cs_match_v1(name)", problems[0])
+
+
+class ExplainTest(unittest.TestCase):
+    def test_explain_sql(self):
+        cursor = FakeCursor(INDEX_SCAN_PLAN)
+        plan = explain("SELECT * FROM customers WHERE x = %s", cursor, (1,))
+        self.assertEqual(INDEX_SCAN_PLAN, plan)
+        self.assertEqual(
+            [
+                ("SET enable_seqscan = off", None),
+                ("EXPLAIN (FORMAT JSON) SELECT * FROM customers WHERE x = %s", (1,)),
+                ("RESET enable_seqscan", None),
+            ],
+            cursor.executed,
+        )
+
+    def test_explain_sql_without_forcing_index(self):
+        cursor = FakeCursor(INDEX_SCAN_PLAN)
+        explain("SELECT 1", cursor, force_index=False)
+        self.assertEqual([("EXPLAIN (FORMAT JSON) SELECT 1", None)], cursor.executed)
+
+    def test_explain_requires_connection(self):
+        with self.assertRaises(ValueError):
+            explain("SELECT 1")
+
+    def test_assert_uses_index(self):
+        self.assertEqual(
+            INDEX_SCAN_PLAN, assert_uses_index("SELECT 1", FakeCursor(INDEX_SCAN_PLAN))
+        )
+        with self.assertRaises(EqlPlanError) as cm:
+            assert_uses_index("SELECT 1", FakeCursor(SEQ_SCAN_PLAN))
+        self.assertEqual(1, len(cm.exception.problems))
+        self.assertIn("Seq Scan on customers", str(cm.exception))
+        self.assertIsInstance(cm.exception, AssertionError)
+
+    def test_plan_checker(self):
+        checker = EqlPlanChecker(FakeCursor(SEQ_SCAN_PLAN), tables=["orders"])
+        self.assertEqual([], checker.problems("SELECT 1"))
+        checker.assert_uses_index("SELECT 1")
+        with self.assertRaises(EqlPlanError):
+            checker.assert_uses_index("SELECT 1", tables=["customers"])
+
+    def test_explain_statement(self):
+        from sqlalchemy import column, select, table
+        from sqlalchemy.dialects import postgresql
+
+        statement = select(table("customers", column("id"))).where(column("id") == 1)
+        self.assertEqual(
+            "EXPLAIN (FORMAT JSON) SELECT customers.id \nFROM customers \nWHERE id = %(id_1)s",
+            str(Explain(statement).compile(dialect=postgresql.dialect())),
+        )
+
+    def test_pytest_fixture(self):
+        from eqlpy import pytest_plugin
+
+        self.assertTrue(hasattr(pytest_plugin, "eql_plan"))
+        self.assertFalse(hasattr(explain_module, "eql_plan"))
+        self.assertFalse(hasattr(explain_module, "pytest"))
@@ -0,0 +1,47 @@
+import unittest
+from eqlpy.keyset import *
+
+
+class KeysetTokenTest(unittest.TestCase):
+    def test_roundtrip(self):
+        token = encode_token("start_date", 42, '("{""\\\\x01""}")')
+        self.assertEqual((42, '("{""\\\\x01""}")'), decode_token("start_date", token))
+        self.assertNotIn("=", token)
+
+    def test_string_pk(self):
+        token = encode_token("name", "a1b2", "t")
+        self.assertEqual(("a1b2", "t"), decode_token("name", token))
+
+    def test_invalid_token(self):
+        tokens = [
+            "",
+            "not a token",
+            "e30",
+            encode_token("name", 1, "t")[:-3],
+            # tokens without a term, from before terms were included
+            "eyJjIjoibmFtZSIsImsiOjF9",
+            encode_token("name", 1, None),
+        ]
+        for token in tokens:
+            with self.assertRaises(ValueError):
+                decode_token("name", token)
+
+    def test_token_for_other_column(self):
+        with self.assertRaises(ValueError):
+            decode_token("age", encode_token("name", 1, "t"))
+
+
+class KeysetPageTest(unittest.TestCase):
+    def test_page_with_more_rows(self):
+        rows = [{"id": 1}, {"id": 2}, {"id": 3}]
+        result = page(rows, [(1, "a"), (2, "b"), (3, "c")], 2, "age")
+        self.assertEqual([{"id": 1}, {"id": 2}], result.items)
+        self.assertEqual((2, "b"), decode_token("age", result.next_token))
+
+    def test_last_page(self):
+        result = page([{"id": 1}, {"id": 2}], [(1, "a"), (2, "b")], 2, "age")
+        self.assertEqual(2, len(result.items))
+        self.assertIsNone(result.next_token)
+
+    def test_empty_page(self):
+        self.assertEqual(KeysetPage([], None), page([], [], 2, "age"))
@@ -0,0 +1,122 @@
+import unittest
+import json
+from datetime import date
+from eqlpy.query import *
+from eqlpy.eql_config import EqlConfig, get_config, set_config
+from eqlpy.eql_types import EqlDate, EqlInt, EqlText
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = get_config()
+        set_config(EqlConfig())
+        self.name = column("customers", "name", "text")
+        self.age = column("customers", "age", "int")
+        self.start_date = column("customers", "start_date", "date")
+
+    def tearDown(self):
+        set_config(self.previous)
+
+    def test_predicates(self):
+        for condition, sql, query_type in [
+            (
+                match(self.name, "ali"),
+                "cs_match_v1(name) @> cs_match_v1(%s)",
+                "match",
+            ),
+            (eq(self.name, "ali"), "cs_unique_v1(name) = cs_unique_v1(%s)", "unique"),
+            (eq(self.age, 3), "cs_ore_64_8_v1(age) = cs_ore_64_8_v1(%s)", "ore"),
+            (lt(self.age, 3), "cs_ore_64_8_v1(age) < cs_ore_64_8_v1(%s)", "ore"),
+            (lte(self.age, 3), "cs_ore_64_8_v1(age) <= cs_ore_64_8_v1(%s)", "ore"),
+            (gt(self.age, 3), "cs_ore_64_8_v1(age) > cs_ore_64_8_v1(%s)", "ore"),
+            (gte(self.age, 3), "cs_ore_64_8_v1(age) >= cs_ore_64_8_v1(%s)", "ore"),
+        ]:
+            self.assertEqual(sql, render(condition.shape))
+            (param,) = condition.params()
+            self.assertEqual(query_type, json.loads(param)["q"])
+
+    def test_params_are_eql_terms(self):
+        (param,) = lt(self.start_date, date(2024, 1, 2)).params()
+        self.assertEqual(
+            EqlDate(date(2024, 1, 2), "customers", "start_date").to_db_format("ore"),
+            param,
+        )
+
+    def test_contains(self):
+        extra_info = column("customers", "extra_info", "jsonb")
+        condition = contains(extra_info, {"cat": "a"})
+        self.assertEqual(
+            "cs_ste_vec_v1(extra_info) @> cs_ste_vec_v1(%s)", render(condition.shape)
+        )
+        self.assertEqual('{"cat": "a"}', json.loads(condition.params()[0])["p"])
+
+    def test_between(self):
+        condition = between(self.age, 18, 30)
+        self.assertEqual(
+            "cs_ore_64_8_v1(age) BETWEEN cs_ore_64_8_v1(%s) AND cs_ore_64_8_v1(%s)",
+            render(condition.shape),
+        )
+        self.assertEqual(["18", "30"], [json.loads(p)["p"] for p in condition.params()])
+
+    def test_eq_declared_index(self):
+        age = column("customers", "age", "int", indexes=["unique", "ore"])
+        self.assertEqual(
+            "cs_unique_v1(age) = cs_unique_v1(%s)", render(eq(age, 3).shape)
+        )
+
+    def test_select(self):
+        query = select(
+            "customers",
+            and_(match(self.name, "ali"), or_(lt(self.age, 30), gt(self.age, 60))),
+            columns=["id", self.name, self.age],
+            order_by=desc(self.age),
+            limit=10,
+        )
+        sql, params = query.render()
+        self.assertEqual(
+            "SELECT id, name, age FROM customers WHERE (cs_match_v1(name) @> cs_match_v1(%s)"
+            " AND (cs_ore_64_8_v1(age) < cs_ore_64_8_v1(%s)"
+            " OR cs_ore_64_8_v1(age) > cs_ore_64_8_v1(%s)))"
+            " ORDER BY cs_ore_64_8_v1(age) DESC LIMIT %s",
+            sql,
+        )
+        self.assertEqual(
+            [
+                EqlText("ali", "customers", "name").to_db_format("match"),
+                EqlInt(30, "customers", "age").to_db_format("ore"),
+                EqlInt(60, "customers", "age").to_db_format("ore"),
+                10,
+            ],
+            params,
+        )
+        self.assertEqual({"name": "text", "age": "int"}, query.decoders)
+
+    def test_select_without_where(self):
+        query = select("customers", order_by=self.age)
+        self.assertEqual(
+            ("SELECT * FROM customers ORDER BY cs_ore_64_8_v1(age) ASC", []),
+            query.render(),
+        )
+
+    def test_single_clause(self):
+        self.assertEqual(
+            "cs_match_v1(name) @> cs_match_v1(%s)",
+            render(and_(match(self.name, "ali")).shape),
+        )
+        with self.assertRaises(ValueError):
+            or_()
+
+    def test_template_cached_per_shape(self):
+        first, _ = select("customers", lt(self.age, 30), limit=5).render()
+        hits = render.cache_info().hits
+        second, params = select("customers", lt(self.age, 40), limit=7).render()
+        self.assertIs(first, second)
+        self.assertEqual(hits + 1, render.cache_info().hits)
+        self.assertEqual(["40", 7], [json.loads(params[0])["p"], params[1]])
+
+        other, _ = select("customers", gt(self.age, 40), limit=7).render()
+        self.assertNotEqual(first, other)
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            column("customers", "age", "integer")
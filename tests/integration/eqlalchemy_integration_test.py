@@ -1,10 +1,11 @@
 import unittest
-from sqlalchemy.orm import mapped_column, Mapped, sessionmaker
+from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped, sessionmaker
 from sqlalchemy import create_engine, func, select, text
 from datetime import date
 import os
 from eqlpy.eql_types import EqlFloat, EqlText, EqlJsonb
 from eqlpy.eqlalchemy import *
+from eqlpy.explain import EqlPlanError, assert_uses_index
 
 
 class TestCustomerModel(unittest.TestCase):
@@ -139,6 +140,31 @@ class TestCustomerModel(unittest.TestCase):
         )
         self.assertEqual("Alice Developer", found.name)
 
+    def test_instrument(self):
+        stats = instrument(self.engine)
+        try:
+            found = (
+                self.session.query(Customer)
+                .filter(
+                    cs_match_v1(Customer.name).op("@>")(
+                        cs_match_v1(EqlText("ali", "customers", "name").to_db_format())
+                    )
+                )
+                .one()
+            )
+        finally:
+            uninstrument(stats)
+        self.assertEqual("Alice Developer", found.name)
+        [(statement, summary)] = [
+            (k, v) for k, v in stats.snapshot().items() if "cs_match_v1" in k
+        ]
+        self.assertEqual(["cs_match_v1"], summary["functions"])
+        self.assertEqual(1, summary["executions"])
+        self.assertEqual(1, summary["encrypted_binds"])
+        self.assertEqual(6, summary["decodes"])
+        self.assertGreater(summary["bytes_received"], 0)
+        self.assertGreater(summary["latency"], 0)
+
     def test_string_exact_match_with_sql_clause(self):
         query = (
             select(Customer)
@@ -186,6 +212,139 @@ class TestCustomerModel(unittest.TestCase):
         )
         self.assertEqual(found.weight, 51.1)
 
+    def test_eql_eq_ore(self):
+        found = self.session.query(Customer).filter(eql_eq(Customer.age, 30)).one()
+        self.assertEqual("Carol Customer", found.name)
+
+    def test_eql_eq_unique(self):
+        found = (
+            self.session.query(Customer)
+            .filter(eql_eq(Customer.name, "Alice Developer"))
+            .one()
+        )
+        self.assertEqual(31, found.age)
+
+    def test_eql_comparisons(self):
+        def ages(condition):
+            query = select(Customer.age).where(condition).order_by(Customer.id)
+            return self.session.execute(query).scalars().all()
+
+        self.assertEqual([29], ages(eql_lt(Customer.age, 30)))
+        self.assertEqual([29, 30], ages(eql_lte(Customer.age, 30)))
+        self.assertEqual([31], ages(eql_gt(Customer.age, 30)))
+        self.assertEqual([31, 30], ages(eql_gte(Customer.age, 30)))
+
+    def test_eql_between(self):
+        query = (
+            select(Customer)
+            .where(eql_between(Customer.start_date, date(2024, 1, 2), date(2024, 1, 3)))
+            .order_by(Customer.id)
+        )
+        found = self.session.execute(query).scalars().all()
+        self.assertEqual(
+            [date(2024, 1, 2), date(2024, 1, 3)], [c.start_date for c in found]
+        )
+
+    def test_eql_range(self):
+        query = select(Customer.weight).where(eql_range(Customer.weight, 51.1, 82.1))
+        self.assertEqual([51.1, 55.0], sorted(self.session.execute(query).scalars()))
+        query = select(Customer.weight).where(
+            eql_range(Customer.weight, 51.1, 82.1, bounds="(]")
+        )
+        self.assertEqual([55.0, 82.1], sorted(self.session.execute(query).scalars()))
+
+    def test_query_plans(self):
+        assert_uses_index(
+            select(Customer).where(eql_eq(Customer.name, "Alice Developer")),
+            self.session,
+        )
+        assert_uses_index(
+            select(Customer).where(
+                cs_ore_64_8_v1(Customer.weight)
+                < cs_ore_64_8_v1(
+                    EqlFloat(51.5, "customers", "weight").to_db_format("ore")
+                )
+            ),
+            self.session,
+        )
+        assert_uses_index(
+            select(Customer).where(
+                eql_between(Customer.start_date, date(2024, 1, 2), date(2024, 1, 3))
+            ),
+            self.session,
+        )
+        # customers has no ste_vec index (see create_examples_table.sql)
+        with self.assertRaises(EqlPlanError):
+            assert_uses_index(
+                select(Customer).where(
+                    cs_ste_vec_v1(Customer.extra_info).op("@>")(
+                        cs_ste_vec_v1(
+                            EqlJsonb({"a": 1}, "customers", "extra_info").to_db_format(
+                                "ste_vec"
+                            )
+                        )
+                    )
+                ),
+                self.session,
+            )
+
+    def test_keyset_pages(self):
+        pages, token = [], None
+        while True:
+            page = keyset_page(
+                self.session, select(Customer), Customer.weight, after=token, size=2
+            )
+            pages.append([c.weight for c in page.items])
+            token = page.next_token
+            if token is None:
+                break
+        self.assertEqual([[51.1, 55.0], [82.1]], pages)
+
+    def test_keyset_last_row_deleted(self):
+        page = keyset_page(self.session, select(Customer), Customer.weight, size=1)
+        self.session.delete(page.items[0])
+        self.session.flush()
+        page = keyset_page(
+            self.session,
+            select(Customer),
+            Customer.weight,
+            after=page.next_token,
+            size=1,
+        )
+        self.assertEqual([55.0], [c.weight for c in page.items])
+
+    def test_keyset_last_row_updated(self):
+        page = keyset_page(self.session, select(Customer), Customer.weight, size=1)
+        page.items[0].weight = 60.0
+        self.session.flush()
+        page = keyset_page(
+            self.session,
+            select(Customer),
+            Customer.weight,
+            after=page.next_token,
+            size=1,
+        )
+        self.assertEqual([55.0], [c.weight for c in page.items])
+
+    def test_keyset_pages_of_rows_descending(self):
+        statement = select(Customer.id, Customer.start_date)
+        page = keyset_page(
+            self.session, statement, Customer.start_date, size=2, descending=True
+        )
+        self.assertEqual(
+            [date(2024, 1, 3), date(2024, 1, 2)], [r.start_date for r in page.items]
+        )
+        page = keyset_page(
+            self.session,
+            statement,
+            Customer.start_date,
+            after=page.next_token,
+            size=2,
+            descending=True,
+        )
+        self.assertEqual([date(2024, 1, 1)], [r.start_date for r in page.items])
+        self.assertIsNone(page.next_token)
+
     # JSONB Qqueries
     def test_jsonb_containment_1_with_sql_clause(self):
         query = (
@@ -288,6 +447,52 @@ class TestCustomerModel(unittest.TestCase):
         )
         self.assertEqual(sorted(extracted), [1, 2, 3])
 
+    def test_jsonb_field_extraction_with_type(self):
+        term = EqlJsonb("$.num", "customers", "extra_info").to_db_format("ejson_path")
+        found = self.session.scalars(
+            select(
+                cs_ste_vec_value_v1(
+                    Customer.extra_info,
+                    term,
+                    type_=EncryptedJsonb("customers", "extra_info"),
+                )
+            )
+        ).all()
+        self.assertEqual([1, 2, 3], sorted(found))
+
+    def test_jsonb_field_in_group_by_with_type(self):
+        term = EqlJsonb("$.cat", "customers", "extra_info").to_db_format("ejson_path")
+        found = self.session.execute(
+            select(
+                cs_grouped_value_v1(
+                    cs_ste_vec_value_v1(Customer.extra_info, term),
+                    type_=EncryptedJsonb("customers", "extra_info"),
+                ),
+                func.count(),
+            ).group_by(cs_ste_vec_term_v1(Customer.extra_info, term))
+        ).all()
+        self.assertEqual([("a", 1), ("b", 2)], sorted(tuple(row) for row in found))
+
+    def test_extract(self):
+        found = extract(
+            self.session,
+            Customer.extra_info,
+            ["$.num", "$.cat", "$.key"],
+            Customer.age,
+            where=eql_gt(Customer.age, 29),
+        )
+        self.assertEqual(
+            [
+                {"age": 30, "$.num": 3, "$.cat": "b", "$.key": None},
+                {"age": 31, "$.num": 1, "$.cat": "a", "$.key": ["value"]},
+            ],
+            sorted(found, key=lambda row: row["age"]),
+        )
+
+    def test_extract_without_columns(self):
+        found = extract(self.session, Customer.extra_info, ["$.num"])
+        self.assertEqual([1, 2, 3], sorted(row["$.num"] for row in found))
+
     def test_jsonb_field_in_where_with_sql_clause(self):
         query = (
             select(Customer)
@@ -415,6 +620,48 @@ class TestCustomerModel(unittest.TestCase):
             ("b", 2), (EqlJsonb.from_parsed_json(found[1][0]), found[1][1])
         )
 
+    def test_search(self):
+        found = self.session.scalars(
+            search_select(
+                select(Customer.name), [Customer.name], ["alice", "carol"]
+            ).order_by(Customer.id)
+        ).all()
+        self.assertEqual(["Alice Developer", "Carol Customer"], found)
+
+    def test_search_ranked(self):
+        search = EqlSearch([Customer.name], ["customer", "carol"])
+        found = self.session.execute(
+            select(Customer.name, search.rank.label("rank"))
+            .where(search.condition)
+            .order_by(search.rank.desc())
+        ).all()
+        self.assertEqual(
+            [("Carol Customer", 2), ('"Bob Customer"', 1)],
+            [tuple(row) for row in found],
+        )
+
+    def test_group_by_encrypted(self):
+        found = group_by_encrypted(self.session, Customer.extra_info, "$.cat")
+        self.assertEqual(
+            [{"count": 1, "$.cat": "a"}, {"count": 2, "$.cat": "b"}], found
+        )
+
+    def test_group_by_encrypted_with_aggregates(self):
+        found = group_by_encrypted(
+            self.session,
+            Customer.extra_info,
+            "$.cat",
+            {"customers": func.count(), "max_id": func.max(Customer.id)},
+            where=eql_gt(Customer.age, 29),
+        )
+        self.assertEqual(
+            [
+                (1, "a"),
+                (1, "b"),
+            ],
+            [(row["customers"], row["$.cat"]) for row in found],
+        )
+
 
 class Customer(BaseModel):
     __tablename__ = "customers"
@@ -455,3 +702,201 @@ class Customer(BaseModel):
             f"is_citizen={self.is_citizen}"
             ")>"
         )
+
+
+class OrderBase(DeclarativeBase):
+    pass
+
+
+class Order(OrderBase):
+    __tablename__ = "eql_orders"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    customer_name = mapped_column(EncryptedUtf8Str(__tablename__, "customer_name"))
+    total: Mapped[int]
+
+
+customer_name_index = eql_index(Order.customer_name)
+
+
+class TestEncryptedJoin(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings = TestCustomerModel
+        cls.engine = create_engine(
+            f"postgresql://{settings.pg_user}:{settings.pg_password}@{settings.pg_host}:{settings.pg_port}/{settings.pg_db}"
+        )
+        cls.session = sessionmaker(bind=cls.engine)()
+        cls.session.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS eql_orders"
+                " (id serial PRIMARY KEY, customer_name cs_encrypted_v1, total integer)"
+            )
+        )
+        cls.session.commit()
+        customer_name_index.create(cls.engine, checkfirst=True)
+        cls.session.query(Order).delete()
+        cls.session.query(Customer).delete()
+        # one row at a time, as multi-row INSERTs cast the values to VARCHAR
+        for row in [
+            Customer(e_name="Alice Developer"),
+            Customer(e_name="Carol Customer"),
+            Order(customer_name="Alice Developer", total=10),
+            Order(customer_name="Alice Developer", total=20),
+            Order(customer_name="Carol Customer", total=5),
+            Order(customer_name="Nobody", total=1),
+        ]:
+            cls.session.add(row)
+            cls.session.flush()
+        cls.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.execute(text("DROP TABLE eql_orders"))
+        cls.session.query(Customer).delete()
+        cls.session.commit()
+        cls.session.close()
+
+    def test_join(self):
+        found = self.session.execute(
+            select(Customer.name, func.sum(Order.total))
+            .join(Order, eql_on(Order.customer_name, Customer.name))
+            .group_by(Customer.name)
+        ).all()
+        self.assertEqual(
+            [("Alice Developer", 30), ("Carol Customer", 5)], sorted(found)
+        )
+
+    def test_outer_join(self):
+        found = self.session.execute(
+            select(Order.total, Customer.name)
+            .select_from(
+                eql_join(
+                    Order, Customer, Order.customer_name, Customer.name, isouter=True
+                )
+            )
+            .order_by(Order.total)
+        ).all()
+        self.assertEqual(
+            [
+                (1, None),
+                (5, "Carol Customer"),
+                (10, "Alice Developer"),
+                (20, "Alice Developer"),
+            ],
+            [tuple(row) for row in found],
+        )
+
+    def test_index(self):
+        indexes = self.session.execute(
+            text("SELECT indexdef FROM pg_indexes WHERE tablename = 'eql_orders'")
+        ).scalars()
+        self.assertIn(
+            "CREATE INDEX eql_orders_customer_name_unq ON public.eql_orders "
+            "USING btree (cs_unique_v1((customer_name)::jsonb))",
+            list(indexes),
+        )
+
+
+class Account(OrderBase):
+    __tablename__ = "eql_accounts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    email = mapped_column(EncryptedUtf8Str(__tablename__, "email"))
+    balance: Mapped[int]
+
+
+account_email_index = eql_index(Account.email, unique=True)
+
+
+class TestEncryptedUpsert(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings = TestCustomerModel
+        cls.engine = create_engine(
+            f"postgresql://{settings.pg_user}:{settings.pg_password}@{settings.pg_host}:{settings.pg_port}/{settings.pg_db}"
+        )
+        cls.session = sessionmaker(bind=cls.engine)()
+        cls.session.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS eql_accounts"
+                " (id serial PRIMARY KEY, email cs_encrypted_v1, balance integer)"
+            )
+        )
+        cls.session.commit()
+        account_email_index.create(cls.engine, checkfirst=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.execute(text("DROP TABLE eql_accounts"))
+        cls.session.commit()
+        cls.session.close()
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(Account).delete()
+        self.session.commit()
+
+    def balances(self):
+        return sorted(
+            self.session.execute(select(Account.email, Account.balance)).all()
+        )
+
+    def test_upsert_statement(self):
+        self.session.execute(
+            upsert_statement(
+                Account,
+                [
+                    {"email": "alice@example.com", "balance": 1},
+                    {"email": "bob@example.com", "balance": 2},
+                ],
+                Account.email,
+            )
+        )
+        self.session.execute(
+            upsert_statement(
+                Account,
+                [
+                    {"email": "alice@example.com", "balance": 10},
+                    {"email": "carol@example.com", "balance": 3},
+                ],
+                Account.email,
+            )
+        )
+        self.assertEqual(
+            [
+                ("alice@example.com", 10),
+                ("bob@example.com", 2),
+                ("carol@example.com", 3),
+            ],
+            [tuple(row) for row in self.balances()],
+        )
+
+    def test_upsert_batches(self):
+        rows = [{"email": f"user{i % 5}@example.com", "balance": i} for i in range(12)]
+        self.assertEqual(
+            12, upsert(self.session, Account, rows, Account.email, batch_size=2)
+        )
+        # the last row for each key wins, within and across batches
+        self.assertEqual(
+            5, upsert(self.session, Account, rows, Account.email, batch_size=10)
+        )
+        self.assertEqual(
+            [(f"user{i}@example.com", b) for i, b in enumerate([10, 11, 7, 8, 9])],
+            [tuple(row) for row in self.balances()],
+        )
+
+    def test_upsert_update_columns(self):
+        self.session.add(Account(email="alice@example.com", balance=1))
+        self.session.flush()
+        self.session.execute(
+            upsert_statement(
+                Account,
+                [{"email": "alice@example.com", "balance": 10}],
+                Account.email,
+                update=[],
+            )
+        )
+        self.assertEqual(
+            [("alice@example.com", 1)], [tuple(row) for row in self.balances()]
+        )
@@ -1,12 +1,17 @@
 import unittest
 import os
 import django
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db import models, connection
-from django.db.models import Q, F, Value, Count, IntegerField
+from django.db import models, connection, router, transaction
+from django.db.models import Q, F, Value, Count, IntegerField, Sum
 from django.db.models.expressions import RawSQL
 from eqlpy.eql_types import EqlFloat, EqlText, EqlJsonb
 from eqlpy.eqldjango import *
+from eqlpy.bench import bench_async
+from eqlpy.cache import EqlResultCache
+from eqlpy.eql_config import get_config, load_config, set_config
+from eqlpy.explain import EqlPlanError, assert_uses_index, plan_nodes
 from datetime import date
 
 
@@ -33,7 +38,16 @@ if not settings.configured:
                 "PASSWORD": f"{TestSettings.pg_password}",
                 "HOST": f"{TestSettings.pg_host}",
                 "PORT": f"{TestSettings.pg_port}",
-            }
+            },
+            # same database, for EncryptedModelRouter tests
+            "direct": {
+                "ENGINE": "django.db.backends.postgresql",
+                "NAME": f"{TestSettings.pg_db}",
+                "USER": f"{TestSettings.pg_user}",
+                "PASSWORD": f"{TestSettings.pg_password}",
+                "HOST": f"{TestSettings.pg_host}",
+                "PORT": f"{TestSettings.pg_port}",
+            },
         },
         SECRET_KEY=f"{TestSettings.secret_key}",
         AUTOCOMMIT=False,
@@ -241,6 +255,18 @@ class TestCustomerDjangoModel(unittest.TestCase):
 
         extracted = [EqlJsonb.from_parsed_json(result) for result in list(results)]
 
+    def test_extract(self):
+        found = Customer.objects.filter(age__gt=29).extract(
+            "extra_info", ["$.num", "$.cat", "$.key"], "age"
+        )
+        self.assertEqual(
+            [
+                {"age": 30, "$.num": 3, "$.cat": "b", "$.key": None},
+                {"age": 31, "$.num": 1, "$.cat": "a", "$.key": ["value"]},
+            ],
+            sorted(found, key=lambda row: row["age"]),
+        )
+
     def test_jsonb_in_where_with_sql_clause(self):
         term1 = (
             EqlJsonb("$.num", "customers", "extra_info").to_db_format("ejson_path"),
@@ -318,6 +344,37 @@ class TestCustomerDjangoModel(unittest.TestCase):
         self.assertEqual(EqlJsonb.from_parsed_json(result_list[1]["category"]), "b")
         self.assertEqual(result_list[1]["count"], 2)
 
+    def test_search(self):
+        found = Customer.objects.search(["name"], ["alice", "carol"]).order_by("id")
+        self.assertEqual(["Alice Developer", "Carol Customer"], [c.name for c in found])
+
+    def test_search_ranked(self):
+        found = Customer.objects.search(["name"], ["customer", "carol"], rank=True)
+        self.assertEqual(
+            [("Carol Customer", 2), ("Bob Customer", 1)],
+            [(c.name, c.eql_rank) for c in found],
+        )
+
+    def test_group_by_encrypted(self):
+        found = Customer.objects.group_by_encrypted("extra_info", "$.cat")
+        self.assertEqual(
+            [{"count": 1, "$.cat": "a"}, {"count": 2, "$.cat": "b"}], found
+        )
+
+    def test_group_by_encrypted_with_aggregates(self):
+        found = Customer.objects.filter(age__gt=29).group_by_encrypted(
+            "extra_info",
+            "$.cat",
+            {"customers": Count("*"), "visits": Sum("visit_count")},
+        )
+        self.assertEqual(
+            [
+                {"customers": 1, "visits": 0, "$.cat": "a"},
+                {"customers": 1, "visits": 2, "$.cat": "b"},
+            ],
+            found,
+        )
+
 
 class Customer(models.Model):
     age = EncryptedInt(null=True)
@@ -330,10 +387,210 @@ class Customer(models.Model):
     # non-sensitive fields (not encrypted)
     visit_count = IntegerField()
 
+    objects = EncryptedManager()
+
     class Meta:
         db_table = "customers"
 
 
+class Order(models.Model):
+    customer_name = EncryptedText(null=True)
+    total = IntegerField()
+
+    objects = EncryptedManager()
+
+    class Meta:
+        db_table = "eql_orders"
+        indexes = [EqlIndex(field="customer_name", index_type="unique")]
+
+
+class TestEncryptedJoin(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            editor.create_model(Order)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for index in Order._meta.indexes:
+                editor.remove_index(Order, index)
+            editor.delete_model(Order)
+
+    def setUp(self):
+        Customer.objects.all().delete()
+        create_customer_records()
+        for name, total in [
+            ("Alice Developer", 10),
+            ("Alice Developer", 20),
+            ("Carol Customer", 5),
+            ("Nobody", 1),
+        ]:
+            Order(customer_name=name, total=total).save()
+
+    def tearDown(self):
+        Order.objects.all().delete()
+
+    def test_join_exists(self):
+        found = Customer.objects.join_exists(
+            "name", Order.objects.all(), "customer_name"
+        ).order_by("id")
+        self.assertEqual(["Alice Developer", "Carol Customer"], [c.name for c in found])
+        found = Order.objects.join_exists(
+            "customer_name", Customer.objects.filter(age__gt=30), "name"
+        )
+        self.assertEqual([10, 20], sorted(o.total for o in found))
+
+    def test_cached_join_invalidated_by_inner_writes(self):
+        cache = EqlResultCache()
+        disconnect = invalidate_on_signals(cache)
+        try:
+            queryset = Customer.objects.join_exists(
+                "name", Order.objects.all(), "customer_name"
+            ).values_list("name", flat=True)
+            self.assertEqual(
+                ["Alice Developer", "Carol Customer"], sorted(queryset.cached(cache))
+            )
+            Order(customer_name="Bob Customer", total=7).save()
+            self.assertEqual(
+                ["Alice Developer", "Bob Customer", "Carol Customer"],
+                sorted(queryset.cached(cache)),
+            )
+            annotated = Order.objects.annotate(
+                customer_age=join_subquery(
+                    Customer.objects.all(), "name", "customer_name", "age"
+                )
+            ).filter(total=7)
+            self.assertEqual([29], [o.customer_age for o in annotated.cached(cache)])
+            bob = Customer.objects.get(name__eq="Bob Customer")
+            bob.age = 40
+            bob.save()
+            self.assertEqual([40], [o.customer_age for o in annotated.cached(cache)])
+        finally:
+            disconnect()
+
+    def test_join_subquery(self):
+        found = Order.objects.annotate(
+            customer_age=join_subquery(
+                Customer.objects.all(), "name", "customer_name", "age"
+            )
+        ).order_by("total")
+        self.assertEqual(
+            [(1, None), (5, 30), (10, 31), (20, 31)],
+            [(o.total, o.customer_age) for o in found],
+        )
+
+    def test_unique_equals(self):
+        found = Order.objects.filter(
+            unique_equals(
+                "customer_name",
+                Value(
+                    EqlText(
+                        "Carol Customer", "eql_orders", "customer_name"
+                    ).to_db_format("unique")
+                ),
+            )
+        )
+        self.assertEqual([5], [o.total for o in found])
+
+    def test_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE tablename = 'eql_orders'"
+            )
+            indexes = [row[0] for row in cursor.fetchall()]
+        self.assertTrue(
+            any("(cs_unique_v1((customer_name)::jsonb))" in i for i in indexes)
+        )
+
+
+class Account(models.Model):
+    email = EncryptedText()
+    balance = IntegerField(default=0)
+    note = models.TextField(null=True)
+
+    objects = EncryptedManager()
+
+    class Meta:
+        db_table = "eql_accounts"
+        indexes = [EqlIndex(field="email", index_type="unique", unique=True)]
+
+
+class TestEncryptedUpsert(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            editor.create_model(Account)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for index in Account._meta.indexes:
+                editor.remove_index(Account, index)
+            editor.delete_model(Account)
+
+    def tearDown(self):
+        Account.objects.all().delete()
+
+    def balances(self):
+        return sorted(Account.objects.values_list("email", "balance"))
+
+    def test_bulk_upsert(self):
+        first = Account.objects.bulk_upsert(
+            [Account(email="alice@example.com", balance=1)], "email"
+        )
+        accounts = Account.objects.bulk_upsert(
+            [
+                Account(email="alice@example.com", balance=10),
+                Account(email="bob@example.com", balance=2),
+            ],
+            "email",
+        )
+        self.assertEqual(first[0].pk, accounts[0].pk)
+        self.assertIsNotNone(accounts[1].pk)
+        self.assertEqual(
+            [("alice@example.com", 10), ("bob@example.com", 2)], self.balances()
+        )
+
+    def test_bulk_upsert_batches(self):
+        accounts = [
+            Account(email=f"user{i % 5}@example.com", balance=i) for i in range(12)
+        ]
+        Account.objects.bulk_upsert(accounts, "email", batch_size=4)
+        self.assertEqual(
+            [(f"user{i}@example.com", b) for i, b in enumerate([10, 11, 7, 8, 9])],
+            self.balances(),
+        )
+        self.assertEqual(accounts[0].pk, accounts[5].pk)
+        self.assertEqual(5, len({account.pk for account in accounts}))
+
+    def test_bulk_upsert_update_fields(self):
+        Account.objects.bulk_upsert(
+            [Account(email="alice@example.com", balance=1, note="first")], "email"
+        )
+        Account.objects.bulk_upsert(
+            [Account(email="alice@example.com", balance=10, note="second")],
+            "email",
+            update_fields=["note"],
+        )
+        self.assertEqual(
+            [(1, "second")], list(Account.objects.values_list("balance", "note"))
+        )
+
+    def test_upsert(self):
+        account, created = Account.objects.upsert(
+            "email", "alice@example.com", {"balance": 1, "note": "first"}
+        )
+        self.assertTrue(created)
+        updated, created = Account.objects.upsert(
+            "email", "alice@example.com", {"balance": 2}
+        )
+        self.assertFalse(created)
+        self.assertEqual(account.pk, updated.pk)
+        self.assertEqual((2, "first"), (updated.balance, updated.note))
+        self.assertEqual([("alice@example.com", 2)], self.balances())
+
+
 class TestModelWithCustomLookup(unittest.TestCase):
     def setUp(self):
         Customer.objects.all().delete()
@@ -379,6 +636,64 @@ class TestModelWithCustomLookup(unittest.TestCase):
         found = Customer.objects.get(age__gt=30)
         self.assertEqual(found.age, 31)
 
+    def test_int_ore_gte_lte(self):
+        found = Customer.objects.filter(age__gte=30).order_by("id")
+        self.assertEqual([31, 30], [c.age for c in found])
+        found = Customer.objects.filter(age__lte=30).order_by("id")
+        self.assertEqual([29, 30], [c.age for c in found])
+
+    def test_float_ore_gte_lte(self):
+        self.assertEqual(
+            55.0, Customer.objects.get(weight__gte=55.0, weight__lte=55.0).weight
+        )
+
+    def test_date_ore_range(self):
+        found = Customer.objects.filter(
+            start_date__range=(date(2024, 1, 2), date(2024, 1, 3))
+        ).order_by("id")
+        self.assertEqual(
+            [date(2024, 1, 2), date(2024, 1, 3)], [c.start_date for c in found]
+        )
+
+    def test_int_ore_range(self):
+        found = Customer.objects.get(age__range=(30, 30))
+        self.assertEqual(found.age, 30)
+        self.assertFalse(Customer.objects.filter(age__range=(32, 40)).exists())
+
+    def test_range_query_plan(self):
+        plan = assert_uses_index(
+            Customer.objects.filter(
+                start_date__range=(date(2024, 1, 2), date(2024, 1, 3))
+            )
+        )
+        scans = [node for node in plan_nodes(plan) if "Index Cond" in node]
+        self.assertEqual(1, len(scans))
+        self.assertIn(">=", scans[0]["Index Cond"])
+        self.assertIn("<=", scans[0]["Index Cond"])
+
+    def test_query_plans(self):
+        assert_uses_index(Customer.objects.filter(name__eq="Alice Developer"))
+        assert_uses_index(Customer.objects.filter(name__match="alice"))
+        assert_uses_index(Customer.objects.filter(age__gt=30))
+        assert_uses_index(Customer.objects.search(["name"], ["alice", "carol"]))
+        # customers has no ste_vec index (see create_examples_table.sql)
+        with self.assertRaises(EqlPlanError):
+            assert_uses_index(Customer.objects.filter(extra_info__contains={"a": 1}))
+
+    def test_eq_uses_indexes_from_config(self):
+        previous = get_config()
+        try:
+            with connection.cursor() as cursor:
+                load_config(cursor)
+            with eql_instrumentation() as stats:
+                self.assertEqual(
+                    31, Customer.objects.get(name__eq="Alice Developer").age
+                )
+                self.assertEqual(29, Customer.objects.get(age__eq=29).age)
+        finally:
+            set_config(previous)
+        self.assertEqual({"unique": 1, "ore": 1}, stats.summary()["lookups"])
+
     def test_jsonb_contains(self):
         found = Customer.objects.get(extra_info__contains={"key": []})
         self.assertEqual(found.name, "Alice Developer")
@@ -397,3 +712,376 @@ class TestModelWithCustomLookup(unittest.TestCase):
         found = Customer.objects.filter(is_citizen__eq=True).all()
         self.assertEqual(len(found), 1)
         self.assertEqual(found[0].name, "Alice Developer")
+
+
+class TestStreamingQuerySet(unittest.TestCase):
+    def setUp(self):
+        Customer.objects.all().delete()
+        self.customer1, self.customer2, self.customer3 = create_customer_records()
+
+    def test_stream_matches_iterator(self):
+        queryset = Customer.objects.order_by("id")
+        streamed = [
+            (c.id, c.age, c.name, c.start_date, c.extra_info, c.visit_count)
+            for c in queryset.stream(chunk_size=2)
+        ]
+        iterated = [
+            (c.id, c.age, c.name, c.start_date, c.extra_info, c.visit_count)
+            for c in queryset.iterator(chunk_size=2)
+        ]
+        self.assertEqual(iterated, streamed)
+        self.assertEqual(3, len(streamed))
+
+    def test_stream_with_lookup(self):
+        found = [c.name for c in Customer.objects.filter(weight__lt=60.0).stream()]
+        self.assertEqual(sorted(found), ["Alice Developer", "Carol Customer"])
+
+    def test_stream_with_annotation(self):
+        found = list(
+            Customer.objects.filter(id=self.customer1.id)
+            .annotate(visits=F("visit_count"))
+            .stream()
+        )
+        self.assertEqual(found[0].visits, 0)
+        self.assertEqual(found[0].weight, 51.1)
+
+    def test_stream_with_nulls(self):
+        Customer(visit_count=5).save()
+        found = Customer.objects.get(visit_count=5)
+        streamed = list(Customer.objects.filter(visit_count=5).stream())
+        self.assertEqual(found.id, streamed[0].id)
+        self.assertIsNone(streamed[0].name)
+
+    def test_stream_rejects_values(self):
+        with self.assertRaises(TypeError):
+            Customer.objects.values("name").stream()
+
+    def test_stream_matches_iterator_in_chunks(self):
+        iterated = [c.extra_info for c in Customer.objects.iterator(chunk_size=2)]
+        streamed = [c.extra_info for c in Customer.objects.stream(chunk_size=2)]
+        self.assertEqual(iterated, streamed)
+
+
+class Plan(models.Model):
+    name = models.TextField()
+
+    class Meta:
+        db_table = "eql_plans"
+
+
+class TestEncryptedModelRouter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            editor.create_model(Plan)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            editor.delete_model(Plan)
+
+    def setUp(self):
+        Customer.objects.all().delete()
+        router.routers = [EncryptedModelRouter("default", "direct")]
+
+    def tearDown(self):
+        del router.routers
+        Plan.objects.all().delete()
+        Customer.objects.all().delete()
+
+    def test_routes_models(self):
+        self.assertEqual("default", Customer.objects.all().db)
+        self.assertEqual("direct", Plan.objects.all().db)
+        plan = Plan(name="basic")
+        plan.save()
+        customer = Customer(name="Alice Developer")
+        customer.save()
+        self.assertEqual(("direct", "default"), (plan._state.db, customer._state.db))
+        self.assertEqual(["basic"], [p.name for p in Plan.objects.all()])
+        self.assertEqual(
+            ["Alice Developer"],
+            [c.name for c in Customer.objects.filter(name__eq="Alice Developer")],
+        )
+
+    def test_eql_atomic(self):
+        with self.assertRaises(RuntimeError):
+            with eql_atomic():
+                self.assertEqual("default", Plan.objects.all().db)
+                Plan(name="basic").save()
+                Customer(name="Alice Developer").save()
+                raise RuntimeError("rolled back")
+        self.assertEqual("direct", Plan.objects.all().db)
+        self.assertEqual((0, 0), (Plan.objects.count(), Customer.objects.count()))
+
+    def test_atomic_only_covers_its_alias(self):
+        # writes routed to the other alias aren't part of the transaction
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic(using="default"):
+                Plan(name="basic").save()
+                Customer(name="Alice Developer").save()
+                raise RuntimeError("rolled back")
+        self.assertEqual((1, 0), (Plan.objects.count(), Customer.objects.count()))
+
+
+class TestCachedQuerySet(unittest.TestCase):
+    def setUp(self):
+        Customer.objects.all().delete()
+        create_customer_records()
+        self.cache = EqlResultCache()
+        self.disconnect = invalidate_on_signals(self.cache)
+
+    def tearDown(self):
+        self.disconnect()
+
+    def test_cached(self):
+        queryset = Customer.objects.filter(name__eq="Alice Developer")
+        [alice] = queryset.cached(self.cache)
+        self.assertEqual(31, alice.age)
+        self.assertEqual([alice], queryset.cached(self.cache))
+        self.assertEqual(
+            [31],
+            Customer.objects.filter(name__eq="Alice Developer")
+            .values_list("age", flat=True)
+            .cached(self.cache),
+        )
+        self.assertEqual(
+            [], Customer.objects.filter(name__eq="Nobody").cached(self.cache)
+        )
+        self.assertEqual((1, 3, 3), self.cache.info()[:3])
+
+    def test_invalidated_by_signals(self):
+        queryset = Customer.objects.filter(age__gt=30).values_list("name", flat=True)
+        self.assertEqual(["Alice Developer"], queryset.cached(self.cache))
+        bob = Customer.objects.get(name__eq="Bob Customer")
+        bob.age = 40
+        bob.save()
+        self.assertEqual(
+            ["Alice Developer", "Bob Customer"],
+            sorted(queryset.cached(self.cache)),
+        )
+        bob.delete()
+        self.assertEqual(["Alice Developer"], queryset.cached(self.cache))
+
+    def test_uncommitted_writes_not_cached(self):
+        queryset = Customer.objects.filter(age__gt=30).values_list("name", flat=True)
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                bob = Customer.objects.get(name__eq="Bob Customer")
+                bob.age = 40
+                bob.save()
+                self.assertEqual(2, len(queryset.cached(self.cache)))
+                self.assertEqual(0, self.cache.info().size)
+                1 / 0
+        self.assertEqual(["Alice Developer"], queryset.cached(self.cache))
+
+    def test_invalidated_on_commit(self):
+        with transaction.atomic():
+            bob = Customer.objects.get(name__eq="Bob Customer")
+            bob.age = 40
+            bob.save()
+            # read by another connection before the commit
+            self.cache.get_or_load("stale", ["customers"], lambda: ["stale"])
+            self.assertEqual(1, self.cache.info().size)
+        self.assertEqual(0, self.cache.info().size)
+
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        Customer.objects.all().delete()
+        create_customer_records()
+        Customer(age=30, name="Dave Customer", visit_count=3).save()
+
+    def pages(self, queryset, field_name, size, descending=False):
+        pages, token = [], None
+        while True:
+            page = queryset.keyset_page(
+                field_name, after=token, size=size, descending=descending
+            )
+            pages.append([c.name for c in page.items])
+            token = page.next_token
+            if token is None:
+                return pages
+
+    def test_pages(self):
+        self.assertEqual(
+            [
+                ["Bob Customer", "Carol Customer"],
+                ["Dave Customer", "Alice Developer"],
+            ],
+            self.pages(Customer.objects.all(), "age", 2),
+        )
+
+    def test_pages_descending(self):
+        self.assertEqual(
+            [["Alice Developer", "Dave Customer", "Carol Customer"], ["Bob Customer"]],
+            self.pages(Customer.objects.all(), "age", 3, descending=True),
+        )
+
+    def test_pages_with_filter(self):
+        self.assertEqual(
+            [["Bob Customer"], ["Carol Customer"], ["Dave Customer"]],
+            self.pages(Customer.objects.filter(name__match="customer"), "age", 1),
+        )
+
+    def test_pages_of_values(self):
+        queryset = Customer.objects.filter(name__match="customer")
+        page = queryset.values("name").keyset_page("age", size=2)
+        self.assertEqual(
+            [{"name": "Bob Customer"}, {"name": "Carol Customer"}], page.items
+        )
+        page = queryset.values_list("name", flat=True).keyset_page(
+            "age", after=page.next_token, size=2
+        )
+        self.assertEqual(["Dave Customer"], page.items)
+        page = queryset.values_list("name", "age", named=True).keyset_page(
+            "age", size=1
+        )
+        self.assertEqual([("Bob Customer", 29)], page.items)
+        self.assertEqual(29, page.items[0].age)
+
+    def test_last_row_deleted(self):
+        page = Customer.objects.keyset_page("age", size=2)
+        page.items[-1].delete()
+        page = Customer.objects.keyset_page("age", after=page.next_token, size=2)
+        self.assertEqual(
+            ["Dave Customer", "Alice Developer"], [c.name for c in page.items]
+        )
+
+    def test_last_row_updated(self):
+        page = Customer.objects.keyset_page("age", size=2)
+        carol = page.items[-1]
+        carol.age = 10
+        carol.save()
+        page = Customer.objects.keyset_page("age", after=page.next_token, size=2)
+        self.assertEqual(
+            ["Dave Customer", "Alice Developer"], [c.name for c in page.items]
+        )
+        self.assertFalse(hasattr(page.items[0], "eql_keyset_term"))
+
+    def test_invalid_token(self):
+        with self.assertRaises(ValueError):
+            Customer.objects.keyset_page("age", after="nonsense")
+
+
+class TestEqlInstrumentation(unittest.TestCase):
+    def setUp(self):
+        Customer.objects.all().delete()
+        self.customer1, self.customer2, self.customer3 = create_customer_records()
+
+    def test_middleware_records_request(self):
+        summaries = []
+
+        def view(request):
+            Customer.objects.get(name__eq="Alice Developer")
+            list(Customer.objects.filter(weight__lt=60.0, name__match="caro"))
+            return "response"
+
+        middleware = EqlInstrumentationMiddleware(view)
+        middleware.sink = summaries.append
+        request = type("Request", (), {})()
+        self.assertEqual("response", middleware(request))
+
+        summary = summaries[0]
+        self.assertEqual(summary, request.eql_stats.summary())
+        self.assertEqual({"unique": 1, "ore": 1, "match": 1}, summary["lookups"])
+        self.assertEqual(1, summary["encodes"]["EncryptedFloat"]["count"])
+        self.assertEqual(2, summary["decodes"]["EncryptedText"]["count"])
+        self.assertGreater(summary["bytes_sent"], 0)
+        self.assertGreater(summary["bytes_received"], 0)
+
+    def test_context_manager(self):
+        with eql_instrumentation() as stats:
+            Customer.objects.get(extra_info__contains={"key": []})
+        self.assertEqual({"ste_vec": 1}, stats.summary()["lookups"])
+        self.assertEqual(1, stats.decodes["EncryptedJsonb"])
+
+
+class TestAsyncCustomerDjangoModel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Customer.objects.all().adelete()
+        self.customer1, self.customer2, self.customer3 = await sync_to_async(
+            create_customer_records
+        )()
+
+    async def test_aget(self):
+        found = await Customer.objects.aget(id=self.customer1.id)
+        self.assertEqual(found.name, "Alice Developer")
+        self.assertEqual(found.extra_info, {"key": ["value"], "num": 1, "cat": "a"})
+
+    async def test_aget_with_lookup(self):
+        found = await Customer.objects.aget(name__match="caro")
+        self.assertEqual(found.name, "Carol Customer")
+
+    async def test_akeyset_page(self):
+        page = await Customer.objects.akeyset_page("start_date", size=2)
+        self.assertEqual(
+            ["Alice Developer", "Bob Customer"], [c.name for c in page.items]
+        )
+        page = await Customer.objects.akeyset_page(
+            "start_date", after=page.next_token, size=2
+        )
+        self.assertEqual(["Carol Customer"], [c.name for c in page.items])
+        self.assertIsNone(page.next_token)
+
+    async def test_aextract(self):
+        found = await Customer.objects.filter(age__eq=30).aextract(
+            "extra_info", ["$.num"]
+        )
+        self.assertEqual([{"$.num": 3}], found)
+
+    async def test_agroup_by_encrypted(self):
+        found = await Customer.objects.agroup_by_encrypted("extra_info", "$.cat")
+        self.assertEqual(
+            [{"count": 1, "$.cat": "a"}, {"count": 2, "$.cat": "b"}], found
+        )
+
+    async def test_afirst(self):
+        found = await Customer.objects.filter(weight__gt=80.0).afirst()
+        self.assertEqual(found.weight, 82.1)
+
+    async def test_acount(self):
+        self.assertEqual(2, await Customer.objects.filter(age__lt=31).acount())
+
+    async def test_aiterator(self):
+        found = [
+            c.start_date
+            async for c in Customer.objects.order_by("id").aiterator(chunk_size=2)
+        ]
+        self.assertEqual([date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)], found)
+
+    async def test_astream(self):
+        found = [c.age async for c in Customer.objects.order_by("id").astream(2)]
+        self.assertEqual([31, 29, 30], found)
+
+    async def test_adecoded_jsonb_field_extraction(self):
+        term = EqlJsonb("$.num", "customers", "extra_info").to_db_format("ejson_path")
+        results = Customer.objects.annotate(
+            extracted_value=CsSteVecValueV1(F("extra_info"), Value(term))
+        ).values_list("extracted_value", flat=True)
+
+        extracted = [
+            v
+            async for v in adecoded(
+                results.aiterator(chunk_size=2), EncryptedJsonb(), chunk_size=2
+            )
+        ]
+        self.assertEqual(sorted(extracted), [1, 2, 3])
+
+    def test_concurrent_requests_benchmark(self):
+        # Not async: bench_async() runs the sync path, then its own event loop
+        requests = int(os.getenv("EQLPY_BENCH_REQUESTS", "50"))
+        names = ["Alice Developer", "Bob Customer", "Carol Customer"]
+
+        def lookup(name):
+            return Customer.objects.get(name__eq=name).age
+
+        async def alookup(name):
+            return (await Customer.objects.aget(name__eq=name)).age
+
+        report = bench_async(
+            lookup, alookup, [(names[n % len(names)],) for n in range(requests)]
+        )
+        self.assertEqual(requests, report["requests"])
+        self.assertTrue(report["results_match"])
+        self.assertGreater(report["sync"]["throughput"], 0)
+        self.assertGreater(report["async"]["throughput"], 0)
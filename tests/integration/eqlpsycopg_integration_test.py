@@ -0,0 +1,173 @@
+import unittest
+import os
+from datetime import date
+from eqlpy.eql_types import EqlBool, EqlDate, EqlFloat, EqlInt, EqlJsonb, EqlText
+from eqlpy.eqlpsycopg import EqlBatch, _pipeline_supported, extract, search
+from eqlpy import query
+
+# Runs with psycopg 3 when it is installed (queries in an EqlBatch are then
+# pipelined), and with psycopg2 otherwise
+try:
+    import psycopg
+except ImportError:
+    import psycopg2
+
+    psycopg = None
+
+
+class TestEqlBatch(unittest.TestCase):
+    pg_password = os.getenv("PGPASSWORD", "postgres")
+    pg_user = os.getenv("PGUSER", "postgres")
+    pg_host = os.getenv("PGHOST", "localhost")
+    pg_port = os.getenv("PGPORT", "6432")
+    pg_db = os.getenv("PGDATABASE", "eqlpy_test")
+
+    @classmethod
+    def insert_customer(cls, cur, age, name, extra_info):
+        cur.execute(
+            "INSERT INTO customers (age, is_citizen, start_date, weight, name, extra_info)"
+            " VALUES (%s, %s, %s, %s, %s, %s)",
+            (
+                EqlInt(age, "customers", "age").to_db_format(),
+                EqlBool(True, "customers", "is_citizen").to_db_format(),
+                EqlDate(date(2024, 1, 1), "customers", "start_date").to_db_format(),
+                EqlFloat(60.0, "customers", "weight").to_db_format(),
+                EqlText(name, "customers", "name").to_db_format(),
+                EqlJsonb(extra_info, "customers", "extra_info").to_db_format(),
+            ),
+        )
+
+    @classmethod
+    def setUpClass(cls):
+        dsn = f"postgresql://{cls.pg_user}:{cls.pg_password}@{cls.pg_host}:{cls.pg_port}/{cls.pg_db}"
+        cls.conn = (psycopg or psycopg2).connect(dsn)
+        cls.conn.autocommit = True
+        with cls.conn.cursor() as cur:
+            cur.execute("DELETE FROM customers")
+            cur.execute("SELECT cs_refresh_encrypt_config()")
+            cls.insert_customer(cur, 31, "Alice Developer", {"cat": "a"})
+            cls.insert_customer(cur, 29, "Bob Customer", {"cat": "b"})
+            cls.insert_customer(cur, 30, "Carol Customer", {"cat": "b"})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+
+    def test_results_in_order(self):
+        batch = EqlBatch(self.conn)
+        names = ["Carol Customer", "Alice Developer", "Nobody", "Bob Customer"]
+        for name in names:
+            batch.unique(
+                EqlText(name, "customers", "name"),
+                columns="name, age",
+                decoders={"age": "int"},
+            )
+        results = batch.execute()
+        self.assertEqual(
+            [
+                [{"name": "Carol Customer", "age": 30}],
+                [{"name": "Alice Developer", "age": 31}],
+                [],
+                [{"name": "Bob Customer", "age": 29}],
+            ],
+            results,
+        )
+
+    def test_extract(self):
+        with self.conn.cursor() as cur:
+            found = extract(
+                cur,
+                "customers",
+                "extra_info",
+                ["$.cat", "$.missing"],
+                columns=["age"],
+                where="cs_ore_64_8_v1(age) > cs_ore_64_8_v1(%s)",
+                params=[EqlInt(29, "customers", "age").to_db_format("ore")],
+            )
+        self.assertEqual(
+            [
+                {"age": 30, "$.cat": "b", "$.missing": None},
+                {"age": 31, "$.cat": "a", "$.missing": None},
+            ],
+            sorted(
+                [dict(row, age=EqlInt.from_parsed_json(row["age"])) for row in found],
+                key=lambda row: row["age"],
+            ),
+        )
+
+    def test_query_builder(self):
+        name = query.column("customers", "name", "text")
+        age = query.column("customers", "age", "int")
+        batch = EqlBatch(self.conn)
+        for low in (29, 30):
+            q = query.select(
+                "customers",
+                query.and_(query.match(name, "customer"), query.gte(age, low)),
+                columns=[name, age],
+                order_by=query.desc(age),
+                limit=5,
+            )
+            batch.add(*q.render(), decoders=q.decoders)
+        self.assertEqual(
+            [
+                [
+                    {"name": "Carol Customer", "age": 30},
+                    {"name": "Bob Customer", "age": 29},
+                ],
+                [{"name": "Carol Customer", "age": 30}],
+            ],
+            batch.execute(),
+        )
+
+    @unittest.skipIf(psycopg is None, "psycopg 3 is not installed")
+    def test_pipelined(self):
+        self.assertTrue(_pipeline_supported(self.conn))
+        self.test_results_in_order()
+
+    @unittest.skipIf(psycopg is None, "psycopg 3 is not installed")
+    def test_query_builder_prepared(self):
+        age = query.column("customers", "age", "int")
+        with self.conn.cursor() as cur:
+            for value in (29, 30, 31):
+                sql, params = query.select(
+                    "customers", query.eq(age, value), columns=["count(*)"]
+                ).render()
+                cur.execute(sql, params, prepare=True)
+                self.assertEqual((1,), cur.fetchone())
+
+    def test_search(self):
+        found = search(
+            self.conn,
+            "customers",
+            ["name"],
+            ["customer", "carol", "nobody"],
+            select="name",
+            rank=True,
+        )
+        self.assertEqual(
+            [
+                {"name": "Carol Customer", "eql_rank": 2},
+                {"name": "Bob Customer", "eql_rank": 1},
+            ],
+            found,
+        )
+
+    def test_mixed_queries(self):
+        batch = EqlBatch(self.conn)
+        match = batch.match(EqlText("customer", "customers", "name"), columns="name")
+        contains = batch.contains(
+            EqlJsonb({"cat": "a"}, "customers", "extra_info"),
+            columns="name, extra_info",
+            decoders={"name": "text"},
+        )
+        count = batch.add("SELECT count(*) AS n FROM customers")
+        results = batch.execute()
+        self.assertEqual(
+            ["Bob Customer", "Carol Customer"],
+            sorted(row["name"] for row in results[match]),
+        )
+        self.assertEqual(
+            [{"name": "Alice Developer", "extra_info": {"cat": "a"}}],
+            results[contains],
+        )
+        self.assertEqual([{"n": 3}], results[count])